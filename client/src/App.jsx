@@ -537,8 +537,8 @@ const Sidebar = ({ user, activeChat, setActiveChat, onOpenSettings, onOpenAdminP
         setContacts(lastMsg.users);
         setContactsLoading(false);
       } else if (lastMsg.type === 'search_result') {
-        // Single result for now
-        setSearchResults([lastMsg.user]);
+        // Ranked matches, best first
+        setSearchResults(lastMsg.users || [lastMsg.user]);
       } else if (lastMsg.type === 'error' && isSearching) {
         setSearchResults([]);
       }
@@ -927,8 +927,10 @@ const ChatArea = ({ activeChat, user, onOpenProfile, onOpenUserIdProfile, onStar
   const processedMsgsRef = useRef(new Set());
   const { sendMessage, messages, status } = useSocket();
   const [history, setHistory] = useState([]);
+  const [historyCursor, setHistoryCursor] = useState(null); // { has_more, before_id } for loading older pages
   const [input, setInput] = useState('');
   const scrollRef = React.useRef(null);
+  const keepScrollRef = useRef(null); // scrollHeight before prepending an older page
   const [viewingMedia, setViewingMedia] = useState(null); // Local to ChatArea for shared media
 
   const [isRecording, setIsRecording] = useState(false);
@@ -1035,9 +1037,21 @@ const ChatArea = ({ activeChat, user, onOpenProfile, onOpenUserIdProfile, onStar
         sendMessage({ method: 'messages.get_history', args: { peer_id: activeChat.peer.id } });
       }
       setHistory([]); // Reset while loading
+      setHistoryCursor(null);
     }
   }, [activeChat?.id, activeChat?.type, status]);
 
+  const loadOlderHistory = () => {
+    if (!historyCursor?.has_more || historyCursor.loading) return;
+    const target = activeChat.type === 'channel' ? { channel_id: activeChat.channel_id } : { peer_id: activeChat.peer.id };
+    setHistoryCursor({ ...historyCursor, loading: true });
+    sendMessage({ method: 'messages.get_history', args: { ...target, before_id: historyCursor.before_id } });
+  };
+
+  const handleHistoryScroll = (e) => {
+    if (e.currentTarget.scrollTop < 80) loadOlderHistory();
+  };
+
   useEffect(() => {
     const lastMsg = messages[messages.length - 1];
     if (lastMsg && !processedMsgsRef.current.has(lastMsg)) {
@@ -1049,8 +1063,14 @@ const ChatArea = ({ activeChat, user, onOpenProfile, onOpenUserIdProfile, onStar
         ))
       );
 
-      if (isCurrentChatHistory) {
+      if (isCurrentChatHistory && lastMsg.before_id) {
+        // Older page: prepend and keep the viewport where it was
+        keepScrollRef.current = scrollRef.current?.scrollHeight || null;
+        setHistory(prev => [...lastMsg.messages, ...prev]);
+        setHistoryCursor({ has_more: lastMsg.has_more, before_id: lastMsg.next_before_id });
+      } else if (isCurrentChatHistory) {
         setHistory(lastMsg.messages);
+        setHistoryCursor({ has_more: lastMsg.has_more, before_id: lastMsg.next_before_id });
         if (lastMsg.messages.length > 0) {
           const lastId = lastMsg.messages[lastMsg.messages.length - 1].id;
           if (activeChat.type === 'channel') {
@@ -1083,7 +1103,12 @@ const ChatArea = ({ activeChat, user, onOpenProfile, onOpenUserIdProfile, onStar
 
   useEffect(() => {
     if (scrollRef.current) {
-      scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
+      if (keepScrollRef.current !== null) {
+        scrollRef.current.scrollTop = scrollRef.current.scrollHeight - keepScrollRef.current;
+        keepScrollRef.current = null;
+      } else {
+        scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
+      }
     }
   }, [history]);
 
@@ -1359,7 +1384,7 @@ const ChatArea = ({ activeChat, user, onOpenProfile, onOpenUserIdProfile, onStar
         )}
 
         {/* Messages */}
-        <div className="flex-1 overflow-y-auto p-6 space-y-4" ref={scrollRef}>
+        <div className="flex-1 overflow-y-auto p-6 space-y-4" ref={scrollRef} onScroll={handleHistoryScroll}>
           {history.map((msg) => {
             const isMe = msg.sender_id === user.id;
             const isGroup = !!activeChat.group_id;
@@ -1681,7 +1706,7 @@ const MainLayout = ({ user, onStartCall, groupCallActive, activeGroupCall, group
     // If activeChat exists but is incomplete, don't save (let it be fixed by self-healing)
   }, [activeChat, user.id]);
 
-  const { sendMessage, messages, dialogs, contacts, status } = useSocket();
+  const { sendMessage, messages, dialogs, contacts, status, resumed } = useSocket();
 
   // Derive current peer data from dialogs/contacts to support self-healing
   const currentPeer = React.useMemo(() => {
@@ -2493,16 +2518,16 @@ const AppContent = () => {
     }
   };
 
-  // 1. Resume Session on Connect
+  // 1. Resume Session on Connect (a resumed socket is already logged in)
   useEffect(() => {
-    if (status === 'connected') {
+    if (status === 'connected' && !resumed) {
       const token = localStorage.getItem('samor_token');
       if (token) {
         setIsResuming(true);
         sendMessage({ method: 'auth.login_token', args: { token } });
       }
     }
-  }, [status]);
+  }, [status, resumed]);
 
   // Main Message Loop
   useEffect(() => {
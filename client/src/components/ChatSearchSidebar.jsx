@@ -8,6 +8,8 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
     const [query, setQuery] = useState('');
     const [activeTab, setActiveTab] = useState('all'); // all, photo, video, voice, file, link
     const [results, setResults] = useState([]);
+    const [globalGroups, setGlobalGroups] = useState([]); // Global mode: results grouped by chat
+    const [isGlobal, setIsGlobal] = useState(false);
     const [loading, setLoading] = useState(false);
 
     // Debounce search
@@ -16,7 +18,7 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
             handleSearch();
         }, 500);
         return () => clearTimeout(timer);
-    }, [query, activeTab, activeChat]);
+    }, [query, activeTab, activeChat, isGlobal]);
 
     const handleSearch = () => {
         setLoading(true);
@@ -25,7 +27,10 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
             filter_type: activeTab === 'all' ? null : activeTab
         };
 
-        if (activeChat.type === 'channel' || activeChat.group_id) {
+        if (isGlobal) {
+            // One request across every chat; the server groups hits by chat
+            args.scope = 'global';
+        } else if (activeChat.type === 'channel' || activeChat.group_id) {
             args.channel_id = activeChat.channel_id || activeChat.id;
         } else {
             args.peer_id = activeChat.peer?.id || activeChat.id;
@@ -42,6 +47,9 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
             // (Simpler: just set results)
             setResults(lastMsg.messages);
             setLoading(false);
+        } else if (lastMsg && lastMsg.type === 'messages.search_global_result') {
+            setGlobalGroups(lastMsg.groups);
+            setLoading(false);
         }
     }, [messages]);
 
@@ -54,7 +62,23 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
         { id: 'link', icon: <LinkIcon size={16} />, label: 'Ссылки' },
     ];
 
-    const renderResult = (msg) => {
+    const isActiveChat = (group) => (
+        group.channel_id
+            ? group.channel_id === (activeChat.channel_id || activeChat.id)
+            : group.peer_id === (activeChat.peer?.id || activeChat.id)
+    );
+
+    const renderGroup = (group) => (
+        <div key={group.channel_id ? `c${group.channel_id}` : `p${group.peer_id}`} className="pb-2">
+            <div className="px-3 pt-2 pb-1 text-xs font-bold text-white/40 uppercase truncate">
+                {group.channel_id ? `${group.group_name || ''} / ${group.channel_name || ''}` : group.peer?.display_name}
+            </div>
+            {/* Jumping only works inside the open chat */}
+            {group.messages.map(msg => renderResult(msg, isActiveChat(group)))}
+        </div>
+    );
+
+    const renderResult = (msg, canJump = true) => {
         const date = new Date(msg.created_at * 1000).toLocaleDateString([], {
             day: 'numeric', month: 'short', year: 'numeric'
         });
@@ -62,7 +86,7 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
         return (
             <div
                 key={msg.id}
-                onClick={() => onJumpToMessage(msg.id)}
+                onClick={() => canJump && onJumpToMessage(msg.id)}
                 className="p-3 hover:bg-white/5 rounded-xl cursor-pointer transition-colors group flex gap-3 items-start"
             >
                 <div className="w-10 h-10 rounded-full bg-white/10 shrink-0 flex items-center justify-center overflow-hidden">
@@ -115,6 +139,15 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
                     <X size={20} />
                 </button>
                 <h3 className="font-bold text-white text-lg">Поиск</h3>
+                <button
+                    onClick={() => setIsGlobal(!isGlobal)}
+                    className={`ml-auto px-3 py-1 rounded-lg text-xs font-medium border transition-colors ${isGlobal
+                        ? 'bg-blue-500/20 text-blue-400 border-blue-500/20'
+                        : 'bg-white/5 text-white/60 border-transparent hover:bg-white/10 hover:text-white'
+                        }`}
+                >
+                    Во всех чатах
+                </button>
             </div>
 
             {/* Search Input */}
@@ -155,8 +188,10 @@ const ChatSearchSidebar = ({ activeChat, onClose, onJumpToMessage }) => {
                     <div className="flex justify-center p-8">
                         <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-white/20"></div>
                     </div>
-                ) : results.length > 0 ? (
-                    results.map(renderResult)
+                ) : isGlobal && globalGroups.length > 0 ? (
+                    globalGroups.map(renderGroup)
+                ) : !isGlobal && results.length > 0 ? (
+                    results.map(msg => renderResult(msg))
                 ) : (
                     <div className="text-center py-12 text-white/20 text-sm">
                         Ничего не найдено
@@ -6,10 +6,24 @@ import { MTProtoCrypto } from '../crypto/mtproto';
 
 const SocketContext = createContext();
 
+// 1: hex envelopes inside JSON text frames, 2: raw binary frames
+const PROTOCOL_VERSION = 2;
+const RECONNECT_DELAY_MS = 2000;
+
+// Reads that may run concurrently and be answered in any order. Everything else (sends, reads
+// receipts, deletes, calls...) goes untagged, so the server handles it in the order it was sent.
+const PIPELINED_METHODS = new Set([
+    'dialogs.get', 'messages.get_history', 'messages.search',
+    'user.get_info', 'user.list', 'user.search',
+    'groups.list', 'groups.members.list',
+    'admin.users_get', 'admin.messages_get', 'admin.groups_get', 'admin.banned_users_get', 'admin.metrics_get'
+]);
+
 export const useSocket = () => useContext(SocketContext);
 
 export const SocketProvider = ({ children }) => {
     const [status, setStatus] = useState('disconnected'); // disconnected, handshaking, connected
+    const [resumed, setResumed] = useState(false); // Last connect reattached the previous session
     const [messages, setMessages] = useState([]);
     const [dialogs, setDialogs] = useState([]);
     const [contacts, setContacts] = useState([]);
@@ -17,137 +31,190 @@ export const SocketProvider = ({ children }) => {
     const dhRef = useRef(new DiffieHellman());
     const authKeyRef = useRef(null);
     const sessionIdRef = useRef(null);
+    const binaryRef = useRef(false); // Negotiated protocol v2: raw binary frames
+    const reqIdRef = useRef(0);
+    const pendingRef = useRef(new Map()); // req_id -> { resolve, reject }
 
     useEffect(() => {
-        // Connect to WebSocket
-        // Connect to WebSocket
-        const wsUrl = WS_URL;
-
-        console.log('Connecting to WebSocket at:', wsUrl);
-        const ws = new WebSocket(wsUrl);
-
-        ws.onopen = () => {
-            console.log('WS Connected');
-            setStatus('handshaking');
-
-            // 1. Send Client Hello
-            const clientPubKey = dhRef.current.getPublicKey();
-            ws.send(JSON.stringify({
-                type: 'client_hello',
-                payload: {
-                    public_key: clientPubKey
+        let stopped = false;
+        let retryTimer = null;
+
+        // (Re)connects; after a drop we try to resume the previous session instead of a new DH handshake
+        const connect = () => {
+            const wsUrl = WS_URL;
+
+            console.log('Connecting to WebSocket at:', wsUrl);
+            const ws = new WebSocket(wsUrl);
+            ws.binaryType = 'arraybuffer';
+
+            ws.onopen = () => {
+                console.log('WS Connected');
+                setStatus('handshaking');
+
+                // 1. Send Client Hello
+                const clientPubKey = dhRef.current.getPublicKey();
+                const hello = {
+                    public_key: clientPubKey,
+                    protocol: PROTOCOL_VERSION,
+                    pipeline: true // Server may answer tagged requests out of order
+                };
+                if (sessionIdRef.current && authKeyRef.current) {
+                    // Prove we still hold the previous auth key; falls back to DH if the server says no
+                    const nonce = Array.from(crypto.getRandomValues(new Uint8Array(16))).map(b => b.toString(16).padStart(2, '0')).join('');
+                    const ts = Math.floor(Date.now() / 1000);
+                    hello.resume = {
+                        session_id: sessionIdRef.current,
+                        nonce,
+                        ts,
+                        proof: MTProtoCrypto.resumeProof(authKeyRef.current, sessionIdRef.current, nonce, ts)
+                    };
                 }
-            }));
-        };
+                ws.send(JSON.stringify({ type: 'client_hello', payload: hello }));
+            };
 
-        ws.onmessage = async (event) => {
-            try {
-                const data = JSON.parse(event.data);
-
-                if (data.type === 'server_hello') {
-                    // 2. Receive Server Hello
-                    const serverPubKey = data.payload.public_key;
-                    sessionIdRef.current = data.payload.session_id;
-
-                    // Compute Auth Key
-                    const authKey = dhRef.current.computeSharedSecret(serverPubKey);
-                    authKeyRef.current = authKey;
-
-                    console.log('Handshake Complete. AuthKey derived.');
-                    setStatus('connected');
-
-                } else if (data.data) {
-                    // Encrypted Message
-                    if (!authKeyRef.current) return;
-
-                    try {
-                        const encryptedBytes = new Uint8Array(data.data.match(/.{1,2}/g).map(byte => parseInt(byte, 16)));
-                        const decrypted = MTProtoCrypto.decrypt(authKeyRef.current, encryptedBytes);
-
-                        // Decode UTF8
-                        const decoder = new TextDecoder();
-                        const jsonStr = decoder.decode(decrypted);
-                        const message = JSON.parse(jsonStr);
-
-                        console.log('Decrypted Message:', message);
-
-                        // Handle dialogs.list and user.list_result in context
-                        if (message.type === 'dialogs.list') {
-                            // Filter out dialogs with invalid peer data
-                            const validDialogs = (message.dialogs || []).filter(d => {
-                                if (!d.peer || !d.peer.display_name) {
-                                    console.warn('DEBUG: Filtering out invalid dialog', d);
-                                    return false;
-                                }
-                                return true;
-                            });
-                            setDialogs(validDialogs);
-                        } else if (message.type === 'user.list_result') {
-                            // Filter out users without display_name
-                            const validUsers = (message.users || []).filter(u => {
-                                if (!u.display_name) {
-                                    console.warn('DEBUG: Filtering out invalid user', u);
-                                    return false;
-                                }
-                                return true;
-                            });
-                            setContacts(validUsers);
-                        }
+            // Decrypts one envelope (msg_key + ciphertext) and dispatches the message
+            const handleEnvelope = (encryptedBytes) => {
+                if (!authKeyRef.current) return;
+
+                try {
+                    const decrypted = MTProtoCrypto.decrypt(authKeyRef.current, encryptedBytes);
+
+                    // Decode UTF8
+                    const decoder = new TextDecoder();
+                    const jsonStr = decoder.decode(decrypted);
+                    const message = JSON.parse(jsonStr);
 
-                        if (message.type === 'auth_success') {
-                            // We let the component handle the state update via messages or callback
-                            // We push it to messages so App/Login can see it
-                        } else if (message.type === 'user.status') {
-                            // Update dialogs with new status
-                            setDialogs(prevDialogs => prevDialogs.map(d => {
-                                if (d.peer && (d.peer.id == message.user_id)) {
-                                    return {
-                                        ...d,
-                                        peer: {
-                                            ...d.peer,
-                                            is_online: message.status === 'online',
-                                            last_seen: message.last_seen !== undefined ? message.last_seen : d.peer.last_seen,
-                                            // Only update full object if it contains display_name (prevent "Unknown")
-                                            ...((message.user && message.user.display_name) ? message.user : {})
-                                        }
-                                    };
-                                }
-                                return d;
-                            }));
-
-                            // Update contacts with new status
-                            setContacts(prevContacts => prevContacts.map(c => {
-                                if (c.id == message.user_id) {
-                                    return {
-                                        ...c,
+                    console.log('Decrypted Message:', message);
+
+                    // Resolve the matching request() promise (responses arrive in completion order)
+                    if (message.req_id !== undefined && pendingRef.current.has(message.req_id)) {
+                        const { resolve } = pendingRef.current.get(message.req_id);
+                        pendingRef.current.delete(message.req_id);
+                        resolve(message);
+                    }
+
+                    // Handle dialogs.list and user.list_result in context
+                    if (message.type === 'dialogs.list') {
+                        // Filter out dialogs with invalid peer data
+                        const validDialogs = (message.dialogs || []).filter(d => {
+                            if (!d.peer || !d.peer.display_name) {
+                                console.warn('DEBUG: Filtering out invalid dialog', d);
+                                return false;
+                            }
+                            return true;
+                        });
+                        setDialogs(validDialogs);
+                    } else if (message.type === 'user.list_result') {
+                        // Filter out users without display_name
+                        const validUsers = (message.users || []).filter(u => {
+                            if (!u.display_name) {
+                                console.warn('DEBUG: Filtering out invalid user', u);
+                                return false;
+                            }
+                            return true;
+                        });
+                        setContacts(validUsers);
+                    }
+
+                    if (message.type === 'auth_success') {
+                        // We let the component handle the state update via messages or callback
+                        // We push it to messages so App/Login can see it
+                    } else if (message.type === 'user.status') {
+                        // Update dialogs with new status
+                        setDialogs(prevDialogs => prevDialogs.map(d => {
+                            if (d.peer && (d.peer.id == message.user_id)) {
+                                return {
+                                    ...d,
+                                    peer: {
+                                        ...d.peer,
                                         is_online: message.status === 'online',
-                                        last_seen: message.last_seen !== undefined ? message.last_seen : c.last_seen,
+                                        last_seen: message.last_seen !== undefined ? message.last_seen : d.peer.last_seen,
+                                        // Only update full object if it contains display_name (prevent "Unknown")
                                         ...((message.user && message.user.display_name) ? message.user : {})
-                                    };
-                                }
-                                return c;
-                            }));
+                                    }
+                                };
+                            }
+                            return d;
+                        }));
+
+                        // Update contacts with new status
+                        setContacts(prevContacts => prevContacts.map(c => {
+                            if (c.id == message.user_id) {
+                                return {
+                                    ...c,
+                                    is_online: message.status === 'online',
+                                    last_seen: message.last_seen !== undefined ? message.last_seen : c.last_seen,
+                                    ...((message.user && message.user.display_name) ? message.user : {})
+                                };
+                            }
+                            return c;
+                        }));
+                    }
+
+                    setMessages(prev => [...prev, message]);
+                } catch (err) {
+                    console.error('Decryption/Processing failed', err);
+                }
+            };
+
+            ws.onmessage = async (event) => {
+                try {
+                    // Protocol v2: binary frames carry the raw envelope
+                    if (event.data instanceof ArrayBuffer) {
+                        handleEnvelope(new Uint8Array(event.data));
+                        return;
+                    }
+
+                    const data = JSON.parse(event.data);
+
+                    if (data.type === 'server_hello') {
+                        // 2. Receive Server Hello
+                        sessionIdRef.current = data.payload.session_id;
+                        binaryRef.current = (data.payload.protocol || 1) >= 2;
+
+                        if (data.payload.resumed) {
+                            // Same auth key, server already has us logged in
+                            console.log('Session resumed.');
+                            setResumed(true);
+                        } else {
+                            // Compute Auth Key
+                            const serverPubKey = data.payload.public_key;
+                            authKeyRef.current = dhRef.current.computeSharedSecret(serverPubKey);
+                            console.log('Handshake Complete. AuthKey derived.');
+                            setResumed(false);
                         }
+                        setStatus('connected');
 
-                        setMessages(prev => [...prev, message]);
-                    } catch (err) {
-                        console.error('Decryption/Processing failed', err);
+                    } else if (data.data) {
+                        // Encrypted Message (legacy hex/JSON frame)
+                        handleEnvelope(new Uint8Array(data.data.match(/.{1,2}/g).map(byte => parseInt(byte, 16))));
                     }
+                } catch (err) {
+                    console.error('WebSocket Message Error:', err);
                 }
-            } catch (err) {
-                console.error('WebSocket Message Error:', err);
-            }
-        };
+            };
+
+            ws.onclose = () => {
+                console.log('WS Disconnected');
+                setStatus('disconnected');
+
+                pendingRef.current.forEach(({ reject }) => reject(new Error('WebSocket closed')));
+                pendingRef.current.clear();
 
-        ws.onclose = () => {
-            console.log('WS Disconnected');
-            setStatus('disconnected');
+                if (!stopped) {
+                    retryTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+                }
+            };
+
+            socketRef.current = ws;
         };
 
-        socketRef.current = ws;
+        connect();
 
         return () => {
-            ws.close();
+            stopped = true;
+            clearTimeout(retryTimer);
+            socketRef.current?.close();
         };
     }, []);
 
@@ -155,30 +222,53 @@ export const SocketProvider = ({ children }) => {
         console.log("DEBUG: sendMessage called with:", payload);
         if (status !== 'connected' || !authKeyRef.current) {
             console.warn('Cannot send: Not connected securely. Status:', status);
-            return;
+            return null;
         }
 
         try {
-            const jsonStr = JSON.stringify(payload);
+            // Tag order-independent reads so their responses can be matched; writes stay in order
+            const tagged = PIPELINED_METHODS.has(payload.method);
+            const reqId = tagged ? ++reqIdRef.current : 0;
+            const jsonStr = JSON.stringify(tagged ? { ...payload, req_id: reqId } : payload);
             const encoder = new TextEncoder();
             const bytes = encoder.encode(jsonStr);
 
             // Encrypt
             const encrypted = MTProtoCrypto.encrypt(authKeyRef.current, bytes);
 
-            // Send as hex string in JSON wrapper
-            const hex = Array.from(encrypted).map(b => b.toString(16).padStart(2, '0')).join('');
+            if (binaryRef.current) {
+                socketRef.current.send(encrypted);
+            } else {
+                // Legacy: hex string in JSON wrapper
+                const hex = Array.from(encrypted).map(b => b.toString(16).padStart(2, '0')).join('');
 
-            socketRef.current.send(JSON.stringify({
-                data: hex
-            }));
+                socketRef.current.send(JSON.stringify({
+                    data: hex
+                }));
+            }
+            return reqId;
         } catch (err) {
             console.error('Encryption failed', err);
+            return null;
         }
     };
 
+    // Promise-based variant for PIPELINED_METHODS: resolves with the response carrying the same req_id
+    const request = (payload) => new Promise((resolve, reject) => {
+        if (!PIPELINED_METHODS.has(payload.method)) {
+            reject(new Error(`${payload.method} is not pipelined; use sendMessage`));
+            return;
+        }
+        const reqId = sendMessage(payload);
+        if (reqId === null) {
+            reject(new Error('Not connected'));
+            return;
+        }
+        pendingRef.current.set(reqId, { resolve, reject });
+    });
+
     return (
-        <SocketContext.Provider value={{ status, messages, sendMessage, dialogs, contacts, setDialogs, setContacts }}>
+        <SocketContext.Provider value={{ status, resumed, messages, sendMessage, request, dialogs, contacts, setDialogs, setContacts }}>
             {children}
         </SocketContext.Provider>
     );
@@ -164,4 +164,10 @@ export class MTProtoCrypto {
 
         return wordToByteArray(decryptedWa);
     }
+
+    static resumeProof(authKey, sessionId, nonce, ts) {
+        // HMAC-SHA256(auth_key, "resume:<session_id>:<nonce>:<ts>") as hex, checked by the server on reconnect
+        const message = `resume:${sessionId}:${nonce}:${ts}`;
+        return CryptoJS.HmacSHA256(message, convertUint8ArrayToWordArray(authKey)).toString(CryptoJS.enc.Hex);
+    }
 }
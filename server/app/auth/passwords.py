@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from app.core.config import settings
+from app.core.executors import run_in_process
+from app.core.metrics import metrics
+
+# Stored format: "pbkdf2_sha256$<iterations>$<hex key>".
+# Older rows hold the bare hex key, which was always 100,000 iterations.
+SCHEME = "pbkdf2_sha256"
+LEGACY_ITERATIONS = 100000
+
+def parse_iterations(stored_password: str) -> int:
+    if stored_password.startswith(SCHEME + "$"):
+        return int(stored_password.split("$")[1])
+    return LEGACY_ITERATIONS
+
+def hash_password(password: str, salt: str = None, iterations: int = None):
+    if not salt:
+        salt = os.urandom(16).hex()
+    iterations = iterations or settings.PASSWORD_HASH_ITERATIONS
+    key = hashlib.pbkdf2_hmac(
+        'sha256',
+        password.encode('utf-8'),
+        salt.encode('utf-8'),
+        iterations
+    )
+    return f"{SCHEME}${iterations}${key.hex()}", salt
+
+def verify_password(stored_password, stored_salt, provided_password):
+    iterations = parse_iterations(stored_password)
+    key = hashlib.pbkdf2_hmac('sha256', provided_password.encode('utf-8'), stored_salt.encode('utf-8'), iterations)
+    return hmac.compare_digest(key.hex(), stored_password.rsplit("$", 1)[-1])
+
+def needs_rehash(stored_password) -> bool:
+    return parse_iterations(stored_password) != settings.PASSWORD_HASH_ITERATIONS
+
+class PasswordHasher:
+    """Runs PBKDF2 in the process pool, at most `concurrency` at a time, so login bursts
+    queue here instead of stalling the event loop (and every other session's delivery).
+    """
+
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or settings.PASSWORD_HASH_CONCURRENCY
+        self.semaphore = None
+        self.waiting = 0
+
+    async def _run(self, fn, *args):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        self._queued(1)
+        queued = True
+        try:
+            async with self.semaphore:
+                self._queued(-1)
+                queued = False
+                started = time.perf_counter()
+                result = await run_in_process(fn, *args)
+                metrics.histogram("password_hash_seconds").observe(time.perf_counter() - started)
+                return result
+        finally:
+            if queued: # Cancelled while waiting for a slot
+                self._queued(-1)
+
+    def _queued(self, delta: int):
+        self.waiting += delta
+        metrics.gauge("password_hash_queue").set(self.waiting)
+
+    async def hash(self, password: str):
+        return await self._run(hash_password, password, None, settings.PASSWORD_HASH_ITERATIONS)
+
+    async def verify(self, stored_password, stored_salt, provided_password) -> bool:
+        return await self._run(verify_password, stored_password, stored_salt, provided_password)
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,48 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, payload) -> bytes:
+        if orjson is not None:
+            # Handler payloads may use int dict keys, which stdlib json stringifies too
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(payload).encode('utf-8')
+
+    def decode(self, data: bytes):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data.decode('utf-8'))
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def encode(self, payload) -> bytes:
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode(self, data: bytes):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+JSON = JsonCodec()
+
+# Body codecs this server can speak, keyed by handshake name
+CODECS = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+def negotiate(offered):
+    """Picks the first codec in the client's preference list that we support; JSON otherwise."""
+    for name in offered or []:
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
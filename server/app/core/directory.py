@@ -0,0 +1,158 @@
+import bisect
+import math
+from sqlalchemy.future import select
+from app.db.models import AsyncSessionLocal, User
+
+# Match kinds, best first
+EXACT = 0           # username == query
+USERNAME_PREFIX = 1
+NAME_PREFIX = 2     # a word of the display name starts with the query
+FUZZY = 3           # shares enough trigrams (typos, infix matches)
+
+MIN_SIMILARITY = 0.3
+MAX_PREFIX_SCAN = 1000 # Bounds one- and two-letter queries; the exact match always sorts first
+
+def normalize(text: str) -> str:
+    return (text or "").strip().lstrip("@").casefold()
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+def name_keys(display_name: str) -> set:
+    # The whole display name and each of its words
+    return set(display_name.split()) | ({display_name} if display_name else set())
+
+class UserDirectory:
+    """Memory-resident index of usernames and display names for user.search / user.list.
+
+    A sorted key list answers prefix lookups with bisect; a trigram index answers typo-tolerant
+    ones. Loaded once at startup, then kept current by the handlers that change users.
+    """
+
+    def __init__(self):
+        self.names = {}    # user_id -> (username, display_name), normalized
+        self.ids = []      # sorted user ids, for paging through everyone
+        self.keys = []     # sorted (key, kind, user_id) for prefix lookups
+        self.grams = {}    # trigram -> {user_id}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.names)
+
+    async def load(self):
+        async with AsyncSessionLocal() as db:
+            res = await db.execute(select(User.id, User.username, User.display_name))
+            rows = res.all()
+        self.names = {}
+        self.grams = {}
+        keys = []
+        for user_id, username, display_name in rows:
+            keys.extend(self._index(user_id, username, display_name))
+        keys.sort()
+        self.keys = keys
+        self.ids = sorted(self.names)
+        self.loaded = True
+        print(f"User directory: {len(self.names)} users indexed")
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await self.load()
+
+    def _index(self, user_id: int, username: str, display_name: str):
+        username, display_name = normalize(username), normalize(display_name)
+        self.names[user_id] = (username, display_name)
+        for gram in trigrams(username) | trigrams(display_name):
+            self.grams.setdefault(gram, set()).add(user_id)
+        keys = [(username, USERNAME_PREFIX, user_id)] if username else []
+        keys.extend((key, NAME_PREFIX, user_id) for key in name_keys(display_name))
+        return keys
+
+    def add(self, user):
+        # Insert or refresh one user (registration, profile update)
+        self.remove(user.id)
+        for key in self._index(user.id, user.username, user.display_name):
+            bisect.insort(self.keys, key)
+        bisect.insort(self.ids, user.id)
+
+    def remove(self, user_id: int):
+        names = self.names.pop(user_id, None)
+        if names is None:
+            return
+        username, display_name = names
+        for gram in trigrams(username) | trigrams(display_name):
+            members = self.grams.get(gram)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    del self.grams[gram]
+        stale = [(username, USERNAME_PREFIX, user_id)] + [(key, NAME_PREFIX, user_id) for key in name_keys(display_name)]
+        for key in stale:
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+        i = bisect.bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            del self.ids[i]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0, exclude: int = None):
+        # Returns (ranked user ids for this page, has_more)
+        q = normalize(query)
+        if not q:
+            return [], False
+        wanted = offset + limit + 1
+
+        best = {} # user_id -> (kind, tie-break)
+        i = bisect.bisect_left(self.keys, (q,))
+        end = min(len(self.keys), i + MAX_PREFIX_SCAN)
+        while i < end and self.keys[i][0].startswith(q):
+            key, kind, user_id = self.keys[i]
+            if kind == USERNAME_PREFIX and key == q:
+                kind = EXACT
+            rank = (kind, len(key))
+            if rank < best.get(user_id, (FUZZY + 1,)):
+                best[user_id] = rank
+            i += 1
+
+        if len(best) < wanted:
+            # Not enough prefix hits: fall back to trigram similarity
+            q_grams = trigrams(q)
+            needed = math.ceil(MIN_SIMILARITY * len(q_grams))
+            # Rarest trigrams first: a match must share `needed` of them, so only the first
+            # len - needed + 1 lists can introduce candidates; the common ones just add counts
+            postings = sorted((self.grams.get(gram, ()) for gram in q_grams), key=len)
+            shared = {}
+            for n, members in enumerate(postings):
+                if n <= len(postings) - needed:
+                    for user_id in members:
+                        shared[user_id] = shared.get(user_id, 0) + 1
+                else:
+                    for user_id in shared:
+                        if user_id in members:
+                            shared[user_id] += 1
+            for user_id, count in shared.items():
+                if user_id in best or count < needed:
+                    continue
+                username, display_name = self.names[user_id]
+                score = max(similarity(q_grams, trigrams(username)), similarity(q_grams, trigrams(display_name)))
+                if score >= MIN_SIMILARITY:
+                    best[user_id] = (FUZZY, -score)
+
+        ranked = sorted((rank, user_id) for user_id, rank in best.items() if user_id != exclude)
+        page = [user_id for _, user_id in ranked[offset:offset + limit]]
+        return page, len(ranked) > offset + limit
+
+    def page(self, limit: int = 100, offset: int = 0, exclude: int = None):
+        # Everyone but `exclude`, by id (user.list without a query)
+        ids = self.ids
+        i = bisect.bisect_left(ids, exclude) if exclude is not None else len(ids)
+        if i == len(ids) or ids[i] != exclude:
+            return ids[offset:offset + limit], len(ids) > offset + limit
+        # Offsets count the list without it: ids past it sit one position further on
+        window = ids[offset:offset + limit + 1] if i >= offset else ids[offset + 1:offset + limit + 1]
+        return [user_id for user_id in window if user_id != exclude][:limit], len(ids) - 1 > offset + limit
+
+user_directory = UserDirectory()
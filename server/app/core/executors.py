@@ -0,0 +1,41 @@
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.core.config import settings
+
+# Shared worker pools for CPU-bound work that must not run on the event loop.
+# Big-int pow() holds the GIL, so it goes to processes, not threads.
+# AES (PyCryptodome / cryptography) releases the GIL, so envelope encryption uses threads.
+
+_process_pool = None
+_crypto_pool = None
+
+def process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.CPU_WORKERS)
+    return _process_pool
+
+async def run_in_process(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool(), functools.partial(fn, *args, **kwargs))
+
+def crypto_pool() -> ThreadPoolExecutor:
+    global _crypto_pool
+    if _crypto_pool is None:
+        _crypto_pool = ThreadPoolExecutor(max_workers=settings.CRYPTO_THREADS, thread_name_prefix="crypto")
+    return _crypto_pool
+
+def run_in_crypto_thread(fn, *args):
+    # Returns the future without awaiting it, so callers can queue it in order
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(crypto_pool(), fn, *args)
+
+def shutdown_executors():
+    global _process_pool, _crypto_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _crypto_pool is not None:
+        _crypto_pool.shutdown(wait=False, cancel_futures=True)
+        _crypto_pool = None
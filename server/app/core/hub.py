@@ -0,0 +1,136 @@
+import asyncio
+import json
+from app.core.config import settings
+from app.core.executors import crypto_pool, run_in_crypto_thread
+from app.core.metrics import metrics
+from app.core.outbox import DEPTH_BUCKETS, classify
+from app.core.session_manager import session_manager, SessionManager
+
+def group_topic(group_id: int) -> str:
+    # Every channel of a group shares the group's membership
+    return f"group:{int(group_id)}"
+
+def presence_topic(user_id: int) -> str:
+    # Sessions watching this user's online/offline status
+    return f"presence:{int(user_id)}"
+
+def encode_body(sess, payload: dict, bodies: dict = None) -> bytes:
+    # Fan-out callers pass a shared `bodies` dict so each codec encodes the payload only once
+    codec = sess.codec
+    if bodies is None:
+        return codec.encode(payload)
+    push_bytes = bodies.get(codec.name)
+    if push_bytes is None:
+        push_bytes = bodies[codec.name] = codec.encode(payload)
+    return push_bytes
+
+def seal_frame(envelope, binary: bool, reserved, push_bytes: bytes):
+    # Thread-safe: the envelope's mutable state was already advanced by reserve() on the loop
+    try:
+        push_enc = envelope.seal(reserved, push_bytes)
+    except Exception as e:
+        print(f"Push encryption error: {e}")
+        return None # The writer skips it
+    return push_enc if binary else json.dumps({ "data": push_enc.hex() })
+
+def seal_batch(jobs):
+    return [seal_frame(*job) for job in jobs]
+
+async def send_payload(sess, payload: dict, bodies: dict = None) -> bool:
+    # Encode + encrypt a payload for one session and queue it on its outbox.
+    # Returns False if the session's outbox is closed (disconnected or evicted).
+    push_bytes = encode_body(sess, payload, bodies)
+    reserved = sess.envelope.reserve()
+    if len(push_bytes) >= settings.CRYPTO_OFFLOAD_BYTES:
+        # Large payload: encrypt on a crypto thread; the outbox keeps the future's place in line
+        metrics.counter("crypto_offload_total", kind="large").inc()
+        frame = run_in_crypto_thread(seal_frame, sess.envelope, sess.binary_frames, reserved, push_bytes)
+    else:
+        frame = seal_frame(sess.envelope, sess.binary_frames, reserved, push_bytes)
+        if frame is None:
+            raise ValueError("Push encryption failed")
+    return sess.outbox.put(frame, classify(payload))
+
+class Hub:
+    """Fan-out by user id or topic, touching only the sessions that should receive the push."""
+
+    def __init__(self, manager: SessionManager):
+        self.manager = manager
+
+    async def deliver(self, sessions, payload: dict):
+        # Returns (delivered count, sessions whose socket failed)
+        sessions = [sess for sess in sessions if sess.websocket and sess.envelope is not None]
+        if len(sessions) >= settings.CRYPTO_BATCH_MIN:
+            return self.deliver_batch(sessions, payload)
+
+        bodies = {}
+        delivered = 0
+        failed = []
+        for sess in sessions:
+            try:
+                if await send_payload(sess, payload, bodies):
+                    delivered += 1
+                else:
+                    failed.append(sess)
+            except Exception as e:
+                print(f"Push error to {sess.session_id}: {e}")
+                failed.append(sess)
+        return delivered, failed
+
+    def deliver_batch(self, sessions, payload: dict):
+        # Big fan-out: queue a placeholder future on every outbox right away (keeps per-session
+        # order), then encrypt in CRYPTO_THREADS chunks in parallel off the event loop.
+        loop = asyncio.get_running_loop()
+        bodies = {}
+        kind = classify(payload)
+        delivered = 0
+        failed = []
+        jobs = []
+        futures = []
+        for sess in sessions:
+            try:
+                push_bytes = encode_body(sess, payload, bodies)
+                frame = loop.create_future()
+                if not sess.outbox.put(frame, kind):
+                    failed.append(sess)
+                    continue
+                jobs.append((sess.envelope, sess.binary_frames, sess.envelope.reserve(), push_bytes))
+                futures.append(frame)
+                delivered += 1
+            except Exception as e:
+                print(f"Push error to {sess.session_id}: {e}")
+                failed.append(sess)
+
+        metrics.counter("crypto_offload_total", kind="batch").inc()
+        metrics.histogram("crypto_batch_size", buckets=DEPTH_BUCKETS).observe(len(jobs))
+        chunk = -(-len(jobs) // settings.CRYPTO_THREADS) or 1
+        for start in range(0, len(jobs), chunk):
+            task = loop.run_in_executor(crypto_pool(), seal_batch, jobs[start:start + chunk])
+            task.add_done_callback(lambda task, targets=futures[start:start + chunk]: resolve_frames(task, targets))
+        return delivered, failed
+
+    async def send_to_user(self, user_id: int, payload: dict) -> int:
+        delivered, _ = await self.deliver(self.manager.get_user_sessions(user_id), payload)
+        return delivered
+
+    async def send_to_users(self, user_ids, payload: dict, exclude: int = None) -> int:
+        sessions = [
+            sess
+            for uid in set(user_ids) if uid != exclude
+            for sess in self.manager.get_user_sessions(uid)
+        ]
+        delivered, _ = await self.deliver(sessions, payload)
+        return delivered
+
+    async def publish(self, topic: str, payload: dict, exclude: int = None) -> int:
+        sessions = [sess for sess in self.manager.get_topic_sessions(topic) if sess.user_id != exclude]
+        delivered, _ = await self.deliver(sessions, payload)
+        return delivered
+
+def resolve_frames(task, targets):
+    frames = task.result() if not task.cancelled() and task.exception() is None else [None] * len(targets)
+    for target, frame in zip(targets, frames):
+        if not target.done():
+            target.set_result(frame)
+
+hub = Hub(session_manager)
@@ -0,0 +1,129 @@
+import bisect
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+# Lightweight in-process metrics.
+# Everything runs on the event loop thread, so plain ints/floats are enough.
+# Exposed as JSON to admins (admin.metrics_get) and, when enabled, to loopback clients via
+# /api/metrics (see app/routers/metrics.py).
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+        self.max_value = 0
+
+    def set(self, value: float):
+        self.value = value
+        if value > self.max_value:
+            self.max_value = value
+
+    def inc(self, amount: float = 1):
+        self.set(self.value + amount)
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def snapshot(self):
+        return {"value": self.value, "max": self.max_value}
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0,
+            "buckets": buckets
+        }
+
+class Rate:
+    """Events per second over a sliding window (e.g. handshakes/s during a reconnect storm)."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.events = deque() # (second, count)
+        self.total = 0
+
+    def mark(self, amount: int = 1):
+        now = int(time.monotonic())
+        if self.events and self.events[-1][0] == now:
+            self.events[-1] = (now, self.events[-1][1] + amount)
+        else:
+            self.events.append((now, amount))
+        self.total += amount
+
+    def per_second(self) -> float:
+        cutoff = time.monotonic() - self.window
+        while self.events and self.events[0][0] < cutoff:
+            self.events.popleft()
+        return sum(n for _, n in self.events) / self.window
+
+    def snapshot(self):
+        return {"total": self.total, "per_second": round(self.per_second(), 3), "window": self.window}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Dict[LabelKey, object]] = {}
+
+    def _get(self, factory, name: str, labels: dict, **kwargs):
+        family = self._metrics.setdefault(name, {})
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        metric = family.get(key)
+        if metric is None:
+            metric = factory(**kwargs)
+            family[key] = metric
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get(Gauge, name, labels)
+
+    def rate(self, name: str, window: float = 60.0, **labels) -> Rate:
+        return self._get(Rate, name, labels, window=window)
+
+    def histogram(self, name: str, buckets=DEFAULT_LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, labels, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        out = {}
+        for name, family in self._metrics.items():
+            series = []
+            for key, metric in family.items():
+                series.append({"labels": dict(key), "value": metric.snapshot()})
+            out[name] = series
+        return out
+
+metrics = MetricsRegistry()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import deque
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Overflow policy classes
+NORMAL = "normal"     # Responses and regular pushes: never dropped, slow consumers get evicted
+PRESENCE = "presence" # user.status: drop-oldest, the newest state is all a client needs
+SIGNAL = "signal"     # Call signaling (SDP/ICE): never dropped, never counted towards eviction
+
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+def classify(payload: dict) -> str:
+    msg_type = payload.get("type") or ""
+    if msg_type == "user.status":
+        return PRESENCE
+    if msg_type.startswith("call.") or msg_type.startswith("groups.call."):
+        return SIGNAL
+    return NORMAL
+
+class Outbox:
+    """Bounded per-session send queue drained by a single writer task.
+
+    Fan-out only enqueues, so a stalled socket delays nobody but its own session.
+    """
+
+    def __init__(self, limit: int = None, overload_seconds: float = None):
+        self.limit = limit or settings.WS_OUTBOX_LIMIT
+        self.hard_limit = self.limit * 2
+        self.overload_seconds = overload_seconds if overload_seconds is not None else settings.WS_OUTBOX_OVERLOAD_SECONDS
+        self.frames = deque() # (kind, frame): bytes (binary), str (hex/JSON text) or a future of either
+        self.wakeup = asyncio.Event()
+        self.overloaded_since = None
+        self.closed = False
+        self.evicted = False
+        self.websocket = None
+        self.writer = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, frame, kind: str = NORMAL) -> bool:
+        if self.closed:
+            return False
+
+        if len(self.frames) >= self.limit:
+            if kind == PRESENCE:
+                # Make room by dropping the oldest queued presence update, or skip this one
+                metrics.counter("ws_outbox_dropped_total", kind=kind).inc()
+                if not self._drop_oldest(PRESENCE):
+                    return True
+            elif kind == NORMAL:
+                now = time.monotonic()
+                if self.overloaded_since is None:
+                    self.overloaded_since = now
+                elif now - self.overloaded_since > self.overload_seconds or len(self.frames) >= self.hard_limit:
+                    self.evict()
+                    return False
+
+        self.frames.append((kind, frame))
+        metrics.gauge("ws_outbox_frames").inc()
+        metrics.histogram("ws_outbox_depth", buckets=DEPTH_BUCKETS).observe(len(self.frames))
+        self.wakeup.set()
+        return True
+
+    def _drop_oldest(self, kind: str) -> bool:
+        for i, (queued_kind, _) in enumerate(self.frames):
+            if queued_kind == kind:
+                del self.frames[i]
+                metrics.gauge("ws_outbox_frames").dec()
+                return True
+        return False
+
+    def evict(self):
+        print(f"Outbox: evicting slow consumer ({len(self.frames)} frames queued)")
+        metrics.counter("ws_outbox_evictions_total").inc()
+        self.evicted = True
+        self.close()
+        if self.websocket is not None:
+            # The writer may be stuck in a send to this very client, so close from outside it
+            asyncio.ensure_future(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1013) # Try again later
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        metrics.gauge("ws_outbox_frames").dec(len(self.frames))
+        self.frames.clear()
+        self.wakeup.set()
+
+    def start(self, websocket):
+        self.websocket = websocket
+        self.writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.close()
+        if self.writer is not None:
+            self.writer.cancel()
+            try:
+                await self.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _run(self):
+        # Writer task: the only place that writes encrypted frames to the socket
+        try:
+            while True:
+                while not self.frames:
+                    if self.closed:
+                        return
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+
+                _, frame = self.frames.popleft()
+                metrics.gauge("ws_outbox_frames").dec()
+                if len(self.frames) < self.limit:
+                    self.overloaded_since = None
+
+                if isinstance(frame, asyncio.Future):
+                    # Still being encrypted on a crypto thread; None means encryption failed
+                    frame = await frame
+                    if frame is None:
+                        continue
+
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+        except Exception as e:
+            if not self.closed:
+                print(f"Outbox writer error: {e}")
+                self.close()
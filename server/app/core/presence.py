@@ -0,0 +1,110 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.core.hub import hub, presence_topic
+from app.core.metrics import metrics
+from app.core.profiles import profile_cache
+from app.core.session_manager import session_manager
+from app.db.models import AsyncSessionLocal, User
+from sqlalchemy import bindparam, update
+
+FLUSH_INTERVAL = 1.0 # Seconds between checks for expired grace periods
+BATCH_BUCKETS = (1, 5, 10, 50, 100, 500, 1000)
+
+# Core executemany: no ORM rowcount check, so an id deleted meanwhile (e.g. banned) is skipped
+# instead of failing the whole batch
+users = User.__table__
+write_last_seen_stmt = update(users).where(users.c.id == bindparam("uid")).values(last_seen=bindparam("seen"))
+
+async def broadcast_presence(user_id: int, is_online: bool, last_seen: float = 0):
+    payload = {
+        "type": "user.status",
+        "user_id": user_id,
+        "status": "online" if is_online else "offline",
+        "last_seen": last_seen
+    }
+
+    # Only sessions that watch this user (contacts, dialog peers, shared groups, presence.subscribe)
+    await hub.publish(presence_topic(user_id), payload)
+
+class PresenceTracker:
+    """Debounces reconnect flaps: a user whose last socket closed stays "online" for a grace
+    period, and only announces offline (and gets its last_seen written) if it doesn't come back.
+    """
+
+    def __init__(self, grace_seconds: float = None):
+        self.grace_seconds = grace_seconds if grace_seconds is not None else settings.PRESENCE_GRACE_SECONDS
+        self.announced_online = set() # Users whose last published status is "online"
+        self.pending_offline = {} # user_id -> time the last session closed
+        self.last_seen_writes = {} # user_id -> last_seen, written in one batch per flush
+        self.task = None
+
+    def is_online(self, user_id: int) -> bool:
+        return session_manager.is_online(user_id) or user_id in self.pending_offline
+
+    async def user_online(self, user_id: int):
+        if self.pending_offline.pop(user_id, None) is not None:
+            # Came back within the grace period: watchers never saw it leave
+            metrics.counter("presence_flaps_suppressed_total").inc()
+            return
+        if user_id in self.announced_online:
+            return # Another device of an already-online user
+        self.announced_online.add(user_id)
+        await broadcast_presence(user_id, True)
+
+    def user_offline(self, user_id: int):
+        # Called once the user's last session is gone
+        self.pending_offline[user_id] = time.time()
+
+    def forget(self, user_id: int):
+        # Banned: no offline announcement or last_seen write for a user that no longer exists
+        self.announced_online.discard(user_id)
+        self.pending_offline.pop(user_id, None)
+        self.last_seen_writes.pop(user_id, None)
+
+    async def flush(self, now: float = None):
+        now = now if now is not None else time.time()
+        expired = [uid for uid, ts in self.pending_offline.items() if now - ts >= self.grace_seconds]
+        for uid in expired:
+            last_seen = self.pending_offline.pop(uid)
+            self.announced_online.discard(uid)
+            self.last_seen_writes[uid] = last_seen
+            await broadcast_presence(uid, False, last_seen)
+        await self.write_last_seen()
+
+    async def write_last_seen(self):
+        if not self.last_seen_writes:
+            return
+        batch, self.last_seen_writes = self.last_seen_writes, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                # Bulk UPDATE by primary key: one executemany for the whole window
+                await db.execute(write_last_seen_stmt, [{"uid": uid, "seen": ts} for uid, ts in batch.items()])
+                await db.commit()
+            profile_cache.update_last_seen(batch)
+            metrics.histogram("presence_last_seen_batch", buckets=BATCH_BUCKETS).observe(len(batch))
+        except Exception as e:
+            print(f"Update last_seen error: {e}")
+            # Retry on the next flush unless a newer value arrived meanwhile
+            for uid, ts in batch.items():
+                self.last_seen_writes.setdefault(uid, ts)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Presence flush error: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        # Shutting down: nobody is coming back, announce and persist everything now
+        await self.flush(now=float("inf"))
+
+presence_tracker = PresenceTracker()
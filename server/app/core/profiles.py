@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from sqlalchemy.future import select
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.models import User
+
+PROFILE_FIELDS = ("id", "email", "username", "display_name", "about", "avatar_url", "phone_number", "last_seen")
+
+class Profile:
+    """Detached snapshot of the public columns of a User row.
+
+    Quacks like a User for serialize_user / serialize_sender, which memoize their output
+    in `public` / `sender` so hot profiles are serialized once.
+    """
+
+    __slots__ = PROFILE_FIELDS + ("public", "sender")
+
+    def __init__(self, user):
+        for field in PROFILE_FIELDS:
+            setattr(self, field, getattr(user, field, None))
+        self.public = None
+        self.sender = None
+
+class ProfileCache:
+    """Write-through LRU of user profiles, bounded to `max_entries`."""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.PROFILE_CACHE_SIZE
+        self.profiles = OrderedDict() # user_id -> Profile, least recently used first
+        self.writes = 0 # put() / invalidate() count: a fill that raced one of them is not cached
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def _lookup(self, user_id: int):
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            metrics.counter("profile_cache_misses_total").inc()
+            return None
+        self.profiles.move_to_end(user_id)
+        metrics.counter("profile_cache_hits_total").inc()
+        return profile
+
+    def put(self, user) -> Profile:
+        self.writes += 1
+        return self._store(user)
+
+    def _store(self, user) -> Profile:
+        profile = Profile(user)
+        self.profiles[profile.id] = profile
+        self.profiles.move_to_end(profile.id)
+        while len(self.profiles) > self.max_entries:
+            self.profiles.popitem(last=False)
+            metrics.counter("profile_cache_evictions_total").inc()
+        metrics.gauge("profile_cache_size").set(len(self.profiles))
+        return profile
+
+    def invalidate(self, user_id: int):
+        self.writes += 1
+        if self.profiles.pop(user_id, None) is not None:
+            metrics.gauge("profile_cache_size").set(len(self.profiles))
+
+    def update_last_seen(self, last_seen: dict):
+        # Presence writes last_seen in batches; keep cached snapshots in step (not part of `public`)
+        for user_id, ts in last_seen.items():
+            profile = self.profiles.get(user_id)
+            if profile is not None:
+                profile.last_seen = ts
+
+    async def get(self, db, user_id: int):
+        if user_id is None:
+            return None
+        profile = self._lookup(user_id)
+        if profile is None:
+            writes = self.writes
+            res = await db.execute(select(User).where(User.id == user_id))
+            user = res.scalars().first()
+            if user is not None:
+                profile = self._fill(user, writes)
+        return profile
+
+    def _fill(self, user, writes: int) -> Profile:
+        # A put() or invalidate() during the SELECT may be newer than the row just read: keep it
+        # (or nothing) cached rather than overwrite it
+        if self.writes == writes:
+            return self._store(user)
+        return self.profiles.get(user.id) or Profile(user)
+
+    async def get_many(self, db, user_ids) -> dict:
+        # user_id -> Profile; all misses are loaded with one IN query
+        found = {}
+        missing = []
+        for user_id in set(user_ids):
+            if user_id is None:
+                continue
+            profile = self._lookup(user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = profile
+        if missing:
+            writes = self.writes
+            res = await db.execute(select(User).where(User.id.in_(missing)))
+            for user in res.scalars().all():
+                found[user.id] = self._fill(user, writes)
+        return found
+
+profile_cache = ProfileCache()
@@ -0,0 +1,66 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.metrics import metrics
+
+def resume_proof(auth_key: bytes, session_id: str, nonce: str, ts: int) -> str:
+    # HMAC-SHA256 over the session id, a client nonce and a timestamp, keyed with the auth_key
+    message = f"resume:{session_id}:{nonce}:{ts}".encode('utf-8')
+    return hmac.new(auth_key, message, hashlib.sha256).hexdigest()
+
+class ResumeEntry:
+    def __init__(self, auth_key: bytes, user_id, expires_at: float):
+        self.auth_key = auth_key
+        self.user_id = user_id
+        self.expires_at = expires_at
+
+class ResumeStore:
+    """Bounded, expiring auth_keys of closed sessions, so a client can reattach without a DH handshake."""
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or settings.RESUME_MAX_SESSIONS
+        self.ttl = ttl if ttl is not None else settings.RESUME_TTL_SECONDS
+        self.entries = OrderedDict() # session_id -> ResumeEntry, oldest first
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, session_id: str, auth_key: bytes, user_id=None):
+        self.entries.pop(session_id, None)
+        self.entries[session_id] = ResumeEntry(auth_key, user_id, time.monotonic() + self.ttl)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        metrics.gauge("resume_store_size").set(len(self.entries))
+
+    def get(self, session_id: str):
+        entry = self.entries.get(session_id)
+        if entry is not None and entry.expires_at < time.monotonic():
+            del self.entries[session_id]
+            return None
+        return entry
+
+    def discard(self, session_id: str):
+        self.entries.pop(session_id, None)
+        metrics.gauge("resume_store_size").set(len(self.entries))
+
+    def discard_user(self, user_id: int):
+        # Banned: none of the user's closed sessions may be reattached
+        for session_id in [sid for sid, entry in self.entries.items() if entry.user_id == user_id]:
+            del self.entries[session_id]
+        metrics.gauge("resume_store_size").set(len(self.entries))
+
+def verify_resume(auth_key: bytes, session_id: str, request: dict) -> bool:
+    try:
+        ts = int(request["ts"])
+        nonce = str(request["nonce"])
+        proof = str(request["proof"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    # Proofs are single-use (the entry is consumed) and only valid for a short window
+    if abs(time.time() - ts) > settings.RESUME_PROOF_WINDOW_SECONDS:
+        return False
+    return hmac.compare_digest(resume_proof(auth_key, session_id, nonce, ts), proof)
+
+resume_store = ResumeStore()
@@ -1,23 +1,32 @@
 from typing import Dict, Optional
-from app.crypto.dh import DiffieHellman
+from app.core.codec import JSON
+from app.core.outbox import Outbox
 import uuid
 import time
 
 class Session:
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.dh = DiffieHellman()
+        self.dh = None # Server key pair, taken from the DH reservoir during the handshake
         self.auth_key: Optional[bytes] = None
+        self.envelope = None # Frame encryption negotiated in client_hello (app/crypto/envelope.py)
         self.step = 0 # 0: Init, 1: Server Hello Sent, 2: Handshake Complete
         self.user_id: Optional[str] = None
         self.created_at = time.time()
         self.temp_auth_data: Dict = {}
         self.websocket = None # Reference to active request (not serializable)
+        self.outbox = Outbox() # Responses and pushes, drained by the connection's writer task
+        self.pipelined = False # Negotiated in client_hello: requests with req_id run concurrently
+        self.binary_frames = False # Protocol v2: raw msg_key + ciphertext frames instead of hex-in-JSON
+        self.codec = JSON # Body codec negotiated in client_hello (json / msgpack)
+        self.topics: set = set() # Hub topics this session is subscribed to
+        self.resumable = True # Keep the auth_key in the resume store when the socket closes
 
 class SessionManager:
     def __init__(self):
         self.sessions: Dict[str, Session] = {}
         self.active_users: Dict[int, set] = {} # user_id -> set(session_ids)
+        self.topics: Dict[str, set] = {} # topic -> set(session_ids), e.g. "group:7"
 
     def create_session(self) -> Session:
         session_id = str(uuid.uuid4())
@@ -41,6 +50,8 @@ class SessionManager:
         self.active_users[user_id].add(session.session_id)
 
     def unbind_user(self, session: Session):
+        # Topic subscriptions belong to the logged-in user
+        self.unsubscribe_all(session)
         if session.user_id:
             user_id = int(session.user_id) # Ensure int
             if user_id in self.active_users:
@@ -55,4 +66,28 @@ class SessionManager:
     def is_online(self, user_id: int) -> bool:
         return user_id in self.active_users
 
+    def subscribe(self, session: Session, topic: str):
+        self.topics.setdefault(topic, set()).add(session.session_id)
+        session.topics.add(topic)
+
+    def unsubscribe(self, session: Session, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(session.session_id)
+            if not subscribers:
+                del self.topics[topic]
+        session.topics.discard(topic)
+
+    def unsubscribe_all(self, session: Session):
+        for topic in list(session.topics):
+            self.unsubscribe(session, topic)
+
+    def drop_topic(self, topic: str):
+        for sid in self.topics.pop(topic, ()):
+            if sid in self.sessions:
+                self.sessions[sid].topics.discard(topic)
+
+    def get_topic_sessions(self, topic: str):
+        return [self.sessions[sid] for sid in self.topics.get(topic, []) if sid in self.sessions]
+
 session_manager = SessionManager()
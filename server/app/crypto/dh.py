@@ -7,15 +7,26 @@ P_HEX = "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA
 G = 2
 P = int(P_HEX, 16)
 
+def generate_keypair(p=P, g=G):
+    # Generate random private key (a)
+    # 2048 bits = 256 bytes. We take 256 bytes of randomness.
+    # In practice, 'a' should be < p-1.
+    private_key = secrets.randbelow(p - 1)
+    return private_key, pow(g, private_key, p)
+
+def derive_auth_key(other_public_key: int, private_key: int, p=P) -> bytes:
+    # Module-level so it can run in a worker process
+    shared_secret_int = pow(other_public_key, private_key, p)
+    # Convert int to bytes, padded to 2048 bits (256 bytes) as the MTProto auth_key
+    secret_bytes = shared_secret_int.to_bytes((shared_secret_int.bit_length() + 7) // 8, byteorder='big')
+    return secret_bytes.rjust(256, b'\x00')
+
 class DiffieHellman:
-    def __init__(self, p=P, g=G):
+    def __init__(self, p=P, g=G, keypair=None):
         self.p = p
         self.g = g
-        # Generate random private key (a)
-        # 2048 bits = 256 bytes. We take 256 bytes of randomness.
-        # In practice, 'a' should be < p-1.
-        self.private_key = secrets.randbelow(self.p - 1)
-        self.public_key = pow(self.g, self.private_key, self.p)
+        # A pre-generated (private, public) pair skips the expensive pow() here
+        self.private_key, self.public_key = keypair or generate_keypair(p, g)
 
     def get_public_key(self):
         return self.public_key
@@ -23,21 +34,9 @@ class DiffieHellman:
     def compute_shared_secret(self, other_public_key: int) -> bytes:
         """
         Computes (g^b)^a mod p = g^(ab) mod p.
-        Returns the SHA-256 hash of the shared secret to be used as auth_key.
+        Returns the shared secret, padded to 256 bytes, to be used as auth_key.
         """
-        shared_secret_int = pow(other_public_key, self.private_key, self.p)
-        # Convert int to bytes
-        # 2048 bits / 8 = 256 bytes
-        secret_bytes = shared_secret_int.to_bytes((shared_secret_int.bit_length() + 7) // 8, byteorder='big')
-        
-        # In MTProto, auth_key is usually just the bytes, but let's hash it for uniformity
-        # or stick to 256 bytes if we want exact MTProto. 
-        # The article mentions simple DH, let's keep it raw or hashed.
-        # Let's use SHA-256 to get a clean 32-byte key for AES-256 usually, 
-        # BUT MTProto uses 2048-bit (256 bytes) auth_key.
-        # Let's return the raw bytes padded to 256 bytes.
-        
-        return secret_bytes.rjust(256, b'\x00')
+        return derive_auth_key(other_public_key, self.private_key, self.p)
 
 def get_dh_params():
     return {"p": str(P), "g": G}
@@ -0,0 +1,54 @@
+import asyncio
+from collections import deque
+from app.core.config import settings
+from app.core.executors import run_in_process
+from app.core.metrics import metrics
+from app.crypto.dh import DiffieHellman, generate_keypair
+
+class KeyPairReservoir:
+    """Keeps pre-generated server DH key pairs so a handshake only pays for the shared secret.
+
+    Key pairs are generated in the process pool and topped up in the background.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = size if size is not None else settings.DH_RESERVOIR_SIZE
+        self.pairs = deque()
+        self.refill_task = None
+
+    def __len__(self):
+        return len(self.pairs)
+
+    async def acquire(self) -> DiffieHellman:
+        if self.pairs:
+            keypair = self.pairs.popleft()
+            metrics.counter("dh_reservoir_hits_total").inc()
+        else:
+            # Drained (e.g. reconnect storm): generate this one off the event loop right away
+            keypair = await run_in_process(generate_keypair)
+            metrics.counter("dh_reservoir_misses_total").inc()
+        metrics.gauge("dh_reservoir_size").set(len(self.pairs))
+        self.schedule_refill()
+        return DiffieHellman(keypair=keypair)
+
+    def schedule_refill(self):
+        if len(self.pairs) < self.size and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self.refill())
+
+    async def refill(self):
+        try:
+            while len(self.pairs) < self.size:
+                # One batch per worker so all processes stay busy
+                batch = min(settings.CPU_WORKERS, self.size - len(self.pairs))
+                keypairs = await asyncio.gather(*[run_in_process(generate_keypair) for _ in range(batch)])
+                self.pairs.extend(keypairs)
+                metrics.gauge("dh_reservoir_size").set(len(self.pairs))
+        except Exception as e:
+            print(f"DH reservoir refill error: {e}")
+
+    async def stop(self):
+        if self.refill_task is not None:
+            self.refill_task.cancel()
+            self.refill_task = None
+
+dh_reservoir = KeyPairReservoir()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+from Cryptodome.Cipher import AES
+from app.crypto.mtproto import MTProtoCrypto
+
+try:
+    # Keeps the AES key schedule and GHASH tables for the whole connection
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+# Per-connection message envelopes, negotiated in client_hello ("envelope": 2).
+#   v1: MTProtoCrypto - msg_key + AES-CBC, keys re-derived from auth_key for every frame
+#   v2: AES-256-GCM with keys derived once per connection and a counter nonce
+#       frame = counter (8 bytes, big-endian) + ciphertext + tag (16 bytes)
+#
+# encrypt() = seal(reserve(), plaintext): reserve() runs on the event loop and fixes the frame's
+# position (nonce), seal() is stateless and may run on a crypto thread.
+
+COUNTER_SIZE = 8
+TAG_SIZE = 16
+SALT_SIZE = 16
+
+class MTProtoEnvelope:
+    version = 1
+
+    def __init__(self, auth_key: bytes):
+        self.auth_key = auth_key
+
+    def reserve(self):
+        return None
+
+    def seal(self, reserved, plaintext: bytes) -> bytes:
+        return MTProtoCrypto.encrypt(self.auth_key, plaintext)
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return self.seal(self.reserve(), plaintext)
+
+    def decrypt(self, data: bytes) -> bytes:
+        return MTProtoCrypto.decrypt(self.auth_key, data)
+
+def derive_gcm_keys(auth_key: bytes, salt: bytes):
+    # Fresh salt per connection, so a resumed auth_key never reuses a (key, nonce) pair
+    c2s = hashlib.sha256(b"samor-gcm-c2s" + salt + auth_key).digest()
+    s2c = hashlib.sha256(b"samor-gcm-s2c" + salt + auth_key).digest()
+    return c2s, s2c
+
+class GcmEnvelope:
+    version = 2
+
+    def __init__(self, auth_key: bytes, salt: bytes = None, server_side: bool = True):
+        self.salt = salt or os.urandom(SALT_SIZE)
+        c2s, s2c = derive_gcm_keys(auth_key, self.salt)
+        self.send_key, self.recv_key = (s2c, c2s) if server_side else (c2s, s2c)
+        self.send_counter = 0
+        self.recv_counter = 0
+        if AESGCM is not None:
+            self.send_aead = AESGCM(self.send_key)
+            self.recv_aead = AESGCM(self.recv_key)
+
+    def reserve(self) -> bytes:
+        self.send_counter += 1
+        return self.send_counter.to_bytes(COUNTER_SIZE, 'big')
+
+    def seal(self, counter: bytes, plaintext: bytes) -> bytes:
+        nonce = bytes(4) + counter
+        if AESGCM is not None:
+            return counter + self.send_aead.encrypt(nonce, plaintext, None) # ciphertext + tag
+        cipher = AES.new(self.send_key, AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return counter + ciphertext + tag
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return self.seal(self.reserve(), plaintext)
+
+    def decrypt(self, data: bytes) -> bytes:
+        if len(data) < COUNTER_SIZE + TAG_SIZE:
+            raise ValueError("Data too short")
+
+        counter = int.from_bytes(data[:COUNTER_SIZE], 'big')
+        if counter <= self.recv_counter:
+            raise ValueError("Replayed or reordered frame")
+
+        nonce = bytes(4) + data[:COUNTER_SIZE]
+        if AESGCM is not None:
+            try:
+                plaintext = self.recv_aead.decrypt(nonce, data[COUNTER_SIZE:], None)
+            except InvalidTag:
+                raise ValueError("MAC check failed")
+        else:
+            cipher = AES.new(self.recv_key, AES.MODE_GCM, nonce=nonce)
+            plaintext = cipher.decrypt_and_verify(data[COUNTER_SIZE:-TAG_SIZE], data[-TAG_SIZE:])
+        self.recv_counter = counter
+        return plaintext
+
+ENVELOPE_VERSION = GcmEnvelope.version # Highest version this server speaks
+
+def negotiate_envelope(auth_key: bytes, requested):
+    version = min(int(requested or 1), ENVELOPE_VERSION)
+    if version >= 2:
+        return GcmEnvelope(auth_key)
+    return MTProtoEnvelope(auth_key)
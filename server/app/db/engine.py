@@ -0,0 +1,63 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.config import settings
+
+# Engine profiles, picked from settings.DATABASE_URL:
+#   sqlite+aiosqlite  - single file, WAL + tuned pragmas (default, ~/samor_safe_db/samor.db)
+#   postgresql+asyncpg - pooled connections with pre-ping, for when SQLite write contention bites
+
+# Robust path resolution:
+# We moved the default DB OUTSIDE the project root, so uvicorn's file watcher never sees changes.
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), "samor_safe_db", "samor.db")
+
+def database_url() -> str:
+    url = settings.DATABASE_URL
+    if not url:
+        os.makedirs(os.path.dirname(DEFAULT_DB_PATH), exist_ok=True)
+        return f"sqlite+aiosqlite:///{DEFAULT_DB_PATH}"
+    # Accept plain postgres URLs (e.g. from a hosting provider) and use the async driver
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}") # First: the others may need the lock
+    cursor.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer
+    cursor.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, far fewer fsyncs
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}") # Negative = KiB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def create_engine_from_settings(url: str = None):
+    url = url or database_url()
+    backend = make_url(url).get_backend_name()
+    options = {"echo": settings.DB_ECHO}
+    if backend == "postgresql":
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True # Survive server restarts / idle connection reaping
+        )
+
+    elif backend == "sqlite" and make_url(url).database not in (None, "", ":memory:"):
+        # aiosqlite defaults to NullPool: a new connection (and thread, and pragmas) per session
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+
+    engine = create_async_engine(url, **options)
+    if backend == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
@@ -0,0 +1,74 @@
+import re
+from sqlalchemy import column, func, literal_column, table, text
+
+# SQLite FTS5 index over messages.content (external content table, no copy of the text).
+# Triggers keep it in sync on every insert, delete and content update - including forwards,
+# "delete for all" and admin bulk deletes - so handlers never touch it directly.
+
+FTS_TABLE = "messages_fts"
+
+# FTS5 keeps one docsize row per indexed rowid. While FtsIndex fills the index, a message that is
+# not in it yet must not be 'delete'd from it: that would corrupt the index.
+INDEXED = f"EXISTS (SELECT 1 FROM {FTS_TABLE}_docsize WHERE id = old.id)"
+
+FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(content, content='messages', content_rowid='id')",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) SELECT 'delete', old.id, old.content WHERE {INDEXED};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) SELECT 'delete', old.id, old.content WHERE {INDEXED};
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+# Existing messages not yet in the index (the FtsIndex migration step), one id range at a time
+FTS_FILL = f"""INSERT INTO {FTS_TABLE}(rowid, content) SELECT id, content FROM messages
+    WHERE id > :low AND id <= :high AND id NOT IN (SELECT id FROM {FTS_TABLE}_docsize)"""
+
+messages_fts = table(FTS_TABLE, column("rowid"))
+
+# Set once the FTS5 table exists; handlers fall back to LIKE scans when the database has no FTS5,
+# and until the FTS_INDEX migration that builds the index is recorded
+fts_enabled = False
+
+async def fts_table_exists(conn) -> bool:
+    return (await conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {"name": FTS_TABLE})).first() is not None
+
+async def ensure_fts(conn):
+    # Startup: keeps an existing index in sync. Creating and filling it is an online migration
+    # step (FtsIndex), so a large database doesn't hold up startup.
+    global fts_enabled
+    if conn.dialect.name != "sqlite" or not await fts_table_exists(conn):
+        return
+    try:
+        for statement in FTS_DDL:
+            await conn.execute(text(statement))
+        fts_enabled = True
+    except Exception as e:
+        print(f"FTS5 unavailable, search falls back to LIKE: {e}")
+
+TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r'\w')
+
+def fts_query(raw: str) -> str:
+    # User input -> FTS5 MATCH expression: "quoted text" is a phrase, every other word a prefix
+    terms = []
+    for phrase, word in TOKEN_RE.findall(raw or ""):
+        if WORD_RE.search(phrase):
+            terms.append('"' + phrase.strip() + '"')
+        elif WORD_RE.search(word):
+            terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms)
+
+def fts_match(expression: str):
+    return literal_column(FTS_TABLE).op("MATCH")(expression)
+
+def fts_rank():
+    # BM25: lower is better
+    return func.bm25(literal_column(FTS_TABLE))
@@ -0,0 +1,4 @@
+from app.db.migrations.runner import Backfill, CreateIndex, FtsIndex, Migration, Migrator, add_column
+from app.db.migrations.versions import CONVERSATION_KEY_INDEX, FTS_INDEX, MIGRATIONS
+
+migrator = Migrator(MIGRATIONS)
@@ -0,0 +1,244 @@
+import asyncio
+import time
+from sqlalchemy import bindparam, inspect, select, text, update
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db import fts
+from app.db.models import Base, SchemaMigration
+
+versions = SchemaMigration.__table__
+
+class Migration:
+    """A schema step. `upgrade(conn)` runs in one transaction together with its version record,
+    so a step is either fully applied or not at all. Applied before the server accepts connections,
+    unless `online` (quick steps that must wait for an earlier index build or backfill).
+    """
+
+    online = False
+
+    def __init__(self, version: int, name: str, upgrade=None, online: bool = None):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        if online is not None:
+            self.online = online
+
+    async def apply(self, engine, migrator):
+        async with engine.begin() as conn:
+            await self.upgrade(conn)
+            await migrator.record(conn, self, done=True)
+
+class CreateIndex(Migration):
+    """Builds an index while the server is online. PostgreSQL uses CREATE INDEX CONCURRENTLY, so
+    writes to the table continue; SQLite has no equivalent, but in WAL mode readers are never blocked.
+    """
+
+    online = True
+
+    def __init__(self, version: int, name: str, table: str, columns):
+        super().__init__(version, f"index {name}")
+        self.index_name = name
+        self.table = table
+        self.columns = columns
+
+    async def apply(self, engine, migrator):
+        ddl = f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {self.table} ({', '.join(self.columns)})"
+        if engine.dialect.name == "postgresql":
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT") # CONCURRENTLY can't run in a transaction
+                # An interrupted concurrent build leaves an INVALID index behind: drop it and start over
+                invalid = (await conn.execute(text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name AND NOT i.indisvalid"
+                ), {"name": self.index_name})).first()
+                if invalid:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.index_name}"))
+                await conn.execute(text(ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
+        else:
+            async with engine.begin() as conn:
+                await conn.execute(text(ddl))
+        async with engine.begin() as conn:
+            await migrator.record(conn, self, done=True)
+
+class Backfill(Migration):
+    """Rewrites one column in id order, `batch_size` rows per short transaction, while the server
+    is online. The last processed id is committed with each batch, so an interrupted backfill
+    resumes where it stopped instead of starting over.
+    """
+
+    online = True
+
+    def __init__(self, version: int, name: str, table: str, column: str, transform, where=None, source=None, batch_size: int = None):
+        super().__init__(version, name)
+        self.table = table
+        self.column = column
+        self.transform = transform # values of the source columns -> new value
+        self.where = where # optional filter, fn(table) -> clause
+        self.source = source or [column]
+        self.batch_size = batch_size
+
+    async def apply(self, engine, migrator):
+        table = Base.metadata.tables[self.table]
+        column = table.c[self.column]
+        batch_size = self.batch_size or settings.MIGRATION_BATCH_SIZE
+        stmt = update(table).where(table.c.id == bindparam("row_id")).values({self.column: bindparam("new_value")})
+        cursor = await migrator.cursor(engine, self) or 0
+        while True:
+            async with engine.begin() as conn:
+                query = select(table.c.id, column, *[table.c[name] for name in self.source]).where(table.c.id > cursor)
+                if self.where is not None:
+                    query = query.where(self.where(table))
+                rows = (await conn.execute(query.order_by(table.c.id).limit(batch_size))).all()
+                changes = []
+                for row_id, value, *source in rows:
+                    new_value = self.transform(*source)
+                    if new_value != value:
+                        changes.append({"row_id": row_id, "new_value": new_value})
+                if changes:
+                    await conn.execute(stmt, changes)
+                if rows:
+                    cursor = rows[-1][0]
+                await migrator.record(conn, self, cursor=cursor, done=len(rows) < batch_size)
+            metrics.counter("migration_backfill_rows_total", version=str(self.version)).inc(len(changes))
+            if len(rows) < batch_size:
+                return
+            await asyncio.sleep(settings.MIGRATION_BATCH_PAUSE) # Let live writes in between batches
+
+class FtsIndex(Migration):
+    """Builds the SQLite FTS5 message index (app/db/fts.py) while the server is online. Table and triggers come first, so every message
+    written from then on is indexed as it lands; older messages are then indexed in id order,
+    `batch_size` per transaction, with the cursor committed alongside (as in Backfill). The step is
+    recorded applied, and search switches to FTS5, once the fill reaches the end.
+    """
+
+    online = True
+
+    def __init__(self, version: int, name: str, batch_size: int = None):
+        super().__init__(version, name)
+        self.batch_size = batch_size
+
+    async def apply(self, engine, migrator):
+        if engine.dialect.name != "sqlite":
+            return await self.skip(engine, migrator)
+        cursor = await migrator.cursor(engine, self)
+        try:
+            async with engine.begin() as conn:
+                existed = await fts.fts_table_exists(conn)
+                for statement in fts.FTS_DDL:
+                    await conn.execute(text(statement))
+                if existed and cursor is None:
+                    # Created (and filled in one go) before this step existed
+                    await migrator.record(conn, self, done=True)
+                    fts.fts_enabled = True
+                    return
+                await migrator.record(conn, self, cursor=cursor or 0)
+        except Exception as e:
+            print(f"FTS5 unavailable, search falls back to LIKE: {e}")
+            return await self.skip(engine, migrator)
+        fts.fts_enabled = True
+
+        batch_size = self.batch_size or settings.MIGRATION_BATCH_SIZE
+        cursor = cursor or 0
+        while True:
+            async with engine.begin() as conn:
+                ids = (await conn.execute(
+                    text("SELECT id FROM messages WHERE id > :cursor ORDER BY id LIMIT :limit"), {"cursor": cursor, "limit": batch_size}
+                )).scalars().all()
+                indexed = 0
+                if ids:
+                    # Skips messages the triggers indexed already (sent or edited since they were created)
+                    indexed = (await conn.execute(text(fts.FTS_FILL), {"low": cursor, "high": ids[-1]})).rowcount
+                    cursor = ids[-1]
+                await migrator.record(conn, self, cursor=cursor, done=len(ids) < batch_size)
+            metrics.counter("migration_backfill_rows_total", version=str(self.version)).inc(max(indexed, 0))
+            if len(ids) < batch_size:
+                return
+            await asyncio.sleep(settings.MIGRATION_BATCH_PAUSE) # Let live writes in between batches
+
+    async def skip(self, engine, migrator):
+        # No FTS5 here: recorded anyway, search keeps using LIKE
+        async with engine.begin() as conn:
+            await migrator.record(conn, self, done=True)
+
+async def add_column(conn, table: str, column: str, ddl: str):
+    # Idempotent ADD COLUMN: databases that predate versioning may already have it
+    columns = await conn.run_sync(lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns(table)])
+    if column not in columns:
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        print(f"Migration: added {table}.{column}")
+
+class Migrator:
+    """Applies MIGRATIONS in version order and records each one in schema_migrations.
+
+    `upgrade(engine)` runs the schema steps (startup); `upgrade(engine, online=True)` also runs
+    the index builds and backfills, which `start(engine)` does in the background.
+    """
+
+    def __init__(self, migrations):
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.completed = set() # Versions known to be applied, for is_applied()
+        self.task = None
+
+    def is_applied(self, version: int) -> bool:
+        # Lets handlers switch to a new index or column once its online step has finished
+        return version in self.completed
+
+    async def applied(self, engine) -> dict:
+        # version -> SchemaMigration row
+        async with engine.begin() as conn:
+            await conn.run_sync(versions.create, checkfirst=True)
+            res = await conn.execute(select(versions))
+            rows = {row.version: row for row in res.all()}
+        self.completed = {version for version, row in rows.items() if row.applied_at is not None}
+        return rows
+
+    async def cursor(self, engine, migration):
+        async with engine.connect() as conn:
+            res = await conn.execute(select(versions.c.cursor).where(versions.c.version == migration.version))
+            return res.scalar()
+
+    async def record(self, conn, migration, cursor=None, done=False):
+        values = {"name": migration.name, "cursor": cursor, "applied_at": time.time() if done else None}
+        res = await conn.execute(update(versions).where(versions.c.version == migration.version).values(values))
+        if res.rowcount == 0:
+            await conn.execute(versions.insert().values(version=migration.version, **values))
+
+    async def version(self, engine) -> int:
+        # Schema version: the highest version with every step up to it applied
+        applied = await self.applied(engine)
+        current = 0
+        for migration in self.migrations:
+            row = applied.get(migration.version)
+            if row is None or row.applied_at is None:
+                break
+            current = migration.version
+        return current
+
+    async def upgrade(self, engine, online: bool = False):
+        applied = await self.applied(engine)
+        for migration in self.migrations:
+            row = applied.get(migration.version)
+            if row is not None and row.applied_at is not None:
+                continue
+            if migration.online and not online:
+                continue # Deferred to the background run
+            print(f"Migration {migration.version}: {migration.name}...")
+            started = time.perf_counter()
+            await migration.apply(engine, self)
+            self.completed.add(migration.version)
+            print(f"Migration {migration.version} done in {time.perf_counter() - started:.1f}s")
+        metrics.gauge("schema_version").set(await self.version(engine))
+
+    async def _run_online(self, engine):
+        try:
+            await self.upgrade(engine, online=True)
+        except Exception as e:
+            # Progress is committed per batch: the next start picks up from here
+            print(f"Online migration error: {e}")
+
+    def start(self, engine):
+        self.task = asyncio.create_task(self._run_online(engine))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -0,0 +1,79 @@
+from sqlalchemy import text
+from app.db.migrations.runner import Backfill, CreateIndex, FtsIndex, Migration, add_column
+from app.db.models import conversation_key
+
+# Append-only: never renumber a step that has shipped, add a new one instead. A step a later
+# one makes pointless may become a no-op (see 5), since databases past it are unaffected.
+# Steps 1-7 replace the old standalone migrate_*.py scripts; on a database that already ran
+# them (or was created by create_all) they find nothing to do and are just recorded.
+
+async def users_profile_columns(conn):
+    # was migrate_add_phone.py, migrate_last_seen.py, migrate_db_settings.py
+    await add_column(conn, "users", "phone_number", "VARCHAR")
+    await add_column(conn, "users", "last_seen", "FLOAT DEFAULT 0")
+    await add_column(conn, "users", "hashed_password", "VARCHAR")
+    await add_column(conn, "users", "salt", "VARCHAR")
+
+async def messages_read_and_channel(conn):
+    # was migrate_is_read.py, migrate_groups.py (the group tables come from create_all)
+    await add_column(conn, "messages", "is_read", "BOOLEAN DEFAULT FALSE")
+    await add_column(conn, "messages", "channel_id", "INTEGER REFERENCES channels(id)")
+
+async def message_actions(conn):
+    # was migrate_message_actions.py
+    await add_column(conn, "messages", "reply_to_msg_id", "INTEGER")
+    await add_column(conn, "messages", "fwd_from_id", "INTEGER")
+    await add_column(conn, "messages", "deleted_by_sender", "BOOLEAN DEFAULT FALSE")
+    await add_column(conn, "messages", "deleted_by_recipient", "BOOLEAN DEFAULT FALSE")
+
+def files_url(url):
+    # was migrate_urls.py: uploads are served (decrypted) by /api/files, not as static files
+    return url.replace("/static/uploads/", "/api/files/") if url else url
+
+def static_uploads(column_name):
+    return lambda table: table.c[column_name].like("%/static/uploads/%")
+
+def unkeyed_dms(table):
+    return (table.c.conversation_key.is_(None) & table.c.channel_id.is_(None)
+            & table.c.sender_id.isnot(None) & table.c.recipient_id.isnot(None))
+
+async def messages_conversation_key(conn):
+    await add_column(conn, "messages", "conversation_key", "BIGINT")
+
+async def unique_dialogs(conn):
+    # Duplicate (user, peer) rows could be created by concurrent sends: keep the newest one
+    await conn.execute(text(
+        "DELETE FROM dialogs WHERE id NOT IN (SELECT MAX(id) FROM dialogs GROUP BY user_id, peer_id)"
+    ))
+    await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_dialogs_user_id_peer_id ON dialogs (user_id, peer_id)"))
+
+async def superseded(conn):
+    pass
+
+async def drop_dm_pair_index(conn):
+    # Superseded by ix_messages_conversation_key_id
+    await conn.execute(text("DROP INDEX IF EXISTS ix_messages_dm_id"))
+
+# Handlers query DMs by conversation_key once this index exists (messages.dm_filter)
+CONVERSATION_KEY_INDEX = 10
+# Message search uses FTS5 once the index is built (messages.apply_search)
+FTS_INDEX = 13
+
+MIGRATIONS = [
+    Migration(1, "users profile columns", users_profile_columns),
+    Migration(2, "messages read flag and channel", messages_read_and_channel),
+    Migration(3, "message actions", message_actions),
+    # was migrate_history_indexes.py
+    CreateIndex(4, "ix_messages_channel_id_id", "messages", ["channel_id", "id"]),
+    # Was the (sender_id, recipient_id, id) index, replaced by step 10 before it was worth building
+    Migration(5, "ix_messages_dm_id (superseded by step 10)", superseded),
+    Backfill(6, "avatar urls to /api/files", "users", "avatar_url", files_url, where=static_uploads("avatar_url")),
+    Backfill(7, "media urls to /api/files", "messages", "media_url", files_url, where=static_uploads("media_url")),
+    Migration(8, "messages conversation key", messages_conversation_key),
+    Backfill(9, "conversation keys for existing DMs", "messages", "conversation_key", conversation_key,
+             where=unkeyed_dms, source=["sender_id", "recipient_id"]),
+    CreateIndex(CONVERSATION_KEY_INDEX, "ix_messages_conversation_key_id", "messages", ["conversation_key", "id"]),
+    Migration(11, "unique dialog per user and peer", unique_dialogs),
+    Migration(12, "drop ix_messages_dm_id", drop_dm_pair_index, online=True),
+    FtsIndex(FTS_INDEX, "messages full-text index"),
+]
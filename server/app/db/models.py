@@ -1,20 +1,13 @@
-import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, ForeignKey, Float, Index
+from app.db.engine import DEFAULT_DB_PATH, create_engine_from_settings, database_url
 
-# Robust path resolution:
-# Start fresh. We moved DB to C:\Users\Artyrka\samor_safe_db\samor.db to escape project watchers.
-# This path is OUTSIDE the project root, so uvicorn will never see changes.
-BASE_DIR = os.path.expanduser("~")
-DB_PATH = os.path.join(BASE_DIR, "samor_safe_db", "samor.db")
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+DB_PATH = DEFAULT_DB_PATH
+DATABASE_URL = database_url()
 
-# Ensure directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-print(f"🔹 Using SAFE Database Path: {DB_PATH}") # Debug print
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_engine_from_settings(DATABASE_URL)
+print(f"🔹 Using Database: {engine.url.render_as_string(hide_password=True)}") # Debug print
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
@@ -41,6 +34,18 @@ class Contact(Base):
     owner_id = Column(Integer, index=True) 
     contact_user_id = Column(Integer, index=True)
 
+def conversation_key(user_a: int, user_b: int) -> int:
+    # Direction-independent id of a DM: (smaller user id, larger user id) packed into 64 bits
+    low, high = sorted((user_a, user_b))
+    return (low << 32) | high
+
+def message_conversation_key(context):
+    # Column default: keys every DM on insert (ORM, Core and bulk inserts alike)
+    params = context.get_current_parameters()
+    if params.get("channel_id") is not None or params.get("sender_id") is None or params.get("recipient_id") is None:
+        return None
+    return conversation_key(params["sender_id"], params["recipient_id"])
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -48,6 +53,7 @@ class Message(Base):
     sender_id = Column(Integer, index=True)
     recipient_id = Column(Integer, index=True, nullable=True) # Start nullable for channel msgs
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=True, index=True) # New for groups
+    conversation_key = Column(BigInteger, nullable=True, default=message_conversation_key) # DMs only, see conversation_key()
     
     content = Column(String) 
     msg_type = Column(String, default="text") 
@@ -61,6 +67,12 @@ class Message(Base):
     
     created_at = Column(Float)
 
+    __table_args__ = (
+        # History pages: conversation + id, so a cursor is a single index range scan in either chat kind
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+        Index("ix_messages_conversation_key_id", "conversation_key", "id"),
+    )
+
 class Group(Base):
     __tablename__ = "groups"
     
@@ -105,14 +117,33 @@ class Dialog(Base):
     unread_count = Column(Integer, default=0)
     updated_at = Column(Float)
 
+    __table_args__ = (
+        # One dialog per (owner, peer): message.send looks it up on every message
+        Index("ux_dialogs_user_id_peer_id", "user_id", "peer_id", unique=True),
+    )
+
 class BannedEmail(Base):
     __tablename__ = "banned_emails"
     email = Column(String, primary_key=True, index=True)
     created_at = Column(Float)
 
+class SchemaMigration(Base):
+    # One row per migration step (app/db/migrations); applied_at stays NULL while a backfill is in progress
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(Float, nullable=True)
+    cursor = Column(Integer, nullable=True) # Last id processed by a batched backfill
+
 async def init_db():
+    from app.db.fts import ensure_fts
+    from app.db.migrations import migrator
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Schema steps only; index builds and backfills run in the background (migrator.start)
+    await migrator.upgrade(engine)
+    async with engine.begin() as conn:
+        await ensure_fts(conn)
 
 # Helper dependency
 async def get_db():
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.models import AsyncSessionLocal, Dialog, Message
+
+# Message write path shared by message.send (one transaction per message) and the
+# group-commit batcher (one transaction for every message sent within a few milliseconds).
+
+MESSAGE_FIELDS = ("sender_id", "recipient_id", "channel_id", "content", "msg_type", "media_url", "created_at", "reply_to_msg_id", "fwd_from_id")
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+dialog_upserts = {} # dialect name -> statement, built once (message.send hot path)
+
+def dialog_upsert(dialect_name: str):
+    stmt = dialog_upserts.get(dialect_name)
+    if stmt is None:
+        # INSERT ... ON CONFLICT: same API on both backends
+        insert_stmt = (postgresql if dialect_name == "postgresql" else sqlite).insert(Dialog)
+        stmt = dialog_upserts[dialect_name] = insert_stmt.on_conflict_do_update(
+            index_elements=[Dialog.user_id, Dialog.peer_id],
+            set_={
+                "last_message_id": insert_stmt.excluded.last_message_id,
+                "updated_at": insert_stmt.excluded.updated_at,
+                "unread_count": func.coalesce(Dialog.unread_count, 0) + insert_stmt.excluded.unread_count
+            }
+        )
+    return stmt
+
+def add_dialog_rows(dialogs: dict, sender_id: int, peer_id: int, last_message_id: int, now: float):
+    # Both sides of a DM point at the latest message, the recipient's unread count +1.
+    # Rows for the same dialog are merged, so a batch upserts each dialog once.
+    sides = [(peer_id, sender_id, 1)]
+    if peer_id != sender_id: # Saved messages: a single dialog
+        sides.append((sender_id, peer_id, 0))
+    for user_id, other_id, unread in sides:
+        row = dialogs.get((user_id, other_id))
+        if row is None:
+            dialogs[(user_id, other_id)] = {"user_id": user_id, "peer_id": other_id, "last_message_id": last_message_id, "unread_count": unread, "updated_at": now}
+        else:
+            row.update(last_message_id=last_message_id, updated_at=now)
+            row["unread_count"] += unread
+
+async def upsert_dialogs(db, dialogs: dict):
+    # Upserts on ux_dialogs_user_id_peer_id: concurrent sends can neither create a duplicate
+    # dialog nor lose an increment
+    if dialogs:
+        await db.execute(dialog_upsert(db.get_bind().dialect.name), list(dialogs.values()))
+
+async def insert_messages(db, rows: list) -> list:
+    # One INSERT for all rows (ids back in row order), one upsert for the dialogs they touch.
+    # The caller commits.
+    rows = [{field: row.get(field) for field in MESSAGE_FIELDS} for row in rows]
+    if db.get_bind().dialect.name == "postgresql":
+        res = await db.execute(insert(Message).returning(Message.id, sort_by_parameter_order=True), rows)
+        ids = res.scalars().all()
+    else:
+        # SQLite has no insert sentinel, so sort_by_parameter_order would mean one INSERT per row.
+        # A single INSERT allocates rowids in VALUES order under the write lock: sorted = row order.
+        res = await db.execute(insert(Message).returning(Message.id), rows)
+        ids = sorted(res.scalars().all())
+    dialogs = {}
+    for row, msg_id in zip(rows, ids):
+        if row["channel_id"] is None:
+            add_dialog_rows(dialogs, row["sender_id"], row["recipient_id"], msg_id, row["created_at"])
+    await upsert_dialogs(db, dialogs)
+    return ids
+
+class WriteBatcher:
+    """Group commit for message inserts (settings.WRITE_BATCHING).
+
+    Senders `submit` a message row and await its id. Rows arriving within `max_delay_ms` of
+    the first one (or until `max_size` are waiting) are inserted, their dialogs upserted and
+    committed in one transaction. While that commits, the next batch fills up.
+    """
+
+    def __init__(self, max_size: int = None, max_delay_ms: float = None):
+        self.max_size = max_size or settings.WRITE_BATCH_MAX_SIZE
+        self.max_delay = (max_delay_ms if max_delay_ms is not None else settings.WRITE_BATCH_MAX_DELAY_MS) / 1000
+        self.pending = [] # (row, future)
+        self.full = asyncio.Event()
+        self.task = None
+
+    async def submit(self, row: dict) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((row, future))
+        if len(self.pending) >= self.max_size:
+            self.full.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        while self.pending:
+            if len(self.pending) < self.max_size and self.max_delay > 0:
+                self.full.clear()
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.pending[:self.max_size]
+            del self.pending[:self.max_size]
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                ids = await insert_messages(db, [row for row, _ in batch])
+                await db.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                # One bad row must not fail everyone else's message: retry them one by one
+                print(f"Write batch of {len(batch)} failed, retrying singly: {e}")
+                for item in batch:
+                    await self._commit([item])
+                return
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        metrics.histogram("write_batch_size", buckets=BATCH_BUCKETS).observe(len(batch))
+        metrics.histogram("write_batch_commit_seconds").observe(time.perf_counter() - started)
+        for (_, future), msg_id in zip(batch, ids):
+            if not future.done(): # The sender may have gone away; the message is stored regardless
+                future.set_result(msg_id)
+
+    async def stop(self):
+        # Shutting down: let the current and queued batches commit
+        if self.task is not None:
+            self.full.set()
+            await self.task
+            self.task = None
+
+message_batcher = WriteBatcher()
@@ -0,0 +1,171 @@
+import time
+import traceback
+from app.core.directory import user_directory
+from app.core.hub import group_topic
+from app.core.metrics import metrics
+from app.core.presence import presence_tracker
+from app.core.profiles import profile_cache
+from app.core.resume import resume_store
+from app.core.session_manager import session_manager
+from app.db.models import AsyncSessionLocal, User, Message, Group, GroupMember, Channel, BannedEmail
+from app.handlers.calls import end_channel_calls
+from app.handlers.common import parse_int, serialize_user
+from app.handlers.messages import dm_filter, forget_channels
+from app.handlers.registry import registry
+from sqlalchemy.future import select
+from sqlalchemy import delete
+
+# --- ADMIN METHODS (Strictly for gtesla814@gmail.com) ---
+ADMIN_EMAIL = "gtesla814@gmail.com"
+
+def admin_method(name: str):
+    """Registers an admin RPC. The handler receives the DB session used for the access check."""
+    def decorator(handler):
+        async def guarded(session, args):
+            print(f"DEBUG: Processing admin method '{name}' for user_id={session.user_id}")
+            if not session.user_id:
+                return {"type": "error", "message": "Not authenticated"}
+
+            async with AsyncSessionLocal() as db:
+                res = await db.execute(select(User).where(User.id == session.user_id))
+                me = res.scalars().first()
+
+                # Case-insensitive and whitespace-tolerant check
+                user_email = ((me.email if me else None) or "").strip().lower()
+                if user_email != ADMIN_EMAIL:
+                    print(f"DEBUG: Access denied. Expected '{ADMIN_EMAIL}', got '{user_email}'")
+                    return {"type": "error", "message": f"Admin access denied: Email '{user_email}' is not authorized."}
+
+                try:
+                    return await handler(session, args, db)
+                except Exception as e:
+                    print(f"ADMIN ERROR: {e}")
+                    traceback.print_exc()
+                    return {"type": "error", "message": f"Admin Action Failed: {str(e)}"}
+
+        registry.register(name, guarded)
+        return handler
+    return decorator
+
+@admin_method("admin.users_get")
+async def users_get(session, args, db):
+    print("ADMIN: Fetching users (LIMIT 50)...")
+    res = await db.execute(select(User).order_by(User.id.desc()).limit(50))
+    users = res.scalars().all()
+
+    serialized_users = []
+    for u in users:
+        try:
+            serialized_users.append(serialize_user(u))
+        except Exception as ser_err:
+            print(f"ADMIN ERROR: Failed to serialize user {u.id}: {ser_err}")
+
+    return {"type": "admin.users_list", "users": serialized_users}
+
+@admin_method("admin.groups_get")
+async def groups_get(session, args, db):
+    res = await db.execute(select(Group).order_by(Group.id.desc()))
+    groups = res.scalars().all()
+    return {"type": "admin.groups_list", "groups": [{
+        "id": g.id,
+        "name": g.name,
+        "avatar_url": g.avatar_url,
+        "owner_id": g.owner_id,
+        "created_at": g.created_at
+    } for g in groups]}
+
+@admin_method("admin.user_ban")
+async def user_ban(session, args, db):
+    target_user_id = parse_int(args.get("user_id"))
+    print(f"ADMIN: Banning user {target_user_id}")
+    res = await db.execute(select(User).where(User.id == target_user_id))
+    target = res.scalars().first()
+    if not target:
+        return {"type": "error", "message": "User not found"}
+
+    email_to_ban = target.email
+    db.add(BannedEmail(email=email_to_ban, created_at=time.time()))
+    await db.execute(delete(GroupMember).where(GroupMember.user_id == target.id))
+    await db.delete(target)
+    await db.commit()
+    user_directory.remove(target.id)
+    profile_cache.invalidate(target.id)
+    resume_store.discard_user(target.id)
+    presence_tracker.forget(target.id)
+
+    # Only once the ban is stored: a failed commit must not leave the user kicked but not banned
+    for sess in session_manager.get_user_sessions(target.id):
+        if sess.websocket:
+            await sess.websocket.close(code=4001)
+        session_manager.remove_session(sess.session_id)
+    return {"type": "success", "message": f"User {email_to_ban} banned"}
+
+@admin_method("admin.group_delete")
+async def group_delete(session, args, db):
+    group_id = parse_int(args.get("group_id"))
+    print(f"ADMIN: Deleting group {group_id}")
+    res = await db.execute(select(Group).where(Group.id == group_id))
+    group = res.scalars().first()
+    if not group:
+        return {"type": "error", "message": "Group not found"}
+
+    await db.execute(delete(GroupMember).where(GroupMember.group_id == group_id))
+    res_ch = await db.execute(select(Channel).where(Channel.group_id == group_id))
+    ch_ids = [c.id for c in res_ch.scalars().all()]
+    if ch_ids:
+        await db.execute(delete(Message).where(Message.channel_id.in_(ch_ids)))
+        await db.execute(delete(Channel).where(Channel.id.in_(ch_ids)))
+    await db.delete(group)
+    await db.commit()
+    session_manager.drop_topic(group_topic(group_id))
+    forget_channels(ch_ids)
+    await end_channel_calls(ch_ids)
+    return {"type": "success", "message": "Group deleted"}
+
+@admin_method("admin.messages_get")
+async def messages_get(session, args, db):
+    peer1_id = int(args.get("peer1_id"))
+    peer2_id = int(args.get("peer2_id"))
+    print(f"ADMIN: Fetching logs between {peer1_id} and {peer2_id}")
+    res = await db.execute(select(Message).where(dm_filter(peer1_id, peer2_id)).order_by(Message.id.desc()).limit(100))
+    msgs = res.scalars().all()
+
+    msg_list = []
+    for m in msgs:
+        msg_list.append({
+            "id": m.id,
+            "sender_id": m.sender_id,
+            "content": m.content,
+            "created_at": m.created_at
+        })
+
+    return {"type": "admin.messages_list", "messages": msg_list}
+
+@admin_method("admin.banned_users_get")
+async def banned_users_get(session, args, db):
+    res = await db.execute(select(BannedEmail).order_by(BannedEmail.created_at.desc()))
+    banned_list = res.scalars().all()
+    return {"type": "admin.banned_list", "emails": [{
+        "email": b.email,
+        "created_at": b.created_at
+    } for b in banned_list]}
+
+@admin_method("admin.user_unban")
+async def user_unban(session, args, db):
+    email_to_unban = args.get("email")
+    if not email_to_unban:
+        return {"type": "error", "message": "Email required"}
+
+    print(f"ADMIN: Unbanning {email_to_unban}")
+    res = await db.execute(select(BannedEmail).where(BannedEmail.email == email_to_unban))
+    entry = res.scalars().first()
+    if not entry:
+        return {"type": "error", "message": "Email not found in ban list"}
+
+    await db.delete(entry)
+    await db.commit()
+    return {"type": "success", "message": f"Unbanned {email_to_unban}"}
+
+@admin_method("admin.metrics_get")
+async def metrics_get(session, args, db):
+    return {"type": "admin.metrics", "metrics": metrics.snapshot()}
@@ -0,0 +1,218 @@
+from app.core.hub import hub
+from app.core.profiles import profile_cache
+from app.db.models import AsyncSessionLocal, GroupMember, Channel
+from app.handlers.common import broadcast_event, parse_int, serialize_user
+from app.handlers.registry import registry
+from sqlalchemy.future import select
+
+# In-memory tracking for group calls: { channel_id: { user_id: user_info } }
+active_group_calls = {}
+# Per-group index of the above: { group_id: {channel_id, ...} } and back: { channel_id: group_id }
+group_call_channels = {}
+call_channel_groups = {}
+# In-memory tracking for P2P calls: { user_id: peer_id }
+active_p2p_calls = {}
+
+SIGNAL_METHODS = ["call.offer", "call.answer", "call.ice_candidate", "call.hangup", "call.reject"]
+
+async def group_member_ids(db, group_id: int):
+    m_stmt = select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+    m_res = await db.execute(m_stmt)
+    return m_res.scalars().all()
+
+def track_group_call(channel_id, group_id):
+    active_group_calls.setdefault(channel_id, {})
+    group_call_channels.setdefault(group_id, set()).add(channel_id)
+    call_channel_groups[channel_id] = group_id
+
+def end_group_call(channel_id):
+    active_group_calls.pop(channel_id, None)
+    group_id = call_channel_groups.pop(channel_id, None)
+    channels = group_call_channels.get(group_id)
+    if channels is not None:
+        channels.discard(channel_id)
+        if not channels:
+            del group_call_channels[group_id]
+    return group_id
+
+async def end_channel_calls(channel_ids):
+    # The channels were deleted (with their group): hang up whoever is still in a call there
+    for channel_id in channel_ids:
+        participants = active_group_calls.get(channel_id, {})
+        end_group_call(channel_id)
+        for pid in participants:
+            await broadcast_event(pid, "groups.call.ended", {"group_id": channel_id})
+
+def group_active_calls(group_id):
+    # { channel_id: participants } for the group's ongoing calls, without scanning every call
+    return {cid: active_group_calls[cid] for cid in group_call_channels.get(group_id, ())}
+
+async def get_channel(db, channel_id):
+    ch_res = await db.execute(select(Channel).where(Channel.id == channel_id))
+    return ch_res.scalar_one_or_none()
+
+def make_signal_handler(method: str):
+    async def relay_signal(session, args):
+        if not session.user_id:
+            return {"type": "error", "message": "Not authenticated"}
+
+        target_id = args.get("target_id")
+        if not target_id:
+            return {"type": "error", "message": "Target ID required"}
+
+        # Forward to all sessions of target user
+        print(f"Forwarding {method} from {session.user_id} to {target_id}")
+        forwarded = await hub.send_to_user(target_id, {
+            "type": method,
+            "sender_id": session.user_id,
+            "data": args.get("data") # SDP or ICE candidate or Reason
+        }) > 0
+
+        if not forwarded and method == "call.offer":
+            return {"type": "error", "message": "User is offline"}
+
+        # Track P2P calls for cleanup
+        if method in ["call.offer", "call.answer"]:
+            active_p2p_calls[session.user_id] = target_id
+        elif method in ["call.hangup", "call.reject"]:
+            active_p2p_calls.pop(session.user_id, None)
+            if active_p2p_calls.get(target_id) == session.user_id:
+                active_p2p_calls.pop(target_id, None)
+
+        return {"type": "success"}
+    return relay_signal
+
+for _method in SIGNAL_METHODS:
+    registry.register(_method, make_signal_handler(_method))
+
+@registry.method("groups.call.start")
+async def start_group_call(session, args):
+    channel_id = parse_int(args.get("group_id"))  # This is actually a channel_id
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not channel_id:
+        return {"type": "error", "message": "Channel ID required"}
+
+    # Get the actual group_id from the channel
+    async with AsyncSessionLocal() as db:
+        channel = await get_channel(db, channel_id)
+        if not channel:
+            return {"type": "error", "message": "Channel not found"}
+
+        actual_group_id = channel.group_id
+        track_group_call(channel_id, actual_group_id)
+
+        print(f"🎬 Starting call in channel {channel_id} (group {actual_group_id}) by user {session.user_id}")
+
+        # Notify all members of the GROUP that a call started
+        member_ids = await group_member_ids(db, actual_group_id)
+
+    print(f"📢 Broadcasting groups.call.started to {len(member_ids)} members: {member_ids}")
+    for mid in member_ids:
+        await broadcast_event(mid, "groups.call.started", {"group_id": channel_id, "started_by": session.user_id})
+
+    return {"type": "success"}
+
+@registry.method("groups.call.join")
+async def join_group_call(session, args):
+    channel_id = parse_int(args.get("group_id"))  # This is actually a channel_id
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not channel_id:
+        return {"type": "error", "message": "Channel ID required"}
+
+    # Get profile for others and actual group_id
+    async with AsyncSessionLocal() as db:
+        channel = await get_channel(db, channel_id)
+        if not channel:
+            return {"type": "error", "message": "Channel not found"}
+
+        actual_group_id = channel.group_id
+        track_group_call(channel_id, actual_group_id)
+
+        user = await profile_cache.get(db, session.user_id)
+        user_info = serialize_user(user, include_status=False)
+
+        # Participants BEFORE joining (re-joining just updates the entry)
+        participants = list(active_group_calls[channel_id].values())
+
+        active_group_calls[channel_id][session.user_id] = user_info
+
+        print(f"👤 User {session.user_id} joined call in channel {channel_id} (group {actual_group_id})")
+
+        # Notify ALL group members (not just call participants)
+        member_ids = await group_member_ids(db, actual_group_id)
+
+    print(f"📢 Broadcasting groups.call.member_joined to {len(member_ids)} members: {member_ids}")
+    for mid in member_ids:
+        if mid != session.user_id:
+            await broadcast_event(mid, "groups.call.member_joined", {"group_id": channel_id, "user": user_info})
+
+    return {"type": "groups.call.join_result", "group_id": channel_id, "participants": participants}
+
+@registry.method("groups.call.leave")
+async def leave_group_call(session, args):
+    channel_id = parse_int(args.get("group_id"))  # This is actually a channel_id
+
+    if channel_id not in active_group_calls:
+        print(f"DEBUG: channel_id {channel_id} not found in active_group_calls")
+        return {"type": "success"}
+
+    # Remove user from active call
+    active_group_calls[channel_id].pop(session.user_id, None)
+
+    # Notify ALL group members (not just call participants)
+    async with AsyncSessionLocal() as db:
+        channel = await get_channel(db, channel_id)
+        member_ids = await group_member_ids(db, channel.group_id) if channel else []
+
+    for mid in member_ids:
+        if mid != session.user_id:
+            await broadcast_event(mid, "groups.call.member_left", {"group_id": channel_id, "user_id": session.user_id})
+
+    # If no one left, end the call and notify all members
+    if not active_group_calls.get(channel_id):
+        end_group_call(channel_id)
+        print(f"DEBUG: Group call {channel_id} ended (no participants)")
+        for mid in member_ids:
+            await broadcast_event(mid, "groups.call.ended", {"group_id": channel_id})
+
+    return {"type": "success"}
+
+@registry.method("groups.call.signal")
+async def relay_group_signal(session, args):
+    group_id = args.get("group_id")
+    target_id = args.get("target_id")
+    signal_data = args.get("data")
+
+    if target_id and signal_data:
+        await broadcast_event(target_id, "groups.call.signal", {
+            "group_id": group_id,
+            "sender_id": session.user_id,
+            "data": signal_data
+        })
+    return {"type": "success"}
+
+async def cleanup_user_calls(uid: int):
+    # Called whenever an authenticated session closes
+
+    # 1-on-1 Call Cleanup
+    if uid in active_p2p_calls:
+        peer_id = active_p2p_calls.pop(uid)
+        if active_p2p_calls.get(peer_id) == uid:
+            active_p2p_calls.pop(peer_id, None)
+        await broadcast_event(peer_id, "call.hangup", {"sender_id": uid})
+
+    # Group Call Cleanup
+    for gid, participants in list(active_group_calls.items()):
+        if uid in participants:
+            del participants[uid]
+            if not participants:
+                group_id = end_group_call(gid)
+                async with AsyncSessionLocal() as db:
+                    member_ids = await group_member_ids(db, group_id)
+                for mid in member_ids:
+                    await broadcast_event(mid, "groups.call.ended", {"group_id": gid})
+            else:
+                for pid in participants:
+                    await broadcast_event(pid, "groups.call.member_left", {"group_id": gid, "user_id": uid})
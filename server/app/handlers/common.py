@@ -0,0 +1,98 @@
+from app.core.hub import hub, group_topic, presence_topic
+from app.core.presence import presence_tracker
+from app.core.profiles import Profile
+from app.core.session_manager import session_manager
+from app.db.models import AsyncSessionLocal, GroupMember, Contact, Dialog
+from sqlalchemy.future import select
+from sqlalchemy import union
+
+def parse_int(raw):
+    return int(raw) if raw is not None and str(raw).isdigit() else None
+
+async def broadcast_event(user_id: int, event_type: str, data: dict):
+    # Helper to send event to all sessions of a user.
+    # Dead or evicted sessions are cleaned up by their own connection handler.
+    await hub.send_to_user(user_id, {"type": event_type, **data})
+
+async def presence_peer_ids(db, user_id: int):
+    # Users whose status this user sees: contacts, dialog peers and members of shared groups
+    my_groups = select(GroupMember.group_id).where(GroupMember.user_id == user_id)
+    stmt = union(
+        select(Contact.contact_user_id).where(Contact.owner_id == user_id),
+        select(Dialog.peer_id).where(Dialog.user_id == user_id),
+        select(GroupMember.user_id).where(GroupMember.group_id.in_(my_groups))
+    )
+    res = await db.execute(stmt)
+    return [uid for uid in res.scalars().all() if uid is not None and uid != user_id]
+
+async def login_session(session, user_id: int):
+    # Bind an authenticated user to this socket and subscribe it to its group and presence topics
+    session_manager.bind_user(session, user_id)
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(select(GroupMember.group_id).where(GroupMember.user_id == user_id))
+        for gid in res.scalars().all():
+            session_manager.subscribe(session, group_topic(gid))
+        for peer_id in await presence_peer_ids(db, user_id):
+            session_manager.subscribe(session, presence_topic(peer_id))
+    await presence_tracker.user_online(user_id)
+
+def subscribe_user(user_id: int, topic: str):
+    # Live sessions of a user that just gained access to a topic
+    for sess in session_manager.get_user_sessions(user_id):
+        session_manager.subscribe(sess, topic)
+
+def watch_each_other(user_a: int, user_b: int):
+    # Incremental presence subscriptions, e.g. when a new dialog is opened
+    subscribe_user(user_a, presence_topic(user_b))
+    subscribe_user(user_b, presence_topic(user_a))
+
+def serialize_user(user, include_status=True):
+    if not user: return None
+
+    if isinstance(user, Profile):
+        # Cached profile: build the static part once, callers get their own copy
+        if user.public is None:
+            user.public = serialize_user_fields(user)
+        data = dict(user.public)
+    else:
+        data = serialize_user_fields(user)
+
+    if include_status:
+        data["is_online"] = presence_tracker.is_online(data["id"])
+        data["last_seen"] = getattr(user, 'last_seen', None)
+
+    return data
+
+def serialize_user_fields(user):
+    display_name = getattr(user, 'display_name', None)
+    username = getattr(user, 'username', None)
+    uid = getattr(user, 'id', 0)
+
+    if not display_name or display_name.strip() == "":
+        display_name = username or f"User {uid}"
+
+    return {
+        "id": uid,
+        "username": username or f"user{uid}",
+        "display_name": display_name,
+        "avatar_url": getattr(user, 'avatar_url', None),
+        "about": getattr(user, 'about', "") or "",
+        "phone_number": getattr(user, 'phone_number', None),
+        "email": getattr(user, 'email', None)
+    }
+
+def serialize_sender(user):
+    # Compact user info embedded in message objects
+    if isinstance(user, Profile):
+        if user.sender is None:
+            user.sender = serialize_sender_fields(user)
+        return dict(user.sender)
+    return serialize_sender_fields(user)
+
+def serialize_sender_fields(user):
+    return {
+        "id": user.id,
+        "display_name": user.display_name,
+        "username": user.username,
+        "avatar_url": user.avatar_url
+    }
@@ -0,0 +1,296 @@
+import time
+from app.core.hub import hub, group_topic
+from app.core.session_manager import session_manager
+from app.db.models import AsyncSessionLocal, User, Message, Group, GroupMember, Channel
+from app.handlers.calls import end_channel_calls, group_active_calls
+from app.handlers.common import parse_int, serialize_user, subscribe_user, watch_each_other
+from app.handlers.messages import forget_channels
+from app.handlers.registry import registry
+from sqlalchemy.future import select
+from sqlalchemy import delete, and_
+
+async def push_to_users(user_ids, payload: dict):
+    await hub.send_to_users(user_ids, payload)
+
+@registry.method("groups.create")
+async def create_group(session, args):
+    name = args.get("name")
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not name:
+        return {"type": "error", "message": "Group name required"}
+
+    async with AsyncSessionLocal() as db:
+        new_group = Group(
+            name=name,
+            owner_id=session.user_id,
+            avatar_url=args.get("avatar_url"),
+            created_at=time.time()
+        )
+        db.add(new_group)
+        await db.flush()
+
+        member = GroupMember(
+            group_id=new_group.id,
+            user_id=session.user_id,
+            role="owner",
+            joined_at=time.time()
+        )
+        db.add(member)
+
+        c1 = Channel(group_id=new_group.id, name="general", type="text", position=0)
+        c2 = Channel(group_id=new_group.id, name="General", type="voice", position=1)
+        db.add(c1)
+        db.add(c2)
+
+        await db.commit()
+        subscribe_user(session.user_id, group_topic(new_group.id))
+
+        return {
+            "type": "groups.create_success",
+            "group": {
+                "id": new_group.id,
+                "name": new_group.name,
+                "avatar_url": new_group.avatar_url,
+                "channels": [
+                    {"id": c1.id, "name": c1.name, "type": c1.type},
+                    {"id": c2.id, "name": c2.name, "type": c2.type}
+                ]
+            }
+        }
+
+@registry.method("groups.list")
+async def list_groups(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    async with AsyncSessionLocal() as db:
+        # One query: the user's groups with their channels (a group without channels yields one row)
+        stmt = (
+            select(Group, Channel)
+            .join(GroupMember, GroupMember.group_id == Group.id)
+            .outerjoin(Channel, Channel.group_id == Group.id)
+            .where(GroupMember.user_id == session.user_id)
+            .order_by(Group.id, Channel.position, Channel.id)
+        )
+        rows = (await db.execute(stmt)).all()
+
+    groups_by_id = {}
+    calls_by_group = {}
+    for g, c in rows:
+        group_info = groups_by_id.get(g.id)
+        if group_info is None:
+            group_info = groups_by_id[g.id] = {
+                "id": g.id,
+                "name": g.name,
+                "avatar_url": g.avatar_url,
+                "owner_id": g.owner_id,
+                "has_active_call": False,
+                "active_participants": [],
+                "channels": []
+            }
+            calls_by_group[g.id] = group_active_calls(g.id)
+        if c is None:
+            continue
+
+        call_info = calls_by_group[g.id].get(c.id)
+        has_call = call_info is not None
+        participants = list(call_info.values()) if has_call else []
+
+        group_info["channels"].append({
+            "id": c.id,
+            "name": c.name,
+            "type": c.type,
+            "has_active_call": has_call,
+            "active_participants": participants
+        })
+
+        if has_call:
+            group_info["has_active_call"] = True
+            group_info["active_participants"].extend(participants)
+
+    return {"type": "groups.list_result", "groups": list(groups_by_id.values())}
+
+@registry.method("groups.update")
+async def update_group(session, args):
+    group_id = parse_int(args.get("group_id"))
+    name = args.get("name")
+    avatar_url = args.get("avatar_url")
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not group_id:
+        return {"type": "error", "message": "Group ID required"}
+
+    async with AsyncSessionLocal() as db:
+        # Check role
+        m_stmt = select(GroupMember).where(and_(GroupMember.group_id == group_id, GroupMember.user_id == session.user_id))
+        m_res = await db.execute(m_stmt)
+        requester = m_res.scalars().first()
+
+        if not requester or requester.role not in ["owner", "admin"]:
+            return {"type": "error", "message": "No permission to update group"}
+
+        res = await db.execute(select(Group).where(Group.id == group_id))
+        group = res.scalars().first()
+        if not group:
+            response_data = {"type": "error", "message": "Group not found"}
+        else:
+            if name: group.name = name
+            if avatar_url: group.avatar_url = avatar_url
+            await db.commit()
+
+            response_data = {
+                "type": "groups.updated",
+                "group_id": group_id,
+                "name": group.name,
+                "avatar_url": group.avatar_url
+            }
+
+        # Broadcast to all members
+        m_stmt = select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+        m_res = await db.execute(m_stmt)
+        member_ids = m_res.scalars().all()
+
+    await push_to_users(member_ids, response_data)
+    return response_data
+
+@registry.method("groups.members.add")
+async def add_member(session, args):
+    group_id = parse_int(args.get("group_id"))
+    user_id = parse_int(args.get("user_id"))
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not group_id or not user_id:
+        return {"type": "error", "message": "Group ID and User ID required"}
+
+    async with AsyncSessionLocal() as db:
+        # Check if requester is owner/admin
+        res = await db.execute(select(GroupMember).where(and_(GroupMember.group_id == group_id, GroupMember.user_id == session.user_id)))
+        requester = res.scalars().first()
+
+        if not requester or requester.role not in ["owner", "admin"]:
+            return {"type": "error", "message": "No permission to add members"}
+
+        # Check if already member
+        res = await db.execute(select(GroupMember).where(and_(GroupMember.group_id == group_id, GroupMember.user_id == user_id)))
+        if res.scalars().first():
+            return {"type": "error", "message": "User already a member"}
+
+        new_member = GroupMember(
+            group_id=group_id,
+            user_id=user_id,
+            role="member",
+            joined_at=time.time()
+        )
+        db.add(new_member)
+        await db.commit()
+        subscribe_user(user_id, group_topic(group_id))
+
+        m_stmt = select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+        m_res = await db.execute(m_stmt)
+        member_ids = m_res.scalars().all()
+
+    # The new member and the existing ones now share a group, so they see each other's presence
+    for mid in member_ids:
+        if mid != user_id:
+            watch_each_other(mid, user_id)
+
+    # Notify the added user
+    await push_to_users([user_id], {"type": "groups.new_membership", "group_id": group_id})
+    # Broadcast to OTHER members that someone joined
+    await push_to_users(member_ids, {"type": "groups.member_joined", "group_id": group_id, "user_id": user_id})
+
+    return {"type": "groups.members.added", "group_id": group_id, "user_id": user_id}
+
+@registry.method("groups.members.list")
+async def list_members(session, args):
+    group_id = parse_int(args.get("group_id"))
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not group_id:
+        return {"type": "error", "message": "Group ID required"}
+
+    async with AsyncSessionLocal() as db:
+        # Verify membership
+        m_res = await db.execute(select(GroupMember).where(and_(GroupMember.group_id == group_id, GroupMember.user_id == session.user_id)))
+        if not m_res.scalars().first():
+            return {"type": "error", "message": "Not a member"}
+
+        res = await db.execute(select(User, GroupMember.role).join(GroupMember).where(GroupMember.group_id == group_id))
+        members = res.all()
+
+        members_list = []
+        for u, role in members:
+            u_data = serialize_user(u)
+            u_data["role"] = role
+            members_list.append(u_data)
+        return {"type": "groups.members.list_result", "group_id": group_id, "members": members_list}
+
+@registry.method("groups.channels.create")
+async def create_channel(session, args):
+    group_id = parse_int(args.get("group_id"))
+    name = args.get("name")
+    c_type = args.get("type", "text")
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not group_id:
+        return {"type": "error", "message": "Group ID required"}
+
+    async with AsyncSessionLocal() as db:
+        m_res = await db.execute(select(GroupMember).where(and_(GroupMember.group_id == group_id, GroupMember.user_id == session.user_id)))
+        if not m_res.scalars().first():
+            return {"type": "error", "message": "Not a member"}
+
+        new_channel = Channel(group_id=group_id, name=name, type=c_type, position=99)
+        db.add(new_channel)
+        await db.commit()
+
+        return {
+            "type": "groups.channel_created",
+            "group_id": group_id,
+            "channel": {"id": new_channel.id, "name": new_channel.name, "type": new_channel.type}
+        }
+
+@registry.method("groups.delete")
+async def delete_group(session, args):
+    group_id = parse_int(args.get("group_id"))
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not group_id:
+        return {"type": "error", "message": "Group ID required"}
+
+    async with AsyncSessionLocal() as db:
+        # 1. Verify Ownership
+        res = await db.execute(select(Group).where(Group.id == group_id))
+        group = res.scalars().first()
+
+        if not group:
+            return {"type": "error", "message": "Group not found"}
+        if group.owner_id != session.user_id:
+            return {"type": "error", "message": "Only the owner can delete the group"}
+
+        # 2. Get Members for Broadcast BEFORE deletion
+        m_stmt = select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+        m_res = await db.execute(m_stmt)
+        member_ids = m_res.scalars().all()
+
+        # 3. Manual cleanup, children first: foreign keys are enforced on both backends
+        channel_ids = (await db.execute(select(Channel.id).where(Channel.group_id == group_id))).scalars().all()
+        await db.execute(delete(Message).where(Message.channel_id.in_(channel_ids)))
+        await db.execute(delete(Channel).where(Channel.group_id == group_id))
+        await db.execute(delete(GroupMember).where(GroupMember.group_id == group_id))
+        await db.delete(group)
+        await db.commit()
+
+    session_manager.drop_topic(group_topic(group_id))
+    forget_channels(channel_ids)
+    await end_channel_calls(channel_ids)
+
+    # 4. Broadcast (the owner gets the direct response)
+    await push_to_users([mid for mid in member_ids if mid != session.user_id], {"type": "groups.deleted", "group_id": group_id})
+
+    return {"type": "groups.deleted", "group_id": group_id}
@@ -0,0 +1,631 @@
+import time
+from app.core.hub import hub, group_topic
+from app.core.profiles import profile_cache
+from app.core.config import settings
+from app.db import fts, writes
+from app.db.migrations import CONVERSATION_KEY_INDEX, FTS_INDEX, migrator
+from app.db.models import AsyncSessionLocal, User, Message, Dialog, Channel, Group, GroupMember, conversation_key
+from app.handlers.common import broadcast_event, parse_int, serialize_sender, serialize_user, watch_each_other
+from app.handlers.registry import registry
+from sqlalchemy.future import select
+from sqlalchemy import update, or_, and_, case, func
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 100
+GLOBAL_SEARCH_CHATS = 20 # Chats per page of a global search
+GLOBAL_SEARCH_PER_CHAT = 3 # Hits shown per chat; more via a scoped search with next_offset
+
+def dm_filter(user_id: int, peer_id: int):
+    # Messages exchanged between two users, in either direction: one range of ix_messages_conversation_key_id
+    if migrator.is_applied(CONVERSATION_KEY_INDEX):
+        return Message.conversation_key == conversation_key(user_id, peer_id)
+    # Older rows are still being keyed (migration backfill): match the pair both ways
+    return or_(
+        and_(Message.sender_id == user_id, Message.recipient_id == peer_id),
+        and_(Message.sender_id == peer_id, Message.recipient_id == user_id)
+    )
+
+def visible_to(user_id: int):
+    # Hides messages this user deleted "for me" (soft delete)
+    return and_(
+        or_(Message.sender_id != user_id, Message.deleted_by_sender.is_not(True)),
+        or_(Message.recipient_id.is_(None), Message.recipient_id != user_id, Message.deleted_by_recipient.is_not(True))
+    )
+
+@registry.method("dialogs.get")
+async def get_dialogs(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    limit = parse_int(args.get("limit"))
+    try:
+        offset_date = float(args["offset_date"]) if args.get("offset_date") is not None else None
+    except (TypeError, ValueError):
+        return {"type": "error", "message": "Invalid offset_date"}
+    offset_id = parse_int(args.get("offset_id"))
+
+    async with AsyncSessionLocal() as db:
+        # One query: dialogs joined with their peer and last message (dialogs without a peer are skipped)
+        stmt = (
+            select(Dialog, User, Message.content, Message.msg_type)
+            .join(User, User.id == Dialog.peer_id)
+            .outerjoin(Message, Message.id == Dialog.last_message_id)
+            .where(Dialog.user_id == session.user_id)
+            .order_by(Dialog.updated_at.desc(), Dialog.id.desc())
+        )
+        if offset_date is not None:
+            # Next page: dialogs after the last one the client has, in (updated_at, id) order, so
+            # dialogs updated at the same moment are neither skipped nor repeated
+            older = Dialog.updated_at < offset_date
+            if offset_id is not None:
+                older = or_(older, and_(Dialog.updated_at == offset_date, Dialog.id < offset_id))
+            stmt = stmt.where(older)
+        if limit:
+            stmt = stmt.limit(limit + 1)
+        rows = (await db.execute(stmt)).all()
+
+        has_more = bool(limit) and len(rows) > limit
+        dialog_list = []
+        for d, peer, content, msg_type in rows[:limit or None]:
+            msg_content = ""
+            if msg_type is not None:
+                msg_content = content if msg_type == "text" else f"[{msg_type}]"
+
+            dialog_list.append({
+                "id": d.id,
+                "peer": serialize_user(peer),
+                "last_message": msg_content,
+                "unread_count": d.unread_count,
+                "updated_at": d.updated_at
+            })
+
+        response_data = {"type": "dialogs.list", "dialogs": dialog_list, "has_more": has_more}
+        if has_more:
+            response_data["next_offset_date"] = dialog_list[-1]["updated_at"]
+            response_data["next_offset_id"] = dialog_list[-1]["id"]
+        return response_data
+
+@registry.method("messages.get_history")
+async def get_history(session, args):
+    peer_id = parse_int(args.get("peer_id"))
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    channel_id = parse_int(args.get("channel_id"))
+    before_id = parse_int(args.get("before_id"))
+    after_id = parse_int(args.get("after_id"))
+    limit = min(max(parse_int(args.get("limit")) or HISTORY_PAGE_SIZE, 1), MAX_HISTORY_PAGE_SIZE)
+    if peer_id is None and not channel_id:
+        # Neither a chat nor a channel: an empty history, as before conversation keys
+        return {
+            "type": "messages.history", "messages": [], "peer_id": None, "has_more": False,
+            "next_before_id": before_id, "next_after_id": after_id, "before_id": before_id, "after_id": after_id
+        }
+
+    try:
+        async with AsyncSessionLocal() as db:
+            if peer_id is None and channel_id: # Channel Message
+                stmt = select(Message).where(Message.channel_id == channel_id)
+            else:
+                stmt = select(Message).where(dm_filter(session.user_id, peer_id))
+            stmt = stmt.where(visible_to(session.user_id))
+
+            # Keyset pagination on id: one extra row tells whether there is another page.
+            # Default (and before_id) pages walk back from the newest message, after_id walks forward.
+            if after_id is not None and before_id is None:
+                stmt = stmt.where(Message.id > after_id).order_by(Message.id.asc())
+            else:
+                if before_id is not None:
+                    stmt = stmt.where(Message.id < before_id)
+                if after_id is not None:
+                    stmt = stmt.where(Message.id > after_id)
+                stmt = stmt.order_by(Message.id.desc())
+
+            result = await db.execute(stmt.limit(limit + 1))
+            all_msgs = result.scalars().all()
+            has_more = len(all_msgs) > limit
+            all_msgs = all_msgs[:limit]
+            if not (after_id is not None and before_id is None):
+                all_msgs.reverse()
+
+            # Sender and forwarded-from details (profile cache, one query for the misses)
+            users = await load_senders(db, all_msgs)
+            sender_map = {uid: serialize_sender(u) for uid, u in users.items()}
+
+            msgs_out = []
+            for m in all_msgs:
+                fwd_from_user = sender_map.get(m.fwd_from_id) if m.fwd_from_id else None
+
+                msgs_out.append({
+                    "id": m.id,
+                    "sender_id": m.sender_id,
+                    "sender": sender_map.get(m.sender_id),
+                    "content": m.content,
+                    "type": m.msg_type,
+                    "media_url": m.media_url,
+                    "is_read": m.is_read,
+                    "created_at": m.created_at,
+                    "reply_to_msg_id": m.reply_to_msg_id,
+                    "fwd_from_id": m.fwd_from_id,
+                    "fwd_from_user": fwd_from_user
+                })
+
+            response_data = {
+                "type": "messages.history",
+                "messages": msgs_out, # Oldest first
+                "peer_id": peer_id,
+                "has_more": has_more, # More messages in the requested direction
+                "next_before_id": msgs_out[0]["id"] if msgs_out else before_id,
+                "next_after_id": msgs_out[-1]["id"] if msgs_out else after_id,
+                "before_id": before_id,
+                "after_id": after_id
+            }
+            if peer_id is None and channel_id:
+                response_data["channel_id"] = channel_id
+            return response_data
+    except Exception as e:
+        print(f"Error getting history: {e}")
+        return {"type": "error", "message": "Failed to load history"}
+
+def apply_search(stmt, query: str, filter_type: str):
+    # Adds the text query and filter_type to a Message select; returns (stmt, rank), lower rank first
+    use_fts = fts.fts_enabled and migrator.is_applied(FTS_INDEX) # LIKE until the index is built
+    match = fts.fts_query(query) if use_fts else ""
+    if filter_type in ["photo", "video", "voice", "file"]:
+        stmt = stmt.where(Message.msg_type == filter_type)
+    elif filter_type == "link":
+        stmt = stmt.where(Message.content.like("%http%"))
+        if use_fts:
+            # URLs tokenize to "http"/"https" + host parts, so the index narrows the LIKE down
+            match = f"{match} http*".strip()
+
+    # Text Query: FTS5 with BM25 ranking, newest first when there is nothing to rank
+    if match:
+        stmt = stmt.join(fts.messages_fts, fts.messages_fts.c.rowid == Message.id).where(fts.fts_match(match))
+        return stmt, fts.fts_rank()
+    if query:
+        stmt = stmt.where(Message.content.ilike(f"%{query}%"))
+    return stmt, -Message.id
+
+async def load_senders(db, msgs, extra_ids=()):
+    # Every sender / forwarded-from user of a result page, from the profile cache
+    user_ids = {m.sender_id for m in msgs} | {m.fwd_from_id for m in msgs if m.fwd_from_id} | set(extra_ids)
+    return await profile_cache.get_many(db, user_ids)
+
+def search_hit(m, users: dict):
+    sender = users.get(m.sender_id)
+    fwd_from = users.get(m.fwd_from_id) if m.fwd_from_id else None
+    return {
+        "id": m.id,
+        "sender_id": m.sender_id,
+        "sender": serialize_sender(sender) if sender else None,
+        "content": m.content,
+        "type": m.msg_type,
+        "media_url": m.media_url,
+        "created_at": m.created_at,
+        "fwd_from_id": m.fwd_from_id,
+        "fwd_from_user": serialize_sender(fwd_from) if fwd_from else None
+    }
+
+@registry.method("messages.search")
+async def search(session, args):
+    peer_id = parse_int(args.get("peer_id"))
+    channel_id = parse_int(args.get("channel_id"))
+    query = args.get("query", "")
+    filter_type = args.get("filter_type") # photo, video, voice, file, link
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not peer_id and not channel_id:
+        if args.get("scope") == "global":
+            return await search_global(session, query, filter_type, args)
+        return {"type": "messages.search_result", "messages": []}
+
+    limit = min(max(parse_int(args.get("limit")) or SEARCH_PAGE_SIZE, 1), MAX_SEARCH_PAGE_SIZE)
+    offset = parse_int(args.get("offset")) or 0
+
+    try:
+        async with AsyncSessionLocal() as db:
+            # Context (Chat or Channel)
+            if channel_id:
+                stmt = select(Message).where(Message.channel_id == channel_id)
+            else:
+                stmt = select(Message).where(dm_filter(session.user_id, peer_id))
+
+            stmt = stmt.where(visible_to(session.user_id))
+            stmt, rank = apply_search(stmt, query, filter_type)
+
+            # Ranked results page by offset; one extra row tells whether there is another page
+            result = await db.execute(stmt.order_by(rank, Message.id.desc()).offset(offset).limit(limit + 1))
+            msgs = result.scalars().all()
+            has_more = len(msgs) > limit
+            msgs = msgs[:limit]
+
+            users = await load_senders(db, msgs)
+            msgs_out = [search_hit(m, users) for m in msgs]
+
+            return {
+                "type": "messages.search_result",
+                "messages": msgs_out,
+                "filter": filter_type,
+                "has_more": has_more,
+                "next_offset": offset + len(msgs) if has_more else None
+            }
+    except Exception as e:
+        print(f"Search error: {e}")
+        return {"type": "error", "message": "Search failed"}
+
+async def search_global(session, query: str, filter_type: str, args):
+    # Every DM and member channel of the caller, grouped by chat: best chats first, each with
+    # its top GLOBAL_SEARCH_PER_CHAT hits. Ranking, grouping and paging run in one index query.
+    uid = session.user_id
+    chat_limit = min(max(parse_int(args.get("limit")) or GLOBAL_SEARCH_CHATS, 1), MAX_SEARCH_PAGE_SIZE)
+    per_chat = min(max(parse_int(args.get("per_chat_limit")) or GLOBAL_SEARCH_PER_CHAT, 1), MAX_SEARCH_PAGE_SIZE)
+    offset = parse_int(args.get("offset")) or 0 # In chats
+    if not fts.fts_query(query) and not filter_type:
+        return {"type": "messages.search_global_result", "groups": [], "has_more": False, "next_offset": None}
+
+    member_channels = (
+        select(Channel.id)
+        .join(GroupMember, GroupMember.group_id == Channel.group_id)
+        .where(GroupMember.user_id == uid)
+    )
+    chat_peer = case(
+        (Message.channel_id.is_not(None), None),
+        (Message.sender_id == uid, Message.recipient_id),
+        else_=Message.sender_id
+    )
+
+    try:
+        async with AsyncSessionLocal() as db:
+            stmt = select(Message.id, Message.channel_id, chat_peer.label("chat_peer")).where(
+                or_(
+                    Message.channel_id.in_(member_channels),
+                    and_(Message.channel_id.is_(None), or_(Message.sender_id == uid, Message.recipient_id == uid))
+                ),
+                visible_to(uid)
+            )
+            stmt, rank = apply_search(stmt, query, filter_type)
+            hits = stmt.add_columns(rank.label("rank")).subquery()
+
+            chat = (hits.c.channel_id, hits.c.chat_peer)
+            ranked = select(
+                hits,
+                func.row_number().over(partition_by=chat, order_by=(hits.c.rank, hits.c.id.desc())).label("rn"),
+                func.min(hits.c.rank).over(partition_by=chat).label("chat_rank")
+            ).subquery()
+            numbered = select(
+                ranked,
+                func.dense_rank().over(order_by=(ranked.c.chat_rank, ranked.c.channel_id, ranked.c.chat_peer)).label("chat_no")
+            ).where(ranked.c.rn <= per_chat + 1).subquery()
+
+            rows = (await db.execute(
+                select(Message, numbered.c.chat_peer, numbered.c.rn, numbered.c.chat_no)
+                .join(numbered, numbered.c.id == Message.id)
+                .where(numbered.c.chat_no > offset, numbered.c.chat_no <= offset + chat_limit + 1)
+                .order_by(numbered.c.chat_no, numbered.c.rn)
+            )).all()
+
+            has_more = any(chat_no > offset + chat_limit for *_, chat_no in rows)
+            rows = [row for row in rows if row[3] <= offset + chat_limit]
+            msgs = [m for m, _, rn, _ in rows if rn <= per_chat]
+
+            users = await load_senders(db, msgs, [peer for _, peer, _, _ in rows if peer])
+            channel_ids = {m.channel_id for m in msgs if m.channel_id}
+            channels = {}
+            if channel_ids:
+                c_res = await db.execute(
+                    select(Channel, Group.name).join(Group, Group.id == Channel.group_id).where(Channel.id.in_(channel_ids))
+                )
+                channels = {c.id: (c, group_name) for c, group_name in c_res.all()}
+
+        groups_out = []
+        by_chat = {}
+        for m, peer, rn, chat_no in rows:
+            group_info = by_chat.get(chat_no)
+            if group_info is None:
+                if m.channel_id:
+                    c, group_name = channels.get(m.channel_id, (None, None))
+                    group_info = {
+                        "channel_id": m.channel_id,
+                        "channel_name": c.name if c else None,
+                        "group_id": c.group_id if c else None,
+                        "group_name": group_name
+                    }
+                else:
+                    peer_user = users.get(peer)
+                    group_info = {"peer_id": peer, "peer": serialize_user(peer_user) if peer_user else None}
+                group_info.update({"messages": [], "has_more": False, "next_offset": None})
+                by_chat[chat_no] = group_info
+                groups_out.append(group_info)
+            if rn <= per_chat:
+                group_info["messages"].append(search_hit(m, users))
+            else:
+                # Continue this chat with a scoped messages.search (same ranking) from next_offset
+                group_info["has_more"] = True
+                group_info["next_offset"] = per_chat
+
+        return {
+            "type": "messages.search_global_result",
+            "groups": groups_out,
+            "filter": filter_type,
+            "has_more": has_more,
+            "next_offset": offset + chat_limit if has_more else None
+        }
+    except Exception as e:
+        print(f"Global search error: {e}")
+        return {"type": "error", "message": "Search failed"}
+
+@registry.method("messages.delete")
+async def delete_messages(session, args):
+    msg_ids = [int(mid) for mid in args.get("message_ids", []) if str(mid).isdigit()]
+    delete_for_all = args.get("delete_for_all", False)
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    async with AsyncSessionLocal() as db:
+        # Fetch messages to check ownership and existence
+        stmt = select(Message).where(Message.id.in_(msg_ids))
+        res = await db.execute(stmt)
+        messages_to_process = res.scalars().all()
+
+        deleted_ids = []
+        hard_deleted = []
+        peers_to_notify = set()
+
+        for m in messages_to_process:
+            is_sender = m.sender_id == session.user_id
+            is_recipient = m.recipient_id == session.user_id
+
+            if not (is_sender or is_recipient):
+                continue
+
+            if delete_for_all and is_sender:
+                # Hard delete for everyone
+                hard_deleted.append(m)
+                deleted_ids.append(m.id)
+                peers_to_notify.add(m.recipient_id)
+                peers_to_notify.add(session.user_id) # Simplify broadcast
+            else:
+                # Soft delete / Hide
+                if is_sender:
+                    m.deleted_by_sender = True
+                if is_recipient:
+                    m.deleted_by_recipient = True
+                deleted_ids.append(m.id)
+                # No need to notify peer if only "for me"; the frontend removes it from view.
+
+        if hard_deleted:
+            # Dialog.last_message_id is a foreign key: unlink before deleting
+            await db.execute(
+                update(Dialog)
+                .where(Dialog.last_message_id.in_([m.id for m in hard_deleted]))
+                .values(last_message_id=None)
+            )
+            for m in hard_deleted:
+                await db.delete(m)
+
+        await db.commit()
+
+    if delete_for_all:
+        # Broadcast deletion
+        for uid in peers_to_notify:
+            await broadcast_event(uid, "messages.deleted", {"ids": deleted_ids})
+
+    return {"type": "messages.deleted", "ids": deleted_ids}
+
+channel_groups = {} # channel_id -> group_id; channels never change groups, dropped with the group
+
+async def channel_group_id(db, channel_id: int):
+    # Channel pushes go to the owning group's topic
+    group_id = channel_groups.get(channel_id)
+    if group_id is None:
+        res = await db.execute(select(Channel.group_id).where(Channel.id == channel_id))
+        group_id = res.scalar_one_or_none()
+        if group_id is not None:
+            channel_groups[channel_id] = group_id
+    return group_id
+
+def forget_channels(channel_ids):
+    for channel_id in channel_ids:
+        channel_groups.pop(channel_id, None)
+
+@registry.method("messages.forward")
+async def forward_messages(session, args):
+    msg_ids = [int(mid) for mid in args.get("message_ids", []) if str(mid).isdigit()]
+    peer_id = parse_int(args.get("peer_id"))
+    channel_id = parse_int(args.get("channel_id"))
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not peer_id and not channel_id:
+        return {"type": "error", "message": "Recipient or Channel required"}
+
+    try:
+        async with AsyncSessionLocal() as db:
+            # Fetch originals
+            stmt = select(Message).where(Message.id.in_(msg_ids))
+            res = await db.execute(stmt)
+            originals = res.scalars().all()
+
+            now = time.time()
+            rows = [{
+                "sender_id": session.user_id,
+                "recipient_id": peer_id,
+                "channel_id": channel_id,
+                "content": orig.content,
+                "msg_type": orig.msg_type,
+                "media_url": orig.media_url,
+                "created_at": now,
+                "fwd_from_id": orig.fwd_from_id or orig.sender_id
+            } for orig in originals]
+
+            group_id = await channel_group_id(db, channel_id) if channel_id else None
+            users = await profile_cache.get_many(db, {row["fwd_from_id"] for row in rows})
+
+            # One INSERT for all copies, one upsert for the dialog (DMs)
+            ids = await writes.insert_messages(db, rows) if rows else []
+            await db.commit()
+
+        if peer_id and not channel_id:
+            watch_each_other(session.user_id, peer_id)
+
+        # Broadcast and Response
+        msgs_out = []
+        for row, msg_id in zip(rows, ids):
+            fwd_from = users.get(row["fwd_from_id"])
+            fwd_from_user = serialize_sender(fwd_from) if fwd_from else None
+
+            msg_obj = {
+                "id": msg_id,
+                "sender_id": session.user_id,
+                "content": row["content"],
+                "type": row["msg_type"],
+                "media_url": row["media_url"],
+                "is_read": False,
+                "created_at": row["created_at"],
+                "fwd_from_id": row["fwd_from_id"],
+                "fwd_from_user": fwd_from_user
+            }
+            if channel_id: msg_obj["channel_id"] = channel_id
+            msgs_out.append(msg_obj)
+
+            if not channel_id:
+                # DM Broadcast
+                await broadcast_event(peer_id, "message.new", {
+                    "message": msg_obj,
+                    "peer_id": session.user_id,
+                    "sender_id": session.user_id
+                })
+            elif group_id is not None:
+                # Channel Broadcast
+                await hub.publish(group_topic(group_id), {
+                    "type": "message.new",
+                    "message": msg_obj,
+                    "channel_id": channel_id,
+                    "sender_id": session.user_id
+                }, exclude=session.user_id)
+
+        return {"type": "messages.forward_done", "count": len(msgs_out)}
+    except Exception as e:
+        print(f"Forward error: {e}")
+        return {"type": "error", "message": "Forward failed"}
+
+@registry.method("messages.read")
+async def read_messages(session, args):
+    peer_id = parse_int(args.get("peer_id"))
+    max_id = parse_int(args.get("max_id")) # Optional, mark all up to this ID
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not peer_id:
+        return {"type": "error", "message": "Peer ID required"}
+
+    async with AsyncSessionLocal() as db:
+        # 1. Update Messages (User is Recipient, Peer is Sender)
+        # Mark messages FROM peer TO me as read
+        stmt = update(Message).where(
+            dm_filter(session.user_id, peer_id),
+            Message.sender_id == peer_id,
+            Message.is_read == False
+        ).values(is_read=True)
+        if max_id:
+            stmt = stmt.where(Message.id <= max_id)
+
+        await db.execute(stmt)
+
+        # 2. Update My Dialog (unread_count = 0)
+        # Actually we should count real unread? For MVP set to 0
+        stmt_d = update(Dialog).where(
+            and_(Dialog.user_id == session.user_id, Dialog.peer_id == peer_id)
+        ).values(unread_count=0)
+        await db.execute(stmt_d)
+
+        await db.commit()
+
+    # 3. Broadcast to Peer (Sender) that I read their messages
+    await hub.send_to_user(peer_id, {
+        "type": "messages.read",
+        "peer_id": session.user_id # I am the one who read
+    })
+
+    # 4. The reader's own sidebar count updates off 'messages.read_done'
+    return {"type": "messages.read_done", "peer_id": peer_id}
+
+@registry.method("message.send")
+async def send_message(session, args):
+    msg_type = args.get("type", "text")
+    recipient_id = parse_int(args.get("peer_id"))
+    channel_id = parse_int(args.get("channel_id"))
+    content = args.get("text")
+    reply_to_msg_id = parse_int(args.get("reply_to_msg_id"))
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not recipient_id and not channel_id:
+        return {"type": "error", "message": "No recipient or channel"}
+
+    # 1. Save Message
+    row = {
+        "sender_id": session.user_id,
+        "recipient_id": recipient_id,
+        "channel_id": channel_id,
+        "content": content,
+        "msg_type": msg_type,
+        "created_at": time.time(),
+        "reply_to_msg_id": reply_to_msg_id
+    }
+
+    # Handle Media
+    if msg_type in ["photo", "voice", "video", "file"]:
+        row["media_url"] = args.get("content")
+        row["content"] = args.get("caption", content or msg_type.capitalize())
+
+    # One transaction: the message INSERT (id via RETURNING) and the dialog upsert. With
+    # WRITE_BATCHING, shared with every message sent in the same few milliseconds (group commit).
+    # Sender profile and channel -> group come from memory once warm, and everything echoed back
+    # is already in hand, so nothing is re-read.
+    async with AsyncSessionLocal() as db:
+        group_id = await channel_group_id(db, channel_id) if channel_id else None
+        me = await profile_cache.get(db, session.user_id)
+        if not settings.WRITE_BATCHING:
+            msg_id, = await writes.insert_messages(db, [row])
+            await db.commit()
+    if settings.WRITE_BATCHING:
+        msg_id = await writes.message_batcher.submit(row)
+
+    if not channel_id:
+        # Dialog peers watch each other's presence (as set up at connect); idempotent, in memory
+        watch_each_other(session.user_id, recipient_id)
+
+    sender_info = serialize_user(me, include_status=False)
+
+    msg_obj = {
+        "sender": sender_info,
+        "id": msg_id,
+        "sender_id": session.user_id,
+        "content": row["content"],
+        "type": msg_type,
+        "media_url": row.get("media_url"),
+        "is_read": False,
+        "created_at": row["created_at"],
+        "reply_to_msg_id": reply_to_msg_id
+    }
+    if channel_id: msg_obj["channel_id"] = channel_id
+
+    if not channel_id:
+        # Broadcast to Recipient
+        push_wrapper = { "type": "message.new", "message": msg_obj, "peer_id": session.user_id, "sender_id": session.user_id }
+        await hub.send_to_user(recipient_id, push_wrapper)
+
+        return {"type": "message.new", "message": msg_obj, "peer_id": recipient_id}
+
+    # Channel Broadcasting
+    if group_id is not None:
+        push_wrapper = { "type": "message.new", "message": msg_obj, "channel_id": channel_id, "sender_id": session.user_id }
+        await hub.publish(group_topic(group_id), push_wrapper, exclude=session.user_id)
+
+    return {"type": "message.new", "message": msg_obj, "channel_id": channel_id}
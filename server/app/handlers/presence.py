@@ -0,0 +1,35 @@
+from app.core.hub import presence_topic
+from app.core.presence import presence_tracker
+from app.core.session_manager import session_manager
+from app.handlers.registry import registry
+
+# Explicit subscriptions on top of contacts / dialogs / shared groups (e.g. an opened profile)
+MAX_PRESENCE_SUBSCRIBE = 200
+
+def parse_user_ids(args):
+    raw = args.get("user_ids") or []
+    return [int(uid) for uid in raw[:MAX_PRESENCE_SUBSCRIBE] if str(uid).isdigit()]
+
+@registry.method("presence.subscribe")
+async def subscribe(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    user_ids = parse_user_ids(args)
+    for uid in user_ids:
+        session_manager.subscribe(session, presence_topic(uid))
+
+    # Current state, so the client doesn't wait for the next change
+    return {"type": "presence.subscribed", "users": [{
+        "user_id": uid,
+        "status": "online" if presence_tracker.is_online(uid) else "offline"
+    } for uid in user_ids]}
+
+@registry.method("presence.unsubscribe")
+async def unsubscribe(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    for uid in parse_user_ids(args):
+        session_manager.unsubscribe(session, presence_topic(uid))
+    return {"type": "success"}
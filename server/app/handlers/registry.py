@@ -0,0 +1,51 @@
+import time
+from typing import Awaitable, Callable, Dict
+from app.core.metrics import metrics
+
+# RPC method table for the WebSocket loop.
+# Handlers are `async def handler(session, args) -> dict` and return the response payload.
+# Domain modules (auth, users, messages, groups, calls, admin) register themselves on import.
+
+Handler = Callable[..., Awaitable[dict]]
+
+class RpcRegistry:
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+
+    def register(self, name: str, handler: Handler):
+        if name in self._handlers:
+            raise ValueError(f"RPC method '{name}' is already registered")
+        self._handlers[name] = handler
+
+    def method(self, *names: str):
+        """Decorator: @registry.method("messages.send", ...)"""
+        def decorator(handler: Handler) -> Handler:
+            for name in names:
+                self.register(name, handler)
+            return handler
+        return decorator
+
+    def methods(self):
+        return sorted(self._handlers)
+
+    async def dispatch(self, session, method: str, args: dict) -> dict:
+        handler = self._handlers.get(method)
+        if handler is None:
+            metrics.counter("rpc_unknown_total").inc()
+            return {"type": "error", "message": "Unknown method"}
+
+        metrics.counter("rpc_calls_total", method=method).inc()
+        started = time.perf_counter()
+        try:
+            response = await handler(session, args)
+        except Exception:
+            metrics.counter("rpc_errors_total", method=method).inc()
+            raise
+        finally:
+            metrics.histogram("rpc_latency_seconds", method=method).observe(time.perf_counter() - started)
+
+        if response and response.get("type") == "error":
+            metrics.counter("rpc_errors_total", method=method).inc()
+        return response
+
+registry = RpcRegistry()
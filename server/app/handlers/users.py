@@ -0,0 +1,212 @@
+import random
+import re
+from app.auth.passwords import password_hasher
+from app.core.directory import user_directory
+from app.core.email import send_email
+from app.core.profiles import profile_cache
+from app.db.models import AsyncSessionLocal, User, Contact
+from app.core.hub import presence_topic
+from app.handlers.common import parse_int, serialize_user, subscribe_user
+from app.handlers.registry import registry
+from sqlalchemy.future import select
+from sqlalchemy import update, and_
+
+USER_SEARCH_PAGE_SIZE = 20
+USER_LIST_PAGE_SIZE = 100
+
+async def load_users_in_order(db, user_ids):
+    # Profile cache (one IN query for the misses), returned in the directory's ranking order
+    by_id = await profile_cache.get_many(db, user_ids)
+    return [by_id[uid] for uid in user_ids if uid in by_id]
+
+@registry.method("echo")
+async def echo(session, args):
+    return {"type": "response", "data": f"Echo: {args.get('text')}"}
+
+@registry.method("user.search")
+async def search(session, args):
+    query = args.get("username")
+    if not query:
+        return {"type": "error", "message": "Username required"}
+
+    limit = min(parse_int(args.get("limit")) or USER_SEARCH_PAGE_SIZE, USER_LIST_PAGE_SIZE)
+    offset = parse_int(args.get("offset")) or 0
+
+    # Ranked prefix / typo-tolerant match from the in-memory directory; exact username first
+    await user_directory.ensure_loaded()
+    user_ids, has_more = user_directory.search(query, limit, offset)
+
+    async with AsyncSessionLocal() as db:
+        users = await load_users_in_order(db, user_ids)
+
+    if not users:
+        return {"type": "error", "message": "User not found"}
+    response = {
+        "type": "search_result",
+        "users": [serialize_user(u, include_status=False) for u in users],
+        "has_more": has_more,
+        "next_offset": offset + len(user_ids) if has_more else None
+    }
+    # `user` keeps its old meaning for existing clients (add contact / open chat): the exact
+    # username match only, never a prefix or typo match
+    if users[0].username == query.lstrip("@"):
+        response["user"] = serialize_user(users[0], include_status=False)
+    return response
+
+@registry.method("user.get_info")
+async def get_info(session, args):
+    target_id = parse_int(args.get("user_id"))
+    if not target_id:
+        return {"type": "error", "message": "User ID required"}
+
+    async with AsyncSessionLocal() as db:
+        user = await profile_cache.get(db, target_id)
+
+        if not user:
+            return {"type": "error", "message": "User not found"}
+        return {
+            "type": "user.info",
+            "user": serialize_user(user)
+        }
+
+@registry.method("user.list")
+async def list_users(session, args):
+    limit = min(parse_int(args.get("limit")) or USER_LIST_PAGE_SIZE, USER_LIST_PAGE_SIZE)
+    offset = parse_int(args.get("offset")) or 0
+
+    await user_directory.ensure_loaded()
+    if args.get("query"):
+        user_ids, has_more = user_directory.search(args["query"], limit, offset, exclude=session.user_id)
+    else:
+        user_ids, has_more = user_directory.page(limit, offset, exclude=session.user_id)
+
+    async with AsyncSessionLocal() as db:
+        users = await load_users_in_order(db, user_ids)
+
+    user_list = [serialize_user(u) for u in users]
+    return {
+        "type": "user.list_result",
+        "users": user_list,
+        "has_more": has_more,
+        "next_offset": offset + len(user_ids) if has_more else None
+    }
+
+@registry.method("contacts.add")
+async def add_contact(session, args):
+    contact_id = parse_int(args.get("user_id"))
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not contact_id:
+        return {"type": "error", "message": "User ID required"}
+
+    async with AsyncSessionLocal() as db:
+        new_contact = Contact(owner_id=session.user_id, contact_user_id=contact_id)
+        db.add(new_contact)
+        await db.commit()
+        subscribe_user(session.user_id, presence_topic(contact_id))
+        return {"type": "success", "message": "Contact added"}
+
+@registry.method("user.update_profile")
+async def update_profile(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    display_name = args.get("display_name")
+    username = args.get("username")
+    avatar_url = args.get("avatar_url")
+    about = args.get("about")
+    phone_number = args.get("phone_number")
+
+    if phone_number and not re.match(r'^(\+7|8)\d{10}$', phone_number):
+        return {"type": "error", "message": "Invalid Russian phone number"}
+    if about and len(about) > 50:
+        return {"type": "error", "message": "About must be 50 characters or less"}
+
+    async with AsyncSessionLocal() as db:
+        # Check Username Uniqueness if changed
+        if username:
+            res = await db.execute(select(User).where(and_(User.username == username, User.id != session.user_id)))
+            if res.scalars().first():
+                return {"type": "error", "message": "Username already taken"}
+
+        values_to_update = {
+            "display_name": display_name,
+            "avatar_url": avatar_url,
+            "about": about,
+            "phone_number": phone_number
+        }
+        if username:
+            values_to_update["username"] = username
+
+        stmt = update(User).where(User.id == session.user_id).values(**values_to_update)
+        await db.execute(stmt)
+        await db.commit()
+
+        # Fetch updated user for consistent response
+        res = await db.execute(select(User).where(User.id == session.user_id))
+        updated_user = res.scalars().first()
+        if updated_user:
+            user_directory.add(updated_user)
+            profile_cache.put(updated_user) # Write-through
+        return {"type": "user.profile_updated", "user": serialize_user(updated_user, include_status=False)}
+
+@registry.method("user.request_password_change")
+async def request_password_change(session, args):
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+
+    # Get user email
+    email_to_send = None
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(select(User).where(User.id == session.user_id))
+        user = res.scalars().first()
+        if user:
+            email_to_send = user.email
+
+    if not email_to_send:
+        return {"type": "error", "message": "User not found"}
+
+    code = str(random.randint(10000, 99999))
+    session.temp_auth_data["password_change_code"] = code
+    session.temp_auth_data["password_change_email"] = email_to_send
+
+    # Send email
+    print(f"PASSWORD CHANGE CODE for {email_to_send}: {code}") # Fallback output
+
+    sent = False
+    try:
+        sent = await send_email(email_to_send, "SamOr Password Change Code", f"Your verification code is: {code}")
+    except Exception as e:
+        print(f"Email send failed: {e}")
+
+    if sent:
+        return {"type": "success", "message": "Code sent"}
+    return {"type": "success", "message": "Code sent (check console)"}
+
+@registry.method("user.change_password")
+async def change_password(session, args):
+    code = args.get("code")
+    new_password = args.get("new_password")
+
+    if not session.user_id:
+        return {"type": "error", "message": "Not authenticated"}
+    if not code or not new_password:
+        return {"type": "error", "message": "Code and password required"}
+
+    stored_code = session.temp_auth_data.get("password_change_code")
+    if not stored_code or stored_code != code:
+        return {"type": "error", "message": "Invalid code"}
+
+    hashed, salt = await password_hasher.hash(new_password)
+
+    async with AsyncSessionLocal() as db:
+        stmt = update(User).where(User.id == session.user_id).values(
+            hashed_password=hashed,
+            salt=salt
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+    profile_cache.invalidate(session.user_id)
+    session.temp_auth_data.pop("password_change_code", None)
+    return {"type": "success", "message": "Password changed successfully"}
@@ -0,0 +1,29 @@
+import ipaddress
+from fastapi import APIRouter, HTTPException, Request
+from app.core.config import settings
+from app.core.metrics import metrics
+
+router = APIRouter()
+
+# Set by reverse proxies (see nginx.conf.example): the peer is then the proxy on 127.0.0.1,
+# not the real client
+PROXY_HEADERS = ("x-forwarded-for", "x-real-ip", "forwarded")
+
+def is_local(request: Request) -> bool:
+    if request.client is None or any(header in request.headers for header in PROXY_HEADERS):
+        return False
+    return is_loopback(request.client.host)
+
+def is_loopback(host) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+@router.get("/")
+async def get_metrics(request: Request):
+    # Off unless METRICS_HTTP_ENABLED, and then only for a scraper on the same host talking to us
+    # directly. Admins can read the same snapshot over the socket (admin.metrics_get).
+    if not settings.METRICS_HTTP_ENABLED or not is_local(request):
+        raise HTTPException(status_code=404, detail="Not found")
+    return metrics.snapshot()
@@ -0,0 +1,132 @@
+"""Query plans and timings of the hot conversation queries, before and after the conversation key.
+
+Builds a throwaway SQLite database with --rows messages (default 10M) spread over
+DMs and group channels, then runs history, read and admin-log queries first against the old
+single-column indexes (sender_id OR'd both ways) and then against conversation_key / (channel_id, id).
+
+Usage (from server/):  python -m benchmarks.bench_conversation_indexes [--rows N] [--db PATH]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.models import conversation_key
+
+USERS = 50000
+CHANNELS = 2000
+CHANNEL_SHARE = 0.3 # Fraction of messages posted in group channels
+CHUNK = 100000
+REPEAT = 200 # Executions per query, on random conversations
+
+LEGACY_INDEXES = [
+    "CREATE INDEX ix_messages_sender_id ON messages (sender_id)",
+    "CREATE INDEX ix_messages_recipient_id ON messages (recipient_id)",
+    "CREATE INDEX ix_messages_channel_id ON messages (channel_id)",
+]
+CONVERSATION_INDEXES = [
+    "CREATE INDEX ix_messages_conversation_key_id ON messages (conversation_key, id)",
+    "CREATE INDEX ix_messages_channel_id_id ON messages (channel_id, id)",
+]
+
+LEGACY_QUERIES = {
+    "history (dm)": (
+        "SELECT * FROM messages WHERE ((sender_id = :a AND recipient_id = :b) OR (sender_id = :b AND recipient_id = :a)) "
+        "ORDER BY id DESC LIMIT 51"
+    ),
+    "history (channel)": "SELECT * FROM messages WHERE channel_id = :c ORDER BY id DESC LIMIT 51",
+    "read (unread from peer)": "SELECT count(*) FROM messages WHERE sender_id = :b AND recipient_id = :a AND is_read = 0",
+    "admin log": (
+        "SELECT * FROM messages WHERE ((sender_id = :a AND recipient_id = :b) OR (sender_id = :b AND recipient_id = :a)) "
+        "ORDER BY id DESC LIMIT 100"
+    ),
+}
+CONVERSATION_QUERIES = {
+    "history (dm)": "SELECT * FROM messages WHERE conversation_key = :k ORDER BY id DESC LIMIT 51",
+    "history (channel)": "SELECT * FROM messages WHERE channel_id = :c ORDER BY id DESC LIMIT 51",
+    "read (unread from peer)": "SELECT count(*) FROM messages WHERE conversation_key = :k AND sender_id = :b AND is_read = 0",
+    "admin log": "SELECT * FROM messages WHERE conversation_key = :k ORDER BY id DESC LIMIT 100",
+}
+
+def populate(conn, rows, pairs):
+    conn.execute(
+        "CREATE TABLE messages (id INTEGER PRIMARY KEY, sender_id INTEGER, recipient_id INTEGER, channel_id INTEGER, "
+        "conversation_key BIGINT, content VARCHAR, msg_type VARCHAR, is_read BOOLEAN, created_at FLOAT)"
+    )
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for base in range(0, rows, CHUNK):
+        batch = []
+        for i in range(base + 1, min(base + CHUNK, rows) + 1):
+            if rng.random() < CHANNEL_SHARE:
+                batch.append((i, rng.randrange(1, USERS), None, rng.randrange(1, CHANNELS), None, "hello", "text", 1, float(i)))
+            else:
+                a, b = pairs[rng.randrange(len(pairs))]
+                if rng.random() < 0.5:
+                    a, b = b, a
+                batch.append((i, a, b, None, conversation_key(a, b), "hello", "text", rng.random() < 0.9, float(i)))
+        conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    print(f"inserted {rows} rows in {time.perf_counter() - started:.1f}s")
+
+def build(conn, statements):
+    started = time.perf_counter()
+    for statement in statements:
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"  indexes built in {time.perf_counter() - started:.1f}s")
+
+def run(conn, queries, pairs):
+    rng = random.Random(2)
+    for name, sql in queries.items():
+        samples = []
+        for _ in range(REPEAT):
+            a, b = pairs[rng.randrange(len(pairs))]
+            samples.append({"a": a, "b": b, "k": conversation_key(a, b), "c": rng.randrange(1, CHANNELS)})
+        plan = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, samples[0]))
+        started = time.perf_counter()
+        for params in samples:
+            conn.execute(sql, params).fetchall()
+        per_query = (time.perf_counter() - started) / REPEAT
+        print(f"  {name:<24} {per_query * 1e3:9.3f} ms   {plan}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--db", help="database file (default: a temporary file, removed afterwards)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    try:
+        rng = random.Random(0)
+        pairs = [(rng.randrange(1, USERS), rng.randrange(1, USERS)) for _ in range(args.rows // 200 or 1)] # ~200 messages per DM
+        populate(conn, args.rows, pairs)
+
+        print("single-column indexes (before):")
+        build(conn, LEGACY_INDEXES)
+        run(conn, LEGACY_QUERIES, pairs)
+
+        print("conversation_key / (channel_id, id) indexes (after):")
+        for index in ("ix_messages_sender_id", "ix_messages_recipient_id", "ix_messages_channel_id"):
+            conn.execute(f"DROP INDEX {index}")
+        build(conn, CONVERSATION_INDEXES)
+        run(conn, CONVERSATION_QUERIES, pairs)
+    finally:
+        conn.close()
+        if not args.db:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            os.rmdir(os.path.dirname(path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compares envelope v1 (MTProto-style SHA-256 KDF + AES-CBC) with v2 (AES-GCM, session keys).
+
+Usage (from server/):  python -m benchmarks.bench_envelope
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.crypto import envelope
+from app.crypto.envelope import GcmEnvelope, MTProtoEnvelope
+
+SIZES = [(100, 20000), (1024 * 1024, 50)] # (payload bytes, iterations)
+
+def bench(name, sender, receiver, payload, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        frame = sender.encrypt(payload)
+    enc = (time.perf_counter() - start) / iterations
+
+    frames = [sender.encrypt(payload) for _ in range(iterations)]
+    start = time.perf_counter()
+    for frame in frames:
+        receiver.decrypt(frame)
+    dec = (time.perf_counter() - start) / iterations
+
+    print(f"  {name:<4} encrypt {enc * 1e6:10.1f} us   decrypt {dec * 1e6:10.1f} us   frame {len(frame)} bytes")
+    return enc + dec
+
+def main():
+    auth_key = os.urandom(256)
+    salt = os.urandom(16)
+    print(f"v2 backend: {'cryptography' if envelope.AESGCM is not None else 'pycryptodome'}")
+    for size, iterations in SIZES:
+        payload = os.urandom(size)
+        print(f"payload {size} bytes x {iterations}")
+        v1 = bench("v1", MTProtoEnvelope(auth_key), MTProtoEnvelope(auth_key), payload, iterations)
+        v2 = bench("v2", GcmEnvelope(auth_key, salt, server_side=True), GcmEnvelope(auth_key, salt, server_side=False), payload, iterations)
+        print(f"  v2 speedup: {v1 / v2:.2f}x")
+
+if __name__ == "__main__":
+    main()
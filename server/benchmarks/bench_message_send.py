@@ -0,0 +1,83 @@
+"""Sustained message.send throughput on one core (one event loop), against a throwaway SQLite
+database with the production engine profile (WAL, synchronous=NORMAL).
+
+Reports messages/second, SQL statements per send and failed sends (e.g. SQLite busy timeouts),
+for sequential sends and for --concurrency senders at once. --batching turns on group commit
+(WRITE_BATCHING) with the given window in milliseconds.
+
+Usage (from server/):  python -m benchmarks.bench_message_send [--messages N] [--concurrency C] [--batching MS]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+os.environ.setdefault("MAIL_USERNAME", "bench")
+os.environ.setdefault("MAIL_PASSWORD", "bench")
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app.core.config import settings
+from app.db import writes
+from app.db.models import AsyncSessionLocal, User, engine, init_db
+from app.handlers.messages import send_message
+
+USERS = 100
+
+async def run(label, messages, concurrency, statements):
+    per_sender = messages // concurrency
+    failed = 0
+
+    async def sender(n):
+        nonlocal failed
+        session = SimpleNamespace(user_id=n % USERS + 1)
+        for i in range(per_sender):
+            try:
+                await send_message(session, {"peer_id": (n + i) % USERS + 1, "text": f"message {i}"})
+            except OperationalError:
+                failed += 1
+
+    before = len(statements)
+    started = time.perf_counter()
+    await asyncio.gather(*[sender(n) for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    sent = per_sender * concurrency
+    print(f"  {label:<14} {(sent - failed) / elapsed:8.0f} msg/s   {(len(statements) - before) / sent:.1f} statements/send   {failed} failed")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batching", type=float, metavar="MS", help="group commit window (default: off)")
+    args = parser.parse_args()
+    if args.batching is not None:
+        settings.WRITE_BATCHING = True
+        writes.message_batcher = writes.WriteBatcher(max_delay_ms=args.batching)
+
+    try:
+        await init_db()
+        async with AsyncSessionLocal() as db:
+            db.add_all([User(id=i, username=f"user{i}", email=f"user{i}@bench") for i in range(1, USERS + 1)])
+            await db.commit()
+
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda conn, cursor, statement, *a: statements.append(statement))
+        await run("warm-up", USERS, 1, statements) # Fills the profile cache and creates the dialogs
+        print(f"{args.messages} DMs between {USERS} users:")
+        await run("sequential", args.messages, 1, statements)
+        await run(f"{args.concurrency} senders", args.messages, args.concurrency, statements)
+        await writes.message_batcher.stop()
+    finally:
+        await engine.dispose()
+        shutil.rmtree(DB_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,7 +3,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.auth.router import router as auth_router
 from app.ws import router as ws_router
-from app.db.models import init_db
+from app.db.models import engine, init_db
+from app.db.migrations import migrator
+from app.db.writes import message_batcher
+from app.core.directory import user_directory
+from app.core.executors import shutdown_executors
+from app.core.presence import presence_tracker
+from app.crypto.dh_pool import dh_reservoir
 
 app = FastAPI(
     title="SamOr Backend",
@@ -26,6 +32,18 @@ async def on_startup():
     print("SERVER STARTING... (If you see this often, it's restarting!)")
     print("="*50 + "\n")
     await init_db()
+    migrator.start(engine)
+    await user_directory.load()
+    presence_tracker.start()
+    dh_reservoir.schedule_refill()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await migrator.stop()
+    await message_batcher.stop() # Commit messages still waiting for their batch
+    await presence_tracker.stop()
+    await dh_reservoir.stop()
+    shutdown_executors()
 
 # Include Routers
 # Include Routers
@@ -42,6 +60,8 @@ from app.upload import router as upload_router
 app.include_router(upload_router, prefix="/api", tags=["upload"])
 from app.routers.files import router as files_router
 app.include_router(files_router, prefix="/api/files", tags=["files"])
+from app.routers.metrics import router as metrics_router
+app.include_router(metrics_router, prefix="/api/metrics", tags=["metrics"])
 
 @app.get("/")
 async def root():
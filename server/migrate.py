@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+from app.db.models import engine, init_db
+from app.db.migrations import migrator
+
+# Usage (from server/):
+#   python migrate.py          apply every pending step, including index builds and backfills
+#   python migrate.py status   list steps and the recorded schema version
+# The server applies schema steps at startup and the rest in the background, so this is only
+# needed to finish backfills ahead of a deploy or to inspect the state.
+
+async def status():
+    applied = await migrator.applied(engine)
+    for migration in migrator.migrations:
+        row = applied.get(migration.version)
+        if row is None:
+            state = "pending"
+        elif row.applied_at is None:
+            state = f"in progress (at id {row.cursor})"
+        else:
+            state = "applied"
+        print(f"{migration.version:>4}  {migration.name:<40} {state}")
+    print(f"Schema version: {await migrator.version(engine)}")
+
+async def main(command):
+    try:
+        if command == "status":
+            await status()
+        else:
+            await init_db()
+            await migrator.upgrade(engine, online=True)
+            print(f"Schema version: {await migrator.version(engine)}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "upgrade"))
@@ -1,18 +0,0 @@
-
-import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import text
-
-DATABASE_URL = "sqlite+aiosqlite:///./samor.db"
-
-async def migrate():
-    engine = create_async_engine(DATABASE_URL, echo=True)
-    async with engine.begin() as conn:
-        try:
-            await conn.execute(text("ALTER TABLE users ADD COLUMN phone_number VARCHAR"))
-            print("Migration successful: Added phone_number column to users table.")
-        except Exception as e:
-            print(f"Migration failed (maybe column exists?): {e}")
-
-if __name__ == "__main__":
-    asyncio.run(migrate())
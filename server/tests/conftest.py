@@ -0,0 +1,48 @@
+import asyncio
+from collections import OrderedDict
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.engine import set_sqlite_pragmas
+from app.db.fts import ensure_fts
+from app.db.migrations import migrator
+from app.core.profiles import profile_cache
+from app import ws
+from app.core import presence
+from app.db import writes
+from app.db.models import Base
+from app.handlers import admin, auth, calls, common, groups, messages, users
+
+HANDLER_MODULES = (admin, auth, calls, common, groups, messages, users, presence, writes, ws)
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    # run(seed, scenario): seed(db) fills a fresh in-memory database, then scenario(queries) runs
+    # against it with every handler's AsyncSessionLocal pointed at it, all in one event loop.
+    def run(seed, scenario):
+        async def main():
+            engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+            event.listen(engine.sync_engine, "connect", set_sqlite_pragmas) # Production profile: foreign keys enforced
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await ensure_fts(conn)
+            await migrator.upgrade(engine, online=True) # Marks every step applied, as on a migrated server
+            factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            for module in HANDLER_MODULES:
+                monkeypatch.setattr(module, "AsyncSessionLocal", factory)
+            monkeypatch.setattr(profile_cache, "profiles", OrderedDict())
+            monkeypatch.setattr(messages, "channel_groups", {})
+            async with factory() as db:
+                await seed(db)
+                await db.commit()
+
+            queries = [] # SQL statements executed by the scenario
+            event.listen(engine.sync_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: queries.append(statement))
+            try:
+                return await scenario(queries)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from app.core.codec import JSON
+from app.core.config import settings
+from app.core.hub import Hub, send_payload
+from app.core.outbox import Outbox
+from app.crypto.envelope import GcmEnvelope
+
+AUTH_KEY = os.urandom(256)
+
+class FakeSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.user_id = session_id
+        self.websocket = object()
+        self.envelope = GcmEnvelope(AUTH_KEY)
+        self.client = GcmEnvelope(AUTH_KEY, self.envelope.salt, server_side=False)
+        self.binary_frames = True
+        self.codec = JSON
+        self.outbox = Outbox(limit=16)
+
+async def drain(sess):
+    # Resolve queued frames in order, the way the outbox writer does
+    payloads = []
+    for _, frame in list(sess.outbox.frames):
+        if isinstance(frame, asyncio.Future):
+            frame = await frame
+        payloads.append(JSON.decode(sess.client.decrypt(frame)))
+    return payloads
+
+def test_large_payload_keeps_queue_order(monkeypatch):
+    monkeypatch.setattr(settings, "CRYPTO_OFFLOAD_BYTES", 1024)
+
+    async def scenario():
+        sess = FakeSession(1)
+        await send_payload(sess, {"type": "big", "blob": "x" * 4096})
+        await send_payload(sess, {"type": "small"})
+        assert isinstance(sess.outbox.frames[0][1], asyncio.Future)
+        return await drain(sess)
+
+    assert [p["type"] for p in asyncio.run(scenario())] == ["big", "small"]
+
+def test_batch_fanout_encrypts_for_every_session(monkeypatch):
+    monkeypatch.setattr(settings, "CRYPTO_BATCH_MIN", 4)
+    monkeypatch.setattr(settings, "CRYPTO_THREADS", 3)
+
+    async def scenario():
+        sessions = [FakeSession(i) for i in range(10)]
+        fanout = Hub(None)
+        for n in range(3):
+            delivered, failed = await fanout.deliver(sessions, {"type": "message.new", "n": n})
+            assert delivered == 10 and not failed
+        return [await drain(sess) for sess in sessions]
+
+    for payloads in asyncio.run(scenario()):
+        assert [p["n"] for p in payloads] == [0, 1, 2]
@@ -0,0 +1,57 @@
+import pytest
+from types import SimpleNamespace
+from sqlalchemy.future import select
+from app.db.models import Dialog, Message, User
+from app.handlers import messages
+
+def seeder(dialog_count):
+    async def seed(db):
+        db.add(User(id=1, username="me"))
+        for peer_id in range(2, dialog_count + 2):
+            db.add(User(id=peer_id, username=f"u{peer_id}"))
+            db.add(Message(id=peer_id, sender_id=peer_id, recipient_id=1, content=f"hi {peer_id}", msg_type="text"))
+        await db.flush() # Dialogs reference the messages
+        for peer_id in range(2, dialog_count + 2):
+            db.add(Dialog(user_id=1, peer_id=peer_id, last_message_id=peer_id, unread_count=1, updated_at=float(peer_id)))
+    return seed
+
+@pytest.mark.parametrize("dialog_count", [1, 10, 100])
+def test_dialogs_query_count_is_constant(memory_db, dialog_count):
+    async def scenario(queries):
+        result = await messages.get_dialogs(SimpleNamespace(user_id=1), {})
+        return result, len(queries)
+
+    result, query_count = memory_db(seeder(dialog_count), scenario)
+    assert len(result["dialogs"]) == dialog_count
+    assert result["dialogs"][0]["last_message"] == f"hi {dialog_count + 1}"
+    assert query_count == 1
+
+def test_dialogs_paginate_by_offset_date(memory_db):
+    async def scenario(queries):
+        session = SimpleNamespace(user_id=1)
+        first = await messages.get_dialogs(session, {"limit": 3})
+        rest = await messages.get_dialogs(session, {"limit": 3, "offset_date": first["next_offset_date"]})
+        return first, rest
+
+    first, rest = memory_db(seeder(5), scenario)
+    assert [d["peer"]["id"] for d in first["dialogs"]] == [6, 5, 4] and first["has_more"]
+    assert [d["peer"]["id"] for d in rest["dialogs"]] == [3, 2] and not rest["has_more"]
+
+def test_dialogs_paginate_through_equal_timestamps(memory_db):
+    async def seed(db):
+        await seeder(5)(db)
+        await db.flush()
+        for dialog in (await db.execute(select(Dialog))).scalars():
+            dialog.updated_at = 1.0 # All updated by one batch commit
+
+    async def scenario(queries):
+        session = SimpleNamespace(user_id=1)
+        pages = [await messages.get_dialogs(session, {"limit": 2})]
+        while pages[-1]["has_more"]:
+            cursor = {"offset_date": pages[-1]["next_offset_date"], "offset_id": pages[-1]["next_offset_id"]}
+            pages.append(await messages.get_dialogs(session, {"limit": 2, **cursor}))
+        return pages
+
+    pages = memory_db(seed, scenario)
+    peers = [d["peer"]["id"] for page in pages for d in page["dialogs"]]
+    assert sorted(peers) == [2, 3, 4, 5, 6] and len(pages) == 3
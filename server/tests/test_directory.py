@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from app.core.directory import UserDirectory
+from app.db.models import User
+from app.handlers import users
+
+def user(user_id, username, display_name):
+    return SimpleNamespace(id=user_id, username=username, display_name=display_name)
+
+def directory():
+    d = UserDirectory()
+    for u in [
+        user(1, "alex", "Alex Smith"),
+        user(2, "alexandra", "Sasha"),
+        user(3, "bob", "Bob Alexeev"),
+        user(4, "carol", "Carol King"),
+    ]:
+        d.add(u)
+    return d
+
+def test_prefix_ranking():
+    d = directory()
+    ids, has_more = d.search("@Alex")
+    assert ids == [1, 2, 3] and not has_more # Exact username, username prefix, display-name word
+    assert d.search("king") == ([4], False)
+    assert d.search("alex", limit=2) == ([1, 2], True)
+    assert d.search("alex", limit=2, offset=2) == ([3], False)
+
+def test_typo_tolerance():
+    d = directory()
+    assert d.search("carlo")[0] == [4]
+    assert d.search("zzzz") == ([], False)
+
+def test_updates_and_removal():
+    d = directory()
+    d.add(user(4, "caroline", "Carol King"))
+    assert d.search("caroline")[0] == [4]
+    d.remove(4)
+    assert d.search("carol") == ([], False)
+    assert d.page(limit=2) == ([1, 2], True)
+    assert len(d) == 3
+
+def test_page_skips_excluded_user():
+    d = directory() # ids 1-4
+    pages = [d.page(limit=1, offset=offset, exclude=2) for offset in range(4)]
+    assert pages == [([1], True), ([3], True), ([4], False), ([], False)]
+    assert d.page(limit=2, offset=1, exclude=1) == ([3, 4], False)
+    assert d.page(limit=2, exclude=9) == ([1, 2], True)
+
+def test_search_fills_user_only_on_exact_username(memory_db, monkeypatch):
+    d = directory()
+    d.loaded = True
+    monkeypatch.setattr(users, "user_directory", d)
+
+    async def seed(db):
+        db.add_all([User(id=1, username="alex", display_name="Alex Smith"), User(id=2, username="alexandra", display_name="Sasha"),
+                    User(id=3, username="bob", display_name="Bob Alexeev"), User(id=4, username="carol", display_name="Carol King")])
+
+    async def scenario(queries):
+        return [await users.search(SimpleNamespace(user_id=4), {"username": q}) for q in ("@alex", "alexa", "carlo")]
+
+    exact, prefix, typo = memory_db(seed, scenario)
+    assert exact["user"]["id"] == 1 and [u["id"] for u in exact["users"]] == [1, 2, 3]
+    # Prefix and typo matches are suggestions only: `user` is what clients add as a contact
+    assert "user" not in prefix and prefix["users"][0]["id"] == 2
+    assert "user" not in typo and typo["users"][0]["id"] == 4
+
+def test_add_contact_requires_a_numeric_id(memory_db):
+    async def seed(db):
+        db.add_all([User(id=1, username="a"), User(id=2, username="b")])
+
+    async def scenario(queries):
+        me = SimpleNamespace(user_id=1)
+        return await users.add_contact(me, {"user_id": "abc"}), await users.add_contact(me, {"user_id": "2"})
+
+    bad, ok = memory_db(seed, scenario)
+    assert bad == {"type": "error", "message": "User ID required"}
+    assert ok["type"] == "success"
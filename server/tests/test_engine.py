@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+from sqlalchemy import text
+from sqlalchemy.future import select
+from app.core.config import settings
+from app.db.engine import create_engine_from_settings, database_url
+from app.db.models import Channel, Dialog, Group, GroupMember, Message, User
+from app.handlers import groups, messages
+
+def test_database_url_defaults_to_sqlite_and_upgrades_postgres(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", None)
+    assert database_url().startswith("sqlite+aiosqlite:///")
+    monkeypatch.setattr(settings, "DATABASE_URL", "postgres://u:p@db/samor")
+    assert database_url() == "postgresql+asyncpg://u:p@db/samor"
+
+def test_sqlite_profile_pragmas(tmp_path):
+    async def main():
+        engine = create_engine_from_settings(f"sqlite+aiosqlite:///{tmp_path / 'samor.db'}")
+        try:
+            async with engine.connect() as conn:
+                return {name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                        for name in ("journal_mode", "synchronous", "foreign_keys", "busy_timeout")}
+        finally:
+            await engine.dispose()
+
+    pragmas = asyncio.run(main())
+    assert not settings.DB_ECHO
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "foreign_keys": 1, "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS}
+
+async def seed(db):
+    db.add_all([User(id=1, username="a"), User(id=2, username="b"), Group(id=1, name="g", owner_id=1)])
+    await db.flush()
+    db.add_all([GroupMember(group_id=1, user_id=1, role="owner"), Channel(id=10, group_id=1, name="general")])
+    db.add_all([Message(id=1, sender_id=1, recipient_id=2, content="hi"), Message(id=2, sender_id=1, channel_id=10, content="yo")])
+    await db.flush()
+    db.add(Dialog(user_id=2, peer_id=1, last_message_id=1, unread_count=1, updated_at=1.0))
+
+def test_deletes_respect_foreign_keys(memory_db):
+    session = SimpleNamespace(user_id=1)
+
+    async def scenario(queries):
+        deleted = await messages.delete_messages(session, {"message_ids": [1], "delete_for_all": True})
+        dropped = await groups.delete_group(session, {"group_id": 1})
+        async with messages.AsyncSessionLocal() as db:
+            dialog = (await db.execute(select(Dialog))).scalars().one()
+            left = (await db.execute(select(Message.id))).scalars().all()
+        return deleted, dropped, dialog, left
+
+    deleted, dropped, dialog, left = memory_db(seed, scenario)
+    assert deleted == {"type": "messages.deleted", "ids": [1]}
+    assert dialog.last_message_id is None
+    assert dropped["type"] == "groups.deleted"
+    assert left == [] # The channel message went with its group
@@ -0,0 +1,37 @@
+import os
+import pytest
+from app.crypto import envelope
+from app.crypto.envelope import GcmEnvelope, MTProtoEnvelope, negotiate_envelope
+
+AUTH_KEY = os.urandom(256)
+
+@pytest.fixture(params=["default", "pycryptodome"])
+def backend(request, monkeypatch):
+    if request.param == "pycryptodome":
+        monkeypatch.setattr(envelope, "AESGCM", None)
+
+def pair():
+    server = GcmEnvelope(AUTH_KEY)
+    client = GcmEnvelope(AUTH_KEY, server.salt, server_side=False)
+    return server, client
+
+def test_gcm_roundtrip_both_directions(backend):
+    server, client = pair()
+    for payload in (b"", b"hello", os.urandom(100_000)):
+        assert server.decrypt(client.encrypt(payload)) == payload
+        assert client.decrypt(server.encrypt(payload)) == payload
+
+def test_gcm_rejects_tampering_and_replay(backend):
+    server, client = pair()
+    frame = client.encrypt(b"hello")
+    tampered = frame[:-1] + bytes([frame[-1] ^ 1])
+    with pytest.raises(ValueError):
+        server.decrypt(tampered)
+    assert server.decrypt(frame) == b"hello"
+    with pytest.raises(ValueError):
+        server.decrypt(frame)
+
+def test_negotiation_defaults_to_v1():
+    assert isinstance(negotiate_envelope(AUTH_KEY, None), MTProtoEnvelope)
+    assert isinstance(negotiate_envelope(AUTH_KEY, 2), GcmEnvelope)
+    assert isinstance(negotiate_envelope(AUTH_KEY, 99), GcmEnvelope)
@@ -0,0 +1,82 @@
+import pytest
+from types import SimpleNamespace
+from app.core.hub import group_topic
+from app.core.session_manager import session_manager
+from app.db.models import Channel, Group, GroupMember, User
+from app.handlers import calls, groups
+
+def seeder(group_count):
+    async def seed(db):
+        db.add(User(id=1, username="me"))
+        for gid in range(1, group_count + 1):
+            db.add(Group(id=gid, name=f"g{gid}", owner_id=1))
+        await db.flush() # Members and channels reference the groups
+        for gid in range(1, group_count + 1):
+            db.add(GroupMember(group_id=gid, user_id=1, role="owner"))
+            db.add(Channel(id=gid * 10 + 1, group_id=gid, name="voice", type="voice", position=1))
+            db.add(Channel(id=gid * 10, group_id=gid, name="general", position=0))
+    return seed
+
+@pytest.mark.parametrize("group_count", [1, 10, 100])
+def test_groups_list_query_count_is_constant(memory_db, monkeypatch, group_count):
+    for index in ("active_group_calls", "group_call_channels", "call_channel_groups"):
+        monkeypatch.setattr(calls, index, {})
+    calls.track_group_call(11, 1)
+    calls.active_group_calls[11][1] = {"id": 1}
+
+    async def scenario(queries):
+        result = await groups.list_groups(SimpleNamespace(user_id=1), {})
+        return result, len(queries)
+
+    result, query_count = memory_db(seeder(group_count), scenario)
+    assert query_count == 1
+    assert len(result["groups"]) == group_count
+    first = result["groups"][0]
+    assert [c["name"] for c in first["channels"]] == ["general", "voice"]
+    assert first["has_active_call"] and first["active_participants"] == [{"id": 1}]
+    assert not any(g["has_active_call"] for g in result["groups"][1:])
+
+def test_group_call_index_follows_calls(monkeypatch):
+    for index in ("active_group_calls", "group_call_channels", "call_channel_groups"):
+        monkeypatch.setattr(calls, index, {})
+    calls.track_group_call(11, 1)
+    calls.track_group_call(12, 1)
+    assert set(calls.group_active_calls(1)) == {11, 12}
+    assert calls.end_group_call(11) == 1
+    assert set(calls.group_active_calls(1)) == {12}
+    calls.end_group_call(12)
+    assert calls.group_call_channels == {} and calls.group_active_calls(1) == {}
+
+def test_add_member_with_string_ids_subscribes_the_new_member(memory_db):
+    async def seed(db):
+        await seeder(1)(db)
+        db.add(User(id=2, username="new"))
+
+    async def scenario(queries):
+        session = session_manager.create_session()
+        session_manager.bind_user(session, 2) # The new member is online
+        try:
+            # Clients send ids as strings
+            result = await groups.add_member(SimpleNamespace(user_id=1), {"group_id": "1", "user_id": "2"})
+            return result, group_topic(1) in session.topics
+        finally:
+            session_manager.remove_session(session.session_id)
+
+    result, subscribed = memory_db(seed, scenario)
+    assert result == {"type": "groups.members.added", "group_id": 1, "user_id": 2}
+    assert subscribed
+
+def test_deleting_a_group_ends_its_calls(memory_db, monkeypatch):
+    for index in ("active_group_calls", "group_call_channels", "call_channel_groups"):
+        monkeypatch.setattr(calls, index, {})
+    calls.track_group_call(11, 1)
+    calls.active_group_calls[11][1] = {"id": 1}
+    calls.track_group_call(21, 2)
+
+    async def scenario(queries):
+        return await groups.delete_group(SimpleNamespace(user_id=1), {"group_id": 1})
+
+    result = memory_db(seeder(2), scenario)
+    assert result == {"type": "groups.deleted", "group_id": 1}
+    assert calls.group_active_calls(1) == {} and 11 not in calls.active_group_calls
+    assert set(calls.group_active_calls(2)) == {21} # Other groups' calls carry on
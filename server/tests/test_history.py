@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from app.db.models import Message, User
+from app.handlers import messages
+
+async def seed(db):
+    db.add_all([User(id=1, username="a"), User(id=2, username="b"), User(id=3, username="c")])
+    for i in range(1, 11):
+        # Odd ids are 2 -> 1; user 1 deleted #5 "for me"
+        db.add(Message(id=i, sender_id=1 + i % 2, recipient_id=2 - i % 2, content=f"m{i}", deleted_by_recipient=(i == 5)))
+    db.add(Message(id=11, sender_id=3, recipient_id=1, content="other chat"))
+
+def page(**args):
+    return messages.get_history(SimpleNamespace(user_id=1), {"peer_id": 2, **args})
+
+def test_history_pages_back_from_newest(memory_db):
+    async def scenario(queries):
+        first = await page(limit=4)
+        second = await page(limit=4, before_id=first["next_before_id"])
+        last = await page(limit=4, before_id=second["next_before_id"])
+        return first, second, last
+
+    first, second, last = memory_db(seed, scenario)
+    ids = lambda r: [m["id"] for m in r["messages"]]
+    assert ids(first) == [7, 8, 9, 10] and first["has_more"]
+    assert ids(second) == [2, 3, 4, 6] and second["has_more"]
+    assert ids(last) == [1] and not last["has_more"]
+
+def test_history_pages_forward_from_cursor(memory_db):
+    async def scenario(queries):
+        return await page(limit=3, after_id=2)
+
+    result = memory_db(seed, scenario)
+    assert [m["id"] for m in result["messages"]] == [3, 4, 6]
+    assert result["has_more"] and result["next_after_id"] == 6
+
+def test_history_without_peer_or_channel_is_empty(memory_db):
+    async def scenario(queries):
+        result = await messages.get_history(SimpleNamespace(user_id=1), {"peer_id": "x"})
+        return result, queries
+
+    result, queries = memory_db(seed, scenario)
+    assert result["type"] == "messages.history" and result["messages"] == [] and not result["has_more"]
+    assert queries == []
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from fastapi import HTTPException
+from app.core.config import settings
+from app.db.models import User
+from app.handlers.registry import registry
+from app.routers.metrics import get_metrics
+
+def request_from(host, **headers):
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers)
+
+def test_http_metrics_are_off_by_default_and_loopback_only(monkeypatch):
+    with pytest.raises(HTTPException):
+        asyncio.run(get_metrics(request_from("127.0.0.1")))
+
+    monkeypatch.setattr(settings, "METRICS_HTTP_ENABLED", True)
+    assert isinstance(asyncio.run(get_metrics(request_from("127.0.0.1"))), dict)
+    assert isinstance(asyncio.run(get_metrics(request_from("::1"))), dict)
+    for host in ("10.0.0.7", "203.0.113.5", "testclient"):
+        with pytest.raises(HTTPException):
+            asyncio.run(get_metrics(request_from(host)))
+    # Behind nginx every client connects from 127.0.0.1
+    for header in ("x-forwarded-for", "x-real-ip"):
+        with pytest.raises(HTTPException):
+            asyncio.run(get_metrics(request_from("127.0.0.1", **{header: "203.0.113.5"})))
+
+def test_admin_metrics_rpc_requires_admin(memory_db):
+    async def seed(db):
+        db.add_all([User(id=1, username="admin", email="gtesla814@gmail.com"), User(id=2, username="b", email="b@example.com")])
+
+    async def scenario(queries):
+        get = lambda user_id: registry.dispatch(SimpleNamespace(user_id=user_id), "admin.metrics_get", {})
+        return await get(1), await get(2)
+
+    admin, other = memory_db(seed, scenario)
+    assert admin["type"] == "admin.metrics" and isinstance(admin["metrics"], dict)
+    assert other["type"] == "error"
@@ -0,0 +1,121 @@
+import asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.db.migrations import Backfill, FtsIndex, Migrator, MIGRATIONS
+from app.db.migrations.versions import files_url, static_uploads
+from app.db.models import Base, conversation_key
+
+LEGACY_SCHEMA = [
+    # As created before phone numbers, groups, read flags and message actions existed
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR, username VARCHAR, display_name VARCHAR, about VARCHAR, avatar_url VARCHAR, token VARCHAR, is_active BOOLEAN)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, sender_id INTEGER, recipient_id INTEGER, content VARCHAR, msg_type VARCHAR, media_url VARCHAR, created_at FLOAT)",
+    "INSERT INTO users (id, username, avatar_url) VALUES (1, 'a', '/static/uploads/a.png')",
+    "INSERT INTO messages (id, sender_id, recipient_id, content, msg_type, media_url) VALUES (1, 1, 1, 'pic', 'photo', '/static/uploads/p.png')",
+    "INSERT INTO messages (id, sender_id, recipient_id, content) VALUES (2, 7, 3, 'hi')",
+]
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        try:
+            return await scenario(engine)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+def columns(sync_conn, table):
+    return {c["name"] for c in inspect(sync_conn).get_columns(table)}
+
+def test_upgrades_legacy_database():
+    async def scenario(engine):
+        async with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                await conn.execute(text(statement))
+            await conn.run_sync(Base.metadata.create_all)
+        migrator = Migrator(MIGRATIONS)
+        await migrator.upgrade(engine)
+        startup_version = await migrator.version(engine)
+        async with engine.connect() as conn:
+            startup_fts = (await conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'messages_fts'"))).first()
+        await migrator.upgrade(engine, online=True)
+        await migrator.upgrade(engine, online=True) # Nothing left to do
+        async with engine.connect() as conn:
+            user_columns = await conn.run_sync(columns, "users")
+            message_columns = await conn.run_sync(columns, "messages")
+            indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("messages")})
+            urls = (await conn.execute(text("SELECT (SELECT avatar_url FROM users), (SELECT media_url FROM messages WHERE id = 1)"))).one()
+            keys = (await conn.execute(text("SELECT conversation_key FROM messages ORDER BY id"))).scalars().all()
+            fts_hits = (await conn.execute(text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'hi'"))).scalars().all()
+        return startup_version, startup_fts, await migrator.version(engine), user_columns, message_columns, indexes, urls, keys, fts_hits
+
+    startup_version, startup_fts, version, user_columns, message_columns, indexes, urls, keys, fts_hits = run(scenario)
+    assert startup_version == 3 # Index builds and backfills are left to the background run
+    assert startup_fts is None and fts_hits == [2] # Full-text index too, covering existing messages
+    assert version == 13
+    assert {"phone_number", "last_seen", "hashed_password", "salt"} <= user_columns
+    assert {"is_read", "channel_id", "reply_to_msg_id", "deleted_by_recipient", "conversation_key"} <= message_columns
+    assert {"ix_messages_channel_id_id", "ix_messages_conversation_key_id"} <= indexes
+    assert "ix_messages_dm_id" not in indexes
+    assert tuple(urls) == ("/api/files/a.png", "/api/files/p.png")
+    assert keys == [conversation_key(1, 1), conversation_key(3, 7)]
+
+def test_backfill_resumes_from_recorded_cursor():
+    backfill = Backfill(1, "media urls", "messages", "media_url", files_url, where=static_uploads("media_url"), batch_size=2)
+    migrator = Migrator([backfill])
+
+    async def scenario(engine):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for i in range(1, 8):
+                await conn.execute(text("INSERT INTO messages (id, media_url) VALUES (:id, :url)"), {"id": i, "url": f"/static/uploads/{i}"})
+            # An earlier run got through id 3 before the server stopped
+            await migrator.record(conn, backfill, cursor=3)
+        assert await migrator.version(engine) == 0
+        await migrator.upgrade(engine, online=True)
+        async with engine.connect() as conn:
+            urls = (await conn.execute(text("SELECT media_url FROM messages ORDER BY id"))).scalars().all()
+        return urls, await migrator.version(engine)
+
+    urls, version = run(scenario)
+    assert urls[:3] == ["/static/uploads/1", "/static/uploads/2", "/static/uploads/3"]
+    assert urls[3:] == ["/api/files/4", "/api/files/5", "/api/files/6", "/api/files/7"]
+    assert version == 1
+
+def test_fts_index_fills_around_live_writes():
+    step = FtsIndex(1, "messages full-text index", batch_size=2)
+    migrator = Migrator([step])
+
+    async def scenario(engine):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for i in range(1, 8):
+                await conn.execute(text("INSERT INTO messages (id, content) VALUES (:id, :text)"), {"id": i, "text": f"hello {i}"})
+        # Interrupt the fill after its first batch
+        real_record = migrator.record
+        async def record(conn, migration, cursor=None, done=False):
+            await real_record(conn, migration, cursor=cursor, done=done)
+            if cursor == 2:
+                raise RuntimeError("server stopped")
+        migrator.record = record
+        try:
+            await migrator.upgrade(engine, online=True)
+        except RuntimeError:
+            pass
+        migrator.record = real_record
+        # Live writes while the fill is stopped, seen only by the triggers
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM messages WHERE id IN (2, 4)"))
+            await conn.execute(text("UPDATE messages SET content = 'edited' WHERE id = 5"))
+            await conn.execute(text("INSERT INTO messages (id, content) VALUES (8, 'hello 8')"))
+        partial = await migrator.version(engine)
+        await migrator.upgrade(engine, online=True)
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('integrity-check')"))
+            hello = (await conn.execute(text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'hello' ORDER BY rowid"))).scalars().all()
+            edited = (await conn.execute(text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'edited'"))).scalars().all()
+        return partial, await migrator.version(engine), hello, edited
+
+    partial, version, hello, edited = run(scenario)
+    assert partial == 0 and version == 1
+    assert hello == [1, 3, 6, 7, 8] and edited == [5]
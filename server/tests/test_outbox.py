@@ -0,0 +1,41 @@
+import asyncio
+from app.core.outbox import Outbox, NORMAL, PRESENCE, SIGNAL, classify
+
+def test_classify():
+    assert classify({"type": "user.status"}) == PRESENCE
+    assert classify({"type": "call.offer"}) == SIGNAL
+    assert classify({"type": "groups.call.signal"}) == SIGNAL
+    assert classify({"type": "message.new"}) == NORMAL
+
+def test_presence_drops_oldest_when_full():
+    async def scenario():
+        box = Outbox(limit=3)
+        box.put(b"p1", PRESENCE)
+        box.put(b"m1", NORMAL)
+        box.put(b"p2", PRESENCE)
+        assert box.put(b"p3", PRESENCE)
+        return [frame for _, frame in box.frames]
+
+    assert asyncio.run(scenario()) == [b"m1", b"p2", b"p3"]
+
+def test_signal_is_never_dropped():
+    async def scenario():
+        box = Outbox(limit=2)
+        for i in range(10):
+            assert box.put(b"s%d" % i, SIGNAL)
+        return len(box)
+
+    assert asyncio.run(scenario()) == 10
+
+def test_persistent_overload_evicts():
+    async def scenario():
+        box = Outbox(limit=2, overload_seconds=0)
+        box.put(b"m1")
+        box.put(b"m2")
+        assert box.put(b"m3") # First overflow starts the overload clock
+        await asyncio.sleep(0.01)
+        assert not box.put(b"m4")
+        return box
+
+    box = asyncio.run(scenario())
+    assert box.evicted and box.closed and len(box) == 0
@@ -0,0 +1,27 @@
+import asyncio
+import hashlib
+from app.auth.passwords import PasswordHasher, hash_password, needs_rehash, verify_password
+from app.core.config import settings
+
+def test_legacy_hash_verifies_and_needs_rehash(monkeypatch):
+    legacy = hashlib.pbkdf2_hmac('sha256', b"secret", b"salt", 100000).hex()
+    assert verify_password(legacy, "salt", "secret")
+    assert not verify_password(legacy, "salt", "wrong")
+
+    monkeypatch.setattr(settings, "PASSWORD_HASH_ITERATIONS", 1000)
+    assert needs_rehash(legacy)
+    stored, salt = hash_password("secret")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert verify_password(stored, salt, "secret")
+    assert not needs_rehash(stored)
+
+def test_hasher_limits_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_ITERATIONS", 1000)
+
+    async def scenario():
+        hasher = PasswordHasher(concurrency=1)
+        results = await asyncio.gather(*[hasher.hash("pw%d" % i) for i in range(4)])
+        assert hasher.waiting == 0
+        return [await hasher.verify(stored, salt, "pw%d" % i) for i, (stored, salt) in enumerate(results)]
+
+    assert asyncio.run(scenario()) == [True] * 4
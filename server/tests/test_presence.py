@@ -0,0 +1,73 @@
+import asyncio
+from app.core import presence
+from app.core.presence import PresenceTracker
+from app.db.models import User
+from app.handlers import messages
+from sqlalchemy.future import select
+
+def run_tracker(monkeypatch, scenario):
+    sent = []
+
+    async def fake_broadcast(user_id, is_online, last_seen=0):
+        sent.append((user_id, is_online))
+
+    async def fake_write(self):
+        self.written = dict(self.last_seen_writes)
+        self.last_seen_writes.clear()
+
+    monkeypatch.setattr(presence, "broadcast_presence", fake_broadcast)
+    monkeypatch.setattr(PresenceTracker, "write_last_seen", fake_write)
+    tracker = PresenceTracker(grace_seconds=5)
+    asyncio.run(scenario(tracker))
+    return tracker, sent
+
+def test_flap_within_grace_is_suppressed(monkeypatch):
+    async def scenario(tracker):
+        await tracker.user_online(1)
+        tracker.user_offline(1)
+        await tracker.user_online(1)
+        await tracker.flush()
+
+    _, sent = run_tracker(monkeypatch, scenario)
+    assert sent == [(1, True)]
+
+def test_offline_announced_after_grace_with_batched_last_seen(monkeypatch):
+    async def scenario(tracker):
+        await tracker.user_online(1)
+        await tracker.user_online(2)
+        tracker.user_offline(1)
+        tracker.user_offline(2)
+        assert tracker.is_online(1)
+        await tracker.flush(now=tracker.pending_offline[2] + 5)
+
+    tracker, sent = run_tracker(monkeypatch, scenario)
+    assert sent == [(1, True), (2, True), (1, False), (2, False)]
+    assert set(tracker.written) == {1, 2}
+    assert not tracker.is_online(1)
+
+def test_last_seen_batch_survives_a_deleted_user(memory_db):
+    async def seed(db):
+        db.add_all([User(id=1, username="a"), User(id=3, username="c")])
+
+    async def scenario(queries):
+        tracker = PresenceTracker(grace_seconds=5)
+        tracker.last_seen_writes = {1: 100.0, 2: 200.0, 3: 300.0} # 2 was banned during the grace period
+        await tracker.write_last_seen()
+        async with messages.AsyncSessionLocal() as db:
+            seen = dict((await db.execute(select(User.id, User.last_seen))).all())
+        return seen, tracker.last_seen_writes
+
+    seen, retry = memory_db(seed, scenario)
+    assert seen == {1: 100.0, 3: 300.0}
+    assert retry == {} # Nothing left to fail the next flush
+
+def test_forget_drops_a_banned_user(monkeypatch):
+    async def scenario(tracker):
+        await tracker.user_online(1)
+        tracker.user_offline(1)
+        tracker.forget(1)
+        await tracker.flush(now=float("inf"))
+
+    tracker, sent = run_tracker(monkeypatch, scenario)
+    assert sent == [(1, True)] # No offline announcement for a deleted user
+    assert tracker.written == {} and not tracker.is_online(1)
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+from app.core.metrics import metrics
+from app.core.profiles import ProfileCache, profile_cache
+from app.db.models import User
+from app.handlers import messages
+from app.handlers.common import serialize_user
+
+def user(user_id, name):
+    return SimpleNamespace(id=user_id, username=name, display_name=name.title(), avatar_url=None, about="", email=None)
+
+def test_lru_bound_and_write_through():
+    cache = ProfileCache(max_entries=2)
+    cache.put(user(1, "a"))
+    cache.put(user(2, "b"))
+    assert cache._lookup(1) is not None # 1 is now the most recent
+    cache.put(user(3, "c"))
+    assert set(cache.profiles) == {1, 3}
+
+    first = serialize_user(cache.profiles[1], include_status=False)
+    first["token"] = "x" # Callers may extend their copy
+    assert "token" not in serialize_user(cache.profiles[1], include_status=False)
+
+    cache.put(user(1, "renamed"))
+    assert serialize_user(cache.profiles[1], include_status=False)["username"] == "renamed"
+    cache.invalidate(1)
+    assert 1 not in cache.profiles
+
+class RacingDb:
+    """Runs `during` while the SELECT is in flight, then returns the rows read before it."""
+
+    def __init__(self, rows, during):
+        self.rows = rows
+        self.during = during
+
+    async def execute(self, stmt):
+        self.during()
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: self.rows[0], all=lambda: self.rows))
+
+def test_fill_does_not_overwrite_a_concurrent_put():
+    cache = ProfileCache(max_entries=10)
+    db = RacingDb([user(1, "stale")], lambda: cache.put(user(1, "renamed"))) # Profile update lands mid-SELECT
+    assert asyncio.run(cache.get(db, 1)).username == "renamed"
+    assert cache.profiles[1].username == "renamed"
+
+    db = RacingDb([user(2, "stale")], lambda: cache.invalidate(2)) # e.g. a ban
+    assert asyncio.run(cache.get_many(db, [2]))[2].username == "stale" # The caller still gets its row
+    assert 2 not in cache.profiles
+
+    db = RacingDb([user(3, "c")], lambda: None)
+    asyncio.run(cache.get(db, 3))
+    assert cache.profiles[3].username == "c" # No race: filled as usual
+
+def test_send_reuses_cached_sender(memory_db):
+    async def seed(db):
+        db.add_all([User(id=1, username="a"), User(id=2, username="b")])
+
+    async def scenario(queries):
+        session = SimpleNamespace(user_id=1)
+        await messages.send_message(session, {"peer_id": 2, "text": "one"})
+        hits = metrics.counter("profile_cache_hits_total").value
+        before = len(queries)
+        sent = await messages.send_message(session, {"peer_id": 2, "text": "two"})
+        assert sent["message"]["sender"]["username"] == "a"
+        user_queries = [q for q in queries[before:] if q.lstrip().startswith("SELECT") and "FROM users" in q]
+        return user_queries, metrics.counter("profile_cache_hits_total").value - hits
+
+    user_queries, hits = memory_db(seed, scenario)
+    assert user_queries == [] and hits >= 1
+    assert 1 in profile_cache.profiles
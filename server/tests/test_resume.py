@@ -0,0 +1,82 @@
+import asyncio
+import time
+from app.core.resume import ResumeStore, resume_proof, resume_store, verify_resume
+from app.core.session_manager import session_manager
+from app.core.hub import group_topic
+from app.db.models import Group, GroupMember, User
+from app.ws import resume_session
+
+KEY = bytes(range(256))
+
+def test_proof_roundtrip():
+    ts = int(time.time())
+    proof = resume_proof(KEY, "sid", "abcd", ts)
+    assert verify_resume(KEY, "sid", {"nonce": "abcd", "ts": ts, "proof": proof})
+    assert not verify_resume(KEY, "other", {"nonce": "abcd", "ts": ts, "proof": proof})
+    assert not verify_resume(b"x" * 256, "sid", {"nonce": "abcd", "ts": ts, "proof": proof})
+
+def test_stale_proof_rejected():
+    ts = int(time.time()) - 3600
+    proof = resume_proof(KEY, "sid", "abcd", ts)
+    assert not verify_resume(KEY, "sid", {"nonce": "abcd", "ts": ts, "proof": proof})
+
+def test_store_is_bounded_and_expires():
+    store = ResumeStore(max_entries=2, ttl=60)
+    for sid in ("a", "b", "c"):
+        store.put(sid, KEY, user_id=1)
+    assert store.get("a") is None
+    assert store.get("c").user_id == 1
+
+    expired = ResumeStore(max_entries=2, ttl=0)
+    expired.put("a", KEY)
+    time.sleep(0.01)
+    assert expired.get("a") is None
+
+def test_unauthenticated_session_is_not_resumed():
+    # Socket dropped after the DH handshake but before auth.login_token
+    resume_store.put("anon", KEY)
+    ts = int(time.time())
+    resume = {"session_id": "anon", "nonce": "abcd", "ts": ts, "proof": resume_proof(KEY, "anon", "abcd", ts)}
+    session = session_manager.create_session()
+    try:
+        assert not asyncio.run(resume_session(session, resume)) # Client falls back to DH and logs in
+        assert session.auth_key is None and session.user_id is None
+    finally:
+        session_manager.remove_session(session.session_id)
+        resume_store.discard("anon")
+
+def resume_request(sid):
+    ts = int(time.time())
+    return {"session_id": sid, "nonce": "abcd", "ts": ts, "proof": resume_proof(KEY, sid, "abcd", ts)}
+
+def test_resume_rebuilds_subscriptions_and_rejects_banned_users(memory_db):
+    async def seed(db):
+        db.add(User(id=1, username="a"))
+        db.add(Group(id=7, name="joined while away", owner_id=1))
+        await db.flush()
+        db.add(GroupMember(group_id=7, user_id=1))
+
+    async def scenario(queries):
+        resume_store.put("mine", KEY, user_id=1)
+        resume_store.put("banned", KEY, user_id=2) # No such user any more
+        sessions = [session_manager.create_session() for _ in range(2)]
+        try:
+            ok = await resume_session(sessions[0], resume_request("mine"))
+            gone = await resume_session(sessions[1], resume_request("banned"))
+            return ok, group_topic(7) in sessions[0].topics, gone, sessions[1].user_id
+        finally:
+            for session in sessions:
+                session_manager.remove_session(session.session_id)
+
+    ok, subscribed, gone, banned_user = memory_db(seed, scenario)
+    assert ok and subscribed # Topics come from the database, not the closed socket
+    assert not gone and banned_user is None
+
+def test_ban_discards_the_users_resume_entries():
+    store = ResumeStore(max_entries=10, ttl=60)
+    store.put("a", KEY, user_id=1)
+    store.put("b", KEY, user_id=2)
+    store.put("c", KEY, user_id=1)
+    store.discard_user(1)
+    assert store.get("a") is None and store.get("c") is None
+    assert store.get("b").user_id == 2
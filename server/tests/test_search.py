@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+from sqlalchemy import delete, update
+from app.db.fts import fts_query
+from app.db.migrations import FTS_INDEX, migrator
+from app.db.models import Channel, Group, GroupMember, Message, User
+from app.handlers import messages
+
+TEXTS = [
+    "lunch tomorrow?",
+    "see https://example.com/menu",
+    "the quick brown fox",
+    "quick question about lunch",
+    "quickly now",
+    "fox brown the quick",
+]
+
+async def seed(db):
+    db.add_all([User(id=1, username="a"), User(id=2, username="b"), User(id=3, username="c")])
+    for i, content in enumerate(TEXTS, start=1):
+        db.add(Message(id=i, sender_id=1, recipient_id=2, content=content))
+    db.add(Message(id=99, sender_id=3, recipient_id=1, content="quick lunch elsewhere"))
+
+def search(**args):
+    return messages.search(SimpleNamespace(user_id=1), {"peer_id": 2, **args})
+
+def ids(result):
+    return [m["id"] for m in result["messages"]]
+
+def test_fts_query_syntax():
+    assert fts_query('quick "brown fox"') == '"quick"* "brown fox"'
+    assert fts_query('say "hi" --') == '"say"* "hi"'
+
+def test_search_prefix_phrase_and_link(memory_db):
+    async def scenario(queries):
+        return (
+            await search(query="quick"),
+            await search(query='"brown fox"'),
+            await search(filter_type="link"),
+            await search(query="lunch", limit=1),
+        )
+
+    prefix, phrase, links, paged = memory_db(seed, scenario)
+    assert sorted(ids(prefix)) == [3, 4, 5, 6] # Other chats stay out of scope
+    assert ids(phrase) == [3]
+    assert ids(links) == [2]
+    assert len(ids(paged)) == 1 and paged["has_more"] and paged["next_offset"] == 1
+
+def test_index_follows_updates_and_deletes(memory_db):
+    async def scenario(queries):
+        async with messages.AsyncSessionLocal() as db:
+            await db.execute(update(Message).where(Message.id == 1).values(content="dinner tomorrow"))
+            await db.execute(delete(Message).where(Message.id == 4))
+            await db.commit()
+        return await search(query="lunch"), await search(query="dinner")
+
+    lunch, dinner = memory_db(seed, scenario)
+    assert ids(lunch) == [] and ids(dinner) == [1]
+
+def test_search_falls_back_to_like_until_the_index_is_built(memory_db, monkeypatch):
+    async def scenario(queries):
+        monkeypatch.setattr(migrator, "completed", migrator.completed - {FTS_INDEX}) # Online build still running
+        before = len(queries)
+        result = await search(query="quick")
+        return result, queries[before:]
+
+    result, statements = memory_db(seed, scenario)
+    assert sorted(ids(result)) == [3, 4, 5, 6]
+    assert not any("messages_fts" in s for s in statements)
+
+async def seed_global(db):
+    await seed(db)
+    db.add_all([Group(id=1, name="team", owner_id=1), Group(id=2, name="strangers", owner_id=3)])
+    await db.flush() # Foreign keys are enforced: parents first
+    db.add_all([GroupMember(group_id=1, user_id=1), GroupMember(group_id=2, user_id=3)])
+    db.add_all([Channel(id=10, group_id=1, name="general"), Channel(id=20, group_id=2, name="general")])
+    await db.flush()
+    db.add(Message(id=100, sender_id=3, channel_id=10, content="quick sync at lunch"))
+    db.add(Message(id=200, sender_id=3, channel_id=20, content="quick secret lunch"))
+    db.add(Message(id=300, sender_id=3, recipient_id=1, content="quick hidden", deleted_by_recipient=True))
+
+def test_global_search_groups_by_chat(memory_db):
+    async def scenario(queries):
+        before = len(queries)
+        result = await messages.search(SimpleNamespace(user_id=1), {"scope": "global", "query": "quick", "per_chat_limit": 2})
+        return result, len(queries) - before
+
+    result, query_count = memory_db(seed_global, scenario)
+    chats = {g.get("channel_id") or ("peer", g["peer_id"]): g for g in result["groups"]}
+    assert set(chats) == {("peer", 2), ("peer", 3), 10} # Not channel 20 (not a member), not the hidden DM
+    assert len(chats[("peer", 2)]["messages"]) == 2 and chats[("peer", 2)]["has_more"]
+    assert chats[("peer", 2)]["next_offset"] == 2
+    assert [m["id"] for m in chats[("peer", 3)]["messages"]] == [99]
+    assert chats[10]["group_name"] == "team" and not chats[10]["has_more"]
+    assert query_count <= 3 # Hits + users + channels, regardless of chat count
+
+def test_global_search_pages_chats(memory_db):
+    async def scenario(queries):
+        session = SimpleNamespace(user_id=1)
+        first = await messages.search(session, {"scope": "global", "query": "quick", "limit": 2})
+        rest = await messages.search(session, {"scope": "global", "query": "quick", "limit": 2, "offset": first["next_offset"]})
+        return first, rest
+
+    first, rest = memory_db(seed_global, scenario)
+    assert len(first["groups"]) == 2 and first["has_more"]
+    assert len(rest["groups"]) == 1 and not rest["has_more"]
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+from sqlalchemy import func
+from sqlalchemy.future import select
+from app.db.models import Channel, Dialog, Group, Message, User
+from app.handlers import messages
+
+async def seed(db):
+    db.add_all([User(id=1, username="a"), User(id=2, username="b"), Group(id=1, name="g", owner_id=1)])
+    await db.flush() # The channel references the group
+    db.add(Channel(id=10, group_id=1, name="general"))
+
+def send(user_id, peer_id, text):
+    return messages.send_message(SimpleNamespace(user_id=user_id), {"peer_id": peer_id, "text": text})
+
+def test_dm_send_is_one_insert_and_one_upsert(memory_db):
+    async def scenario(queries):
+        await send(1, 2, "warm up") # Loads the sender profile into the cache
+        before = len(queries)
+        result = await send(1, 2, "hi")
+        return result, queries[before:]
+
+    result, statements = memory_db(seed, scenario)
+    assert result["message"]["content"] == "hi" and result["peer_id"] == 2
+    assert [s.split()[0:3] for s in statements] == [["INSERT", "INTO", "messages"], ["INSERT", "INTO", "dialogs"]]
+    assert "ON CONFLICT" in statements[1]
+
+def test_cold_and_channel_sends_read_only_what_is_not_cached(memory_db):
+    async def scenario(queries):
+        await send(1, 2, "cold cache")
+        cold = list(queries)
+        before = len(queries)
+        await messages.send_message(SimpleNamespace(user_id=1), {"channel_id": 10, "text": "first"})
+        first = queries[before:]
+        before = len(queries)
+        result = await messages.send_message(SimpleNamespace(user_id=1), {"channel_id": "10", "text": "second"})
+        return cold, first, queries[before:], result
+
+    cold, first, warm, result = memory_db(seed, scenario)
+    assert [s.split()[0] for s in cold] == ["SELECT", "INSERT", "INSERT"] # Profile, message, dialogs
+    assert len(first) == 2 and "FROM channels" in first[0] # channel -> group, once
+    assert [s.split()[0:3] for s in warm] == [["INSERT", "INTO", "messages"]]
+    assert result["channel_id"] == 10 and result["message"]["content"] == "second"
+
+def test_forward_is_one_insert_and_one_upsert(memory_db):
+    async def scenario(queries):
+        ids = [(await send(2, 1, f"original {i}"))["message"]["id"] for i in range(3)]
+        before = len(queries)
+        result = await messages.forward_messages(SimpleNamespace(user_id=1), {"message_ids": ids, "peer_id": 2})
+        statements = queries[before:]
+        async with messages.AsyncSessionLocal() as db:
+            dialog = (await db.execute(select(Dialog).where(Dialog.user_id == 2, Dialog.peer_id == 1))).scalar_one()
+            last_id = (await db.execute(select(func.max(Message.id)))).scalar_one()
+        return result, statements, dialog.unread_count, dialog.last_message_id, last_id
+
+    result, statements, unread, last_message_id, last_id = memory_db(seed, scenario)
+    assert result == {"type": "messages.forward_done", "count": 3}
+    assert [s.split()[0:3] for s in statements[-2:]] == [["INSERT", "INTO", "messages"], ["INSERT", "INTO", "dialogs"]]
+    assert len([s for s in statements if s.startswith("INSERT")]) == 2
+    assert unread == 3 and last_message_id == last_id
+
+def test_dialog_upserts_count_unread(memory_db):
+    async def scenario(queries):
+        await send(1, 2, "one")
+        await send(1, 2, "two")
+        last = await send(2, 1, "three")
+        await send(1, 1, "note to self")
+        async with messages.AsyncSessionLocal() as db:
+            dialogs = (await db.execute(select(Dialog))).scalars().all()
+            keys = (await db.execute(select(Message.conversation_key).order_by(Message.id))).scalars().all()
+        return last["message"]["id"], {(d.user_id, d.peer_id): d for d in dialogs}, keys
+
+    last_id, dialogs, keys = memory_db(seed, scenario)
+    assert set(dialogs) == {(1, 2), (2, 1), (1, 1)}
+    assert dialogs[(2, 1)].unread_count == 2 and dialogs[(1, 2)].unread_count == 1
+    assert dialogs[(1, 2)].last_message_id == dialogs[(2, 1)].last_message_id == last_id
+    assert dialogs[(1, 1)].unread_count == 1
+    assert len(set(keys[:3])) == 1 # Both directions share the conversation key
+
+def test_string_ids_are_parsed(memory_db):
+    # Clients send ids as strings; PostgreSQL (asyncpg) rejects them as integer parameters
+    async def scenario(queries):
+        first = await send(1, 2, "one")
+        reply = await messages.send_message(SimpleNamespace(user_id=1), {"peer_id": "2", "text": "two", "reply_to_msg_id": str(first["message"]["id"])})
+        deleted = await messages.delete_messages(SimpleNamespace(user_id=1), {"message_ids": [str(first["message"]["id"])], "delete_for_all": True})
+        return first["message"]["id"], reply["message"]["reply_to_msg_id"], deleted
+
+    first_id, reply_to, deleted = memory_db(seed, scenario)
+    assert reply_to == first_id
+    assert deleted["ids"] == [first_id]
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+from sqlalchemy.future import select
+from app.core.config import settings
+from app.db import writes
+from app.db.models import Dialog, Message, User
+from app.handlers import messages
+
+async def seed(db):
+    db.add_all([User(id=1, username="a"), User(id=2, username="b"), User(id=3, username="c")])
+
+def send(user_id, peer_id, text):
+    return messages.send_message(SimpleNamespace(user_id=user_id), {"peer_id": peer_id, "text": text})
+
+def test_concurrent_sends_share_one_commit(memory_db, monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_BATCHING", True)
+
+    async def scenario(queries):
+        monkeypatch.setattr(writes, "message_batcher", writes.WriteBatcher(max_size=100, max_delay_ms=20))
+        await send(1, 2, "warm up") # Loads the sender profiles into the cache
+        await send(2, 1, "warm up")
+        await send(3, 1, "warm up")
+        before = len(queries)
+        results = await asyncio.gather(send(1, 2, "one"), send(1, 2, "two"), send(2, 1, "three"), send(3, 1, "four"))
+        statements = queries[before:]
+        async with messages.AsyncSessionLocal() as db:
+            stored = (await db.execute(select(Message.id, Message.content).order_by(Message.id))).all()
+            dialogs = (await db.execute(select(Dialog))).scalars().all()
+        return results, statements, stored, {(d.user_id, d.peer_id): d for d in dialogs}
+
+    results, statements, stored, dialogs = memory_db(seed, scenario)
+    # One INSERT for the four messages, one upsert for the dialogs they touch
+    assert [s.split()[0:3] for s in statements] == [["INSERT", "INTO", "messages"], ["INSERT", "INTO", "dialogs"]]
+    ids = [r["message"]["id"] for r in results]
+    assert [content for _, content in stored[3:]] == ["one", "two", "three", "four"]
+    assert ids == [msg_id for msg_id, _ in stored[3:]] # Each sender got its own message's id
+    assert dialogs[(2, 1)].unread_count == 3 and dialogs[(2, 1)].last_message_id == ids[2]
+    assert dialogs[(1, 2)].unread_count == 2 and dialogs[(1, 2)].last_message_id == ids[2]
+    assert dialogs[(1, 3)].unread_count == 2 and dialogs[(1, 3)].last_message_id == ids[3]
+
+def test_failed_row_does_not_fail_the_batch(memory_db):
+    async def scenario(queries):
+        batcher = writes.WriteBatcher(max_size=100, max_delay_ms=20)
+        row = {"sender_id": 1, "recipient_id": 2, "content": "ok", "msg_type": "text", "created_at": 1.0}
+        bad = dict(row, channel_id=99) # No such channel: violates a foreign key
+        results = await asyncio.gather(batcher.submit(row), batcher.submit(bad), batcher.submit(row), return_exceptions=True)
+        await batcher.stop()
+        async with messages.AsyncSessionLocal() as db:
+            count = len((await db.execute(select(Message.id))).all())
+        return results, count
+
+    results, count = memory_db(seed, scenario)
+    assert isinstance(results[0], int) and isinstance(results[2], int)
+    assert isinstance(results[1], Exception)
+    assert count == 2